@@ -1,29 +1,42 @@
-from snorkel.lf_helpers import (
+from collections import OrderedDict
+import numpy as np
+import random
+import re
+import pathlib
+import sys
+import pandas as pd
+import nltk
+from nltk.stem import WordNetLemmatizer
+from nltk.tokenize import word_tokenize
+from nltk.corpus import stopwords
+
+# The label functions share one cached context per candidate (see utils/lf_utils)
+sys.path.append(str(pathlib.Path(__file__).joinpath('../../../../../modules').resolve()))
+from utils.lf_utils.candidate_context import (
+    bicluster_mask,
     get_left_tokens,
     get_right_tokens,
     get_between_tokens,
     get_tagged_text,
     get_text_between,
     is_inverted,
+    found_keywords,
     rule_regex_search_tagged_text,
     rule_regex_search_btw_AB,
     rule_regex_search_btw_BA,
     rule_regex_search_before_A,
     rule_regex_search_before_B,
 )
-from collections import OrderedDict
-import numpy as np
-import random
-import re
-import pathlib
-import pandas as pd
-import nltk
-from nltk.stem import WordNetLemmatizer
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
+from utils.lf_utils.bicluster_index import BiclusterIndex, theme_bit
+from utils.lf_utils.keyword_scanner import KeywordScanner, KeywordSet
+from utils.lf_utils.kb_index import KnowledgeBaseIndex
+from utils.lf_utils.lf_resources import LFResource
+from utils.lf_utils.mention_cache import MentionCache, resolve_disease_mention
+from utils.lf_utils.sentence_features import sentence_level
+from utils.lf_utils.substring_index import SubstringIndex
 
 random.seed(100)
-stop_word_list = stopwords.words('english')
+stop_word_list = LFResource("nltk_stopwords_english", lambda: stopwords.words('english'), sources=["nltk stopwords english"])
 
 """
 Debugging to understand how LFs work
@@ -69,16 +82,45 @@ def ltp(tokens):
 """
 DISTANT SUPERVISION
 """
-path = pathlib.Path(__file__).joinpath('../../../datafile/results/compound_treats_disease.tsv.xz').resolve()
-pair_df = pd.read_table(path, dtype={"sources": str})
-knowledge_base = set()
-for row in pair_df.itertuples():
-    if not row.sources or pd.isnull(row.sources):
-        continue
-    for source in row.sources.split('|'):
-        source = re.sub(r' \(\w+\)', '', source)
-        key = row.drugbank_id, row.doid_id, source
-        knowledge_base.add(key)
+kb_paths = [
+    pathlib.Path(__file__).joinpath('../../../datafile/results/compound_treats_disease.tsv.xz').resolve(),
+]
+
+def load_knowledge_base():
+    triples = []
+    pair_df = pd.read_table(kb_paths[0], dtype={"sources": str})
+    for row in pair_df.itertuples():
+        if not row.sources or pd.isnull(row.sources):
+            continue
+        for source in row.sources.split('|'):
+            source = re.sub(r' \(\w+\)', '', source)
+            key = row.drugbank_id, row.doid_id, source
+            triples.append(key)
+    return KnowledgeBaseIndex(triples)
+
+knowledge_base = LFResource("compound_disease_knowledge_base", load_knowledge_base, sources=kb_paths, version=3, store=KnowledgeBaseIndex)
+
+CtD_sources = ["pharmacotherapydb"]
+
+# (sources, label if found, label if not found) of every distant supervision label function
+hetnet_columns = OrderedDict([
+    ("LF_HETNET_PHARMACOTHERAPYDB", (["pharmacotherapydb"], 1, 0)),
+    ("LF_HETNET_CD_ABSENT", (CtD_sources, 0, -1)),
+])
+
+
+def label_hetnet_block(compound_cids, disease_cids, lf_names=None):
+    """
+    Run the distant supervision label functions on whole arrays of candidates at once
+
+    compound_cids - an array of the candidates' Compound_cid values
+    disease_cids - an array of the candidates' Disease_cid values in the same order
+    lf_names - the label functions to run (defaults to every one in hetnet_columns)
+
+    returns a (candidates x label functions) numpy matrix
+    """
+    lf_names = list(hetnet_columns) if lf_names is None else lf_names
+    return knowledge_base.label_block(compound_cids, disease_cids, [hetnet_columns[name] for name in lf_names])
 
 def LF_HETNET_PHARMACOTHERAPYDB(c):
     return 1 if (c.Compound_cid, c.Disease_cid, "pharmacotherapydb") in knowledge_base else 0
@@ -88,12 +130,22 @@ def LF_HETNET_CD_ABSENT(c):
     This label function fires -1 if the given Disease Gene pair does not appear 
     in the databases above.
     """
-    return 0 if any([
-        LF_HETNET_PHARMACOTHERAPYDB(c)
-    ]) else -1
+    return 0 if knowledge_base.has_any(c.Compound_cid, c.Disease_cid, CtD_sources) else -1
+
 
+disease_ontology_url = "https://raw.githubusercontent.com/dhimmel/disease-ontology/052ffcc960f5897a0575f5feff904ca84b7d2c1d/data/slim-terms-prop.tsv"
 
-disease_normalization_df = pd.read_table("https://raw.githubusercontent.com/dhimmel/disease-ontology/052ffcc960f5897a0575f5feff904ca84b7d2c1d/data/slim-terms-prop.tsv")
+def load_disease_names():
+    disease_normalization_df = pd.read_table(disease_ontology_url)
+    return SubstringIndex(disease_normalization_df["subsumed_name"], disease_normalization_df["slim_id"])
+
+disease_names = LFResource("disease_ontology_name_index", load_disease_names, sources=[disease_ontology_url])
+# Shared with the other label function modules, every disease span is resolved once
+disease_mentions = MentionCache(
+    "disease_mentions",
+    lambda span_text: resolve_disease_mention(span_text, set(stop_word_list), disease_names),
+    sources=[disease_ontology_url, "nltk stopwords english"]
+)
 wordnet_lemmatizer = WordNetLemmatizer()
 
 def LF_CD_CHECK_DISEASE_TAG(c):
@@ -103,41 +155,18 @@ def LF_CD_CHECK_DISEASE_TAG(c):
     c- the candidate object to be passed in.
     """
     sen = c[1].get_parent()
-    disease_name = re.sub("\) ?", "", c[1].get_span())
-    disease_name = re.sub(r"(\w)-(\w)", r"\g<1> \g<2>", disease_name)
-    disease_name = " ".join([word for word in word_tokenize(disease_name) if word not in set(stop_word_list)])
+    disease_name, slim_id = disease_mentions.get(c[1].get_span())
 
     # If abbreviation skip since no means of easy resolution
     if len(disease_name) <=5 and disease_name.isupper():
         return 0
 
     disease_id = sen.entity_cids[c[1].get_word_start()]
-    result = disease_normalization_df[
-        disease_normalization_df["subsumed_name"].str.contains(disease_name.lower(), regex=False)
-    ]
-    # If no match then return -1
-    if result.empty:
-
-        # check the reverse direction e.g. carcinoma lung -> lung carcinoma
-        disease_name_tokens = word_tokenize(disease_name)
-        if len(disease_name_tokens) == 2:
-            result = disease_normalization_df[
-                disease_normalization_df["subsumed_name"].str.contains(" ".join(disease_name_tokens[-1::0-1]).lower(), regex=False)
-            ]
-            
-            # if reversing doesn't work then output -t
-            if not result.empty:
-                slim_id = result['slim_id'].values[0]
-                if slim_id == disease_id:
-                    return 0
-        return -1
+    # If it can be normalized (as is or reversed) return 0 else -1
+    if slim_id == disease_id:
+        return 0
     else:
-        # If it can be normalized return 0 else -1
-        slim_id = result['slim_id'].values[0]
-        if slim_id == disease_id:
-            return 0
-        else:
-            return -1
+        return -1
 
 """
 SENTENCE PATTERN MATCHING
@@ -188,22 +217,35 @@ trial_indications = {
     "double-blind", "placebo", "trial(s)?", "randomized"
 }
 
+"""
+Every keyword set is compiled once into a scanner for the text it gets searched in.
+Scans are cached on the candidate context, so the label functions below share them.
+"""
+window_keywords = KeywordScanner([
+    KeywordSet("treat", treat_indication),
+    KeywordSet("incorrect_depression", incorrect_depression_indication),
+    KeywordSet("weak_treatment", weak_treatment_indications),
+    KeywordSet("incorrect_compound", incorrect_compound_indications),
+    KeywordSet("palliates", palliates_indication),
+    KeywordSet("compound", compound_indications),
+])
+
 
 def LF_CtD_TREATS(c):
-    if re.search(ltp(treat_indication), get_text_between(c), flags=re.I):
+    if "treat" in found_keywords(c, window_keywords, get_text_between(c)):
         return 1
-    elif re.search(ltp(treat_indication), " ".join(get_left_tokens(c[0], window=5)), flags=re.I):
+    elif "treat" in found_keywords(c, window_keywords, " ".join(get_left_tokens(c[0], window=5))):
         return 1
-    elif re.search(ltp(treat_indication), " ".join(get_right_tokens(c[0], window=5)), flags=re.I):
+    elif "treat" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[0], window=5))):
         return 1
     else:
         return 0
 
 def LF_CD_CHECK_DEPRESSION_USAGE(c):
     if "depress" in c[1].get_span():
-        if re.search(ltp(incorrect_depression_indication), " ".join(get_left_tokens(c[0], window=5)), flags=re.I):
+        if "incorrect_depression" in found_keywords(c, window_keywords, " ".join(get_left_tokens(c[0], window=5))):
             return -1
-        elif re.search(ltp(incorrect_depression_indication), " ".join(get_right_tokens(c[0], window=5)), flags=re.I):
+        elif "incorrect_depression" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[0], window=5))):
             return -1    
     return 0
 
@@ -212,11 +254,11 @@ def LF_CtD_WEAKLY_TREATS(c):
     This label function is designed to look for phrases
     that have a weak implication towards a compound treating a disease
     """
-    if re.search(ltp(weak_treatment_indications), get_text_between(c), flags=re.I):
+    if "weak_treatment" in found_keywords(c, window_keywords, get_text_between(c)):
         return 1
-    elif re.search(ltp(weak_treatment_indications), " ".join(get_left_tokens(c[0], window=5)), flags=re.I):
+    elif "weak_treatment" in found_keywords(c, window_keywords, " ".join(get_left_tokens(c[0], window=5))):
         return 1
-    elif re.search(ltp(weak_treatment_indications), " ".join(get_right_tokens(c[0], window=5)), flags=re.I):
+    elif "weak_treatment" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[0], window=5))):
         return 1
     else:
         return 0
@@ -226,9 +268,9 @@ def LF_CD_INCORRECT_COMPOUND(c):
     This label function is designed to capture phrases
     that indicate the mentioned compound is a protein not a drug
     """
-    if re.search(ltp(incorrect_compound_indications), " ".join(get_left_tokens(c[0], window=5)), flags=re.I):
+    if "incorrect_compound" in found_keywords(c, window_keywords, " ".join(get_left_tokens(c[0], window=5))):
         return -1
-    elif re.search(ltp(incorrect_compound_indications), " ".join(get_right_tokens(c[0], window=5)), flags=re.I):
+    elif "incorrect_compound" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[0], window=5))):
         return -1
     else:
         return 0
@@ -238,11 +280,11 @@ def LF_CpD_PALLIATES(c):
     This label function is designed to look for phrases
     that could imply a compound binding to a gene/protein
     """
-    if re.search(ltp(palliates_indication), get_text_between(c), flags=re.I):
+    if "palliates" in found_keywords(c, window_keywords, get_text_between(c)):
         return 1
-    elif re.search(ltp(palliates_indication), " ".join(get_left_tokens(c[0], window=5)), flags=re.I):
+    elif "palliates" in found_keywords(c, window_keywords, " ".join(get_left_tokens(c[0], window=5))):
         return 1
-    elif re.search(ltp(palliates_indication), " ".join(get_right_tokens(c[0], window=5)), flags=re.I):
+    elif "palliates" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[0], window=5))):
         return 1
     else:
         return 0
@@ -252,17 +294,17 @@ def LF_CtD_COMPOUND_INDICATION(c):
     This label function is designed to look for phrases
     that implies a compound increaseing activity of a gene/protein
     """
-    if re.search(ltp(compound_indications), get_text_between(c), flags=re.I):
+    if "compound" in found_keywords(c, window_keywords, get_text_between(c)):
         return 1
-    elif re.search(ltp(compound_indications), " ".join(get_left_tokens(c[0], window=5)), flags=re.I):
+    elif "compound" in found_keywords(c, window_keywords, " ".join(get_left_tokens(c[0], window=5))):
         return 1
-    elif re.search(ltp(compound_indications), " ".join(get_right_tokens(c[0], window=5)), flags=re.I):
+    elif "compound" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[0], window=5))):
         return 1
     else:
         return 0
 
 def LF_CtD_TRIAL(c):
-    return 1 if re.search(ltp(trial_indications), get_tagged_text(c), flags=re.I) else 0
+    return 1 if "trial" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)) else 0
 
 def LF_CD_IN_SERIES(c):
     """
@@ -297,12 +339,19 @@ title_indication = {
 
 }
 
+tagged_text_keywords = KeywordScanner([
+    KeywordSet("trial", trial_indications),
+    KeywordSet("method", method_indication),
+    KeywordSet("title_start", title_indication, before=r'^(\[|\[ )?'),
+    KeywordSet("title_end", title_indication, after=r'$'),
+])
+
 def LF_CD_METHOD_DESC(c):
     """
     This label function is designed to look for phrases 
     that imply a sentence is description an experimental design
     """
-    if re.search(ltp(method_indication), get_tagged_text(c), flags=re.I):
+    if "method" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)):
         return -1
     else:
         return 0
@@ -312,9 +361,9 @@ def LF_CD_TITLE(c):
     This label function is designed to look for phrases 
     that imply a sentence is the title
     """
-    if re.search(r'^(\[|\[ )?'+ltp(title_indication), get_tagged_text(c), flags=re.I):
+    if "title_start" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)):
         return -1
-    elif re.search(ltp(title_indication)+r'$', get_tagged_text(c), flags=re.I):
+    elif "title_end" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)):
         return -1
     elif "(author's transl)" in get_tagged_text(c):
         return -1
@@ -378,6 +427,7 @@ def LF_CD_ALLOWED_DISTANCE(c):
         LF_CD_DISTANCE_SHORT(c)
         ]) else 1
 
+@sentence_level
 def LF_CD_NO_VERB(c):
     """
     This label function is designed to fire if a given
@@ -394,93 +444,110 @@ def LF_CD_NO_VERB(c):
 """
 Bi-Clustering LFs
 """
-path = pathlib.Path(__file__).joinpath("../../../../../dependency_cluster/chemical_disease_bicluster_results.tsv.xz").resolve()
-bicluster_dep_df = pd.read_table(path)
-treatment_base = set([tuple(x) for x in bicluster_dep_df.query("T>0")[["pubmed_id", "sentence_num"]].values])
-inhibits_base = set([tuple(x) for x in bicluster_dep_df.query("C>0")[["pubmed_id", "sentence_num"]].values])
-side_effect_base = set([tuple(x) for x in bicluster_dep_df.query("Sa>0")[["pubmed_id", "sentence_num"]].values])
-prevents_base = set([tuple(x) for x in bicluster_dep_df.query("Pr>0")[["pubmed_id", "sentence_num"]].values])
-alleviates_base = set([tuple(x) for x in bicluster_dep_df.query("Pa>0")[["pubmed_id", "sentence_num"]].values])
-disease_role_base = set([tuple(x) for x in bicluster_dep_df.query("J>0")[["pubmed_id", "sentence_num"]].values])
-biomarkers_base = set([tuple(x) for x in bicluster_dep_df.query("Mp>0")[["pubmed_id", "sentence_num"]].values])
-
+bicluster_index = BiclusterIndex()
+treatment_theme = theme_bit("chemical_disease", "T")
+inhibits_theme = theme_bit("chemical_disease", "C")
+side_effect_theme = theme_bit("chemical_disease", "Sa")
+prevents_theme = theme_bit("chemical_disease", "Pr")
+alleviates_theme = theme_bit("chemical_disease", "Pa")
+disease_role_theme = theme_bit("chemical_disease", "J")
+biomarkers_theme = theme_bit("chemical_disease", "Mp")
+
+@sentence_level
 def LF_CD_BICLUSTER_TREATMENT(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in treatment_base:
+    if bicluster_mask(c, bicluster_index) & treatment_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_CD_BICLUSTER_INHIBITS(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in inhibits_base:
+    if bicluster_mask(c, bicluster_index) & inhibits_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_CD_BICLUSTER_SIDE_EFFECT(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in side_effect_base:
+    if bicluster_mask(c, bicluster_index) & side_effect_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_CD_BICLUSTER_PREVENTS(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in prevents_base:
+    if bicluster_mask(c, bicluster_index) & prevents_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_CD_BICLUSTER_ALLEVIATES(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in alleviates_base:
+    if bicluster_mask(c, bicluster_index) & alleviates_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_CD_BICLUSTER_DISEASE_ROLE(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in disease_role_base:
+    if bicluster_mask(c, bicluster_index) & disease_role_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_CD_BICLUSTER_BIOMARKERS(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in biomarkers_base:
+    if bicluster_mask(c, bicluster_index) & biomarkers_theme:
         return 1
     return 0
 
+# The theme of every bicluster label function
+bicluster_columns = OrderedDict([
+    ("LF_CD_BICLUSTER_TREATMENT", treatment_theme),
+    ("LF_CD_BICLUSTER_INHIBITS", inhibits_theme),
+    ("LF_CD_BICLUSTER_SIDE_EFFECT", side_effect_theme),
+    ("LF_CD_BICLUSTER_PREVENTS", prevents_theme),
+    ("LF_CD_BICLUSTER_ALLEVIATES", alleviates_theme),
+    ("LF_CD_BICLUSTER_DISEASE_ROLE", disease_role_theme),
+    ("LF_CD_BICLUSTER_BIOMARKERS", biomarkers_theme),
+])
+
+
+def label_bicluster_block(pubmed_ids, sentence_nums, lf_names=None):
+    """
+    Run the bicluster label functions on whole arrays of candidates at once
+
+    pubmed_ids - an array of the pubmed ids of the candidates' documents (c.get_parent().document.name)
+    sentence_nums - an array of the candidates' sentence positions in the same order (c.get_parent().position)
+    lf_names - the label functions to run (defaults to every one in bicluster_columns)
+
+    returns a (candidates x label functions) numpy matrix
+    """
+    lf_names = list(bicluster_columns) if lf_names is None else lf_names
+    return bicluster_index.label_block(pubmed_ids, sentence_nums, [bicluster_columns[name] for name in lf_names])
+
 """
 RETRUN LFs to Notebook
 """
@@ -1,26 +1,39 @@
-from snorkel.lf_helpers import (
+from collections import OrderedDict
+import numpy as np
+import random
+import re
+import pathlib
+import sys
+import pandas as pd
+import nltk
+from nltk.stem import WordNetLemmatizer
+from nltk.tokenize import word_tokenize
+from nltk.corpus import stopwords
+
+# The label functions share one cached context per candidate (see utils/lf_utils)
+sys.path.append(str(pathlib.Path(__file__).joinpath('../../../../../modules').resolve()))
+from utils.lf_utils.candidate_context import (
+    bicluster_mask,
     get_left_tokens,
     get_right_tokens,
     get_between_tokens,
     get_tagged_text,
     get_text_between,
     is_inverted,
+    found_keywords,
     rule_regex_search_tagged_text,
     rule_regex_search_btw_AB,
     rule_regex_search_btw_BA,
     rule_regex_search_before_A,
     rule_regex_search_before_B,
 )
-from collections import OrderedDict
-import numpy as np
-import random
-import re
-import pathlib
-import pandas as pd
-import nltk
-from nltk.stem import WordNetLemmatizer
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
+from utils.lf_utils.bicluster_index import BiclusterIndex, theme_bit
+from utils.lf_utils.keyword_scanner import KeywordScanner, KeywordSet
+from utils.lf_utils.gene_name_index import GeneNameIndex
+from utils.lf_utils.kb_index import KnowledgeBaseIndex
+from utils.lf_utils.lf_resources import LFResource
+from utils.lf_utils.mention_cache import MentionCache
+from utils.lf_utils.sentence_features import sentence_level
 
 random.seed(100)
 
@@ -68,16 +81,51 @@ def ltp(tokens):
 """
 DISTANT SUPERVISION
 """
-path = pathlib.Path(__file__).joinpath('../../../datafile/results/compound_binds_gene.tsv.xz').resolve()
-pair_df = pd.read_table(path, dtype={"sources": str})
-knowledge_base = set()
-for row in pair_df.itertuples():
-    if not row.sources or pd.isnull(row.sources):
-        continue
-    for source in row.sources.split('|'):
-        source = re.sub(r' \(\w+\)', '', source)
-        key = str(row.entrez_gene_id), row.drugbank_id, source
-        knowledge_base.add(key)
+kb_paths = [
+    pathlib.Path(__file__).joinpath('../../../datafile/results/compound_binds_gene.tsv.xz').resolve(),
+]
+
+def load_knowledge_base():
+    triples = []
+    pair_df = pd.read_table(kb_paths[0], dtype={"sources": str})
+    for row in pair_df.itertuples():
+        if not row.sources or pd.isnull(row.sources):
+            continue
+        for source in row.sources.split('|'):
+            source = re.sub(r' \(\w+\)', '', source)
+            key = str(row.entrez_gene_id), row.drugbank_id, source
+            triples.append(key)
+    return KnowledgeBaseIndex(triples)
+
+knowledge_base = LFResource("compound_gene_knowledge_base", load_knowledge_base, sources=kb_paths, version=3, store=KnowledgeBaseIndex)
+
+CbG_sources = ["DrugBank", "DrugCentral", "ChEMBL", "BindingDB", "PDSP Ki", "US Patent", "PubChem"]
+
+# (sources, label if found, label if not found) of every distant supervision label function
+hetnet_columns = OrderedDict([
+    ("LF_HETNET_DRUGBANK", (["DrugBank"], 1, 0)),
+    ("LF_HETNET_DRUGCENTRAL", (["DrugCentral"], 1, 0)),
+    ("LF_HETNET_ChEMBL", (["ChEMBL"], 1, 0)),
+    ("LF_HETNET_BINDINGDB", (["BindingDB"], 1, 0)),
+    ("LF_HETNET_PDSP_KI", (["PDSP Ki"], 1, 0)),
+    ("LF_HETNET_US_PATENT", (["US Patent"], 1, 0)),
+    ("LF_HETNET_PUBCHEM", (["PubChem"], 1, 0)),
+    ("LF_HETNET_CG_ABSENT", (CbG_sources, 0, -1)),
+])
+
+
+def label_hetnet_block(gene_cids, compound_cids, lf_names=None):
+    """
+    Run the distant supervision label functions on whole arrays of candidates at once
+
+    gene_cids - an array of the candidates' Gene_cid values
+    compound_cids - an array of the candidates' Compound_cid values in the same order
+    lf_names - the label functions to run (defaults to every one in hetnet_columns)
+
+    returns a (candidates x label functions) numpy matrix
+    """
+    lf_names = list(hetnet_columns) if lf_names is None else lf_names
+    return knowledge_base.label_block(gene_cids, compound_cids, [hetnet_columns[name] for name in lf_names])
 
 def LF_HETNET_DRUGBANK(c):
     """
@@ -133,15 +181,7 @@ def LF_HETNET_CG_ABSENT(c):
     This label function fires -1 if the given Disease Gene pair does not appear 
     in the databases above.
     """
-    return 0 if any([
-        LF_HETNET_DRUGBANK(c),
-        LF_HETNET_DRUGCENTRAL(c),
-        LF_HETNET_ChEMBL(c),
-        LF_HETNET_BINDINGDB(c),
-        LF_HETNET_PDSP_KI(c),
-        LF_HETNET_US_PATENT(c),
-        LF_HETNET_PUBCHEM(c)
-    ]) else -1
+    return 0 if knowledge_base.has_any(c.Gene_cid, c.Compound_cid, CbG_sources) else -1
 
 
 # obtained from ftp://ftp.ncbi.nlm.nih.gov/gene/DATA/ (ncbi's ftp server)
@@ -153,7 +193,18 @@ columns = [
     "type_of_gene", "Symbol_from_nomenclature_authority", "Full_name_from_nomenclature_authority",
     "Nomenclature_status", "Other_designations", "Modification_date"
 ]
-gene_desc = pd.read_table("https://github.com/dhimmel/entrez-gene/blob/a7362748a34211e5df6f2d185bb3246279760546/download/Homo_sapiens.gene_info.gz?raw=true", sep="\t", names=columns, compression="gzip", skiprows=1)
+gene_info_url = "https://github.com/dhimmel/entrez-gene/blob/a7362748a34211e5df6f2d185bb3246279760546/download/Homo_sapiens.gene_info.gz?raw=true"
+
+def load_gene_desc():
+    return pd.read_table(gene_info_url, sep="\t", names=columns, compression="gzip", skiprows=1)
+
+# Shared with the other label function modules, the index is built once from the same table
+gene_names = LFResource("gene_name_index", lambda: GeneNameIndex(load_gene_desc()), sources=[gene_info_url])
+gene_mentions = MentionCache(
+    "gene_mentions",
+    lambda key: gene_names.matches(key[0], re.sub("\)", "", key[1].lower())),
+    sources=[gene_info_url]
+)
 
 
 def LF_CG_CHECK_GENE_TAG(c):
@@ -163,19 +214,21 @@ def LF_CG_CHECK_GENE_TAG(c):
     c- the candidate object to be passed in.
     """
     sen = c[1].get_parent()
-    gene_name = re.sub("\)", "", c[1].get_span().lower())
     gene_id = sen.entity_cids[c[1].get_word_start()]
-    gene_entry_df = gene_desc.query("GeneID == @gene_id")
+    return 0 if gene_mentions.get((str(gene_id), c[1].get_span())) else -1
 
-    if gene_entry_df.empty:
-        return -1
 
-    for token in gene_name.split(" "):
-        if gene_entry_df["Symbol"].values[0].lower() == token or token in gene_entry_df["Synonyms"].values[0].lower():
-            return 0
-        elif token in gene_entry_df["description"].values[0].lower():
-            return 0
-    return -1
+def label_gene_tag_block(gene_ids, gene_spans):
+    """
+    Run LF_CG_CHECK_GENE_TAG on whole arrays of candidates at once
+
+    gene_ids - an array of the GeneIDs the gene mentions were tagged with (sen.entity_cids)
+    gene_spans - an array of the gene mention texts in the same order (c[1].get_span())
+
+    returns a numpy array of labels
+    """
+    mention_texts = [re.sub("\)", "", mention.lower()) for mention in gene_spans]
+    return np.where(gene_names.matches_block(gene_ids, mention_texts), 0, -1)
 
 """
 SENTENCE PATTERN MATCHING
@@ -220,17 +273,30 @@ compound_indentifiers = {
     "small molecules", "inhibitor"
 }
 
+"""
+Every keyword set is compiled once into a scanner for the text it gets searched in.
+Scans are cached on the candidate context, so the label functions below share them.
+"""
+window_keywords = KeywordScanner([
+    KeywordSet("binding", binding_indication),
+    KeywordSet("weak_binding", weak_binding_indications),
+    KeywordSet("upregulates", upregulates),
+    KeywordSet("downregulates", downregulates),
+])
+receiver_keywords = KeywordScanner([KeywordSet("gene_receivers", gene_receivers, flags=0)])
+mention_keywords = KeywordScanner([KeywordSet("gene_receivers", gene_receivers)])
+
 
 def LF_CG_BINDING(c):
     """
     This label function is designed to look for phrases
     that imply a compound binding to a gene/protein
     """
-    if re.search(ltp(binding_indication), get_text_between(c), flags=re.I):
+    if "binding" in found_keywords(c, window_keywords, get_text_between(c)):
         return 1
-    elif re.search(ltp(binding_indication), " ".join(get_left_tokens(c[0], window=5)), flags=re.I):
+    elif "binding" in found_keywords(c, window_keywords, " ".join(get_left_tokens(c[0], window=5))):
         return 1
-    elif re.search(ltp(binding_indication), " ".join(get_right_tokens(c[0], window=5)), flags=re.I):
+    elif "binding" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[0], window=5))):
         return 1
     else:
         return 0
@@ -240,7 +306,7 @@ def LF_CG_WEAK_BINDING(c):
     This label function is designed to look for phrases
     that could imply a compound binding to a gene/protein
     """
-    if re.search(ltp(weak_binding_indications), get_text_between(c), flags=re.I):
+    if "weak_binding" in found_keywords(c, window_keywords, get_text_between(c)):
         return 1
     else:
         return 0
@@ -250,7 +316,7 @@ def LF_CG_UPREGULATES(c):
     This label function is designed to look for phrases
     that implies a compound increaseing activity of a gene/protein
     """
-    if re.search(ltp(upregulates), get_text_between(c), flags=re.I):
+    if "upregulates" in found_keywords(c, window_keywords, get_text_between(c)):
         return 1
     elif upregulates.intersection(get_left_tokens(c[1], window=2)):
         return 1
@@ -262,7 +328,7 @@ def LF_CG_DOWNREGULATES(c):
     This label function is designed to look for phrases
     that could implies a compound decreasing the activity of a gene/protein
     """
-    if re.search(ltp(downregulates), get_text_between(c), flags=re.I):
+    if "downregulates" in found_keywords(c, window_keywords, get_text_between(c)):
         return 1
     elif downregulates.intersection(get_right_tokens(c[1], window=2)):
         return 1
@@ -275,9 +341,9 @@ def LF_CG_GENE_RECEIVERS(c):
     that imples a kinases or sort of protein that receives
     a stimulus to function
     """
-    if re.search(ltp(gene_receivers), " ".join(get_right_tokens(c[1], window=4))) or re.search(ltp(gene_receivers), " ".join(get_left_tokens(c[1], window=4))):
+    if "gene_receivers" in found_keywords(c, receiver_keywords, " ".join(get_right_tokens(c[1], window=4))) or "gene_receivers" in found_keywords(c, receiver_keywords, " ".join(get_left_tokens(c[1], window=4))):
         return 1
-    elif re.search(ltp(gene_receivers), c[1].get_span(), flags=re.I):
+    elif "gene_receivers" in found_keywords(c, mention_keywords, c[1].get_span()):
         return 1
     else:
         return 0
@@ -327,6 +393,7 @@ method_indication = {
     "we examine", "we evaluated", "to establish", "were selected", "authors determmined",
     "we investigated", "to assess", "analyses were done", "useful tool for the study of", r"^The effect of",
     }
+method_keywords = KeywordScanner([KeywordSet("method", method_indication)])
 
 
 def LF_CG_METHOD_DESC(c):
@@ -334,7 +401,7 @@ def LF_CG_METHOD_DESC(c):
     This label function is designed to look for phrases 
     that imply a sentence is description an experimental design
     """
-    if re.search(ltp(method_indication), get_tagged_text(c), flags=re.I):
+    if "method" in found_keywords(c, method_keywords, get_tagged_text(c)):
         return -1
     else:
         return 0
@@ -391,6 +458,7 @@ def LF_CG_ALLOWED_DISTANCE(c):
         LF_CG_DISTANCE_SHORT(c)
         ]) else 1 if random.random() < 0.65 else 0
 
+@sentence_level
 def LF_CG_NO_VERB(c):
     """
     This label function is designed to fire if a given
@@ -417,94 +485,110 @@ def LF_CG_PARENTHETICAL_DESC(c):
 """
 Bi-Clustering LFs
 """
-path = pathlib.Path(__file__).joinpath("../../../../../dependency_cluster/chemical_gene_bicluster_results.tsv.xz").resolve()
-bicluster_dep_df = pd.read_table(path)
-
-binds_base = set([tuple(x) for x in bicluster_dep_df.query("B>0")[["pubmed_id", "sentence_num"]].values])
-agonism_base = set([tuple(x) for x in bicluster_dep_df[bicluster_dep_df["A+"] > 0][["pubmed_id", "sentence_num"]].values])
-antagonism_base = set([tuple(x) for x in bicluster_dep_df[bicluster_dep_df["A-"] > 0][["pubmed_id", "sentence_num"]].values])
-inc_expression_base = set([tuple(x) for x in bicluster_dep_df[bicluster_dep_df["E+"] > 0][["pubmed_id", "sentence_num"]].values])
-dec_expression_base = set([tuple(x) for x in bicluster_dep_df[bicluster_dep_df["E-"] > 0][["pubmed_id", "sentence_num"]].values])
-aff_expression_base = set([tuple(x) for x in bicluster_dep_df.query("E>0")[["pubmed_id", "sentence_num"]].values])
-inhibits_base = set([tuple(x) for x in bicluster_dep_df.query("N>0")[["pubmed_id", "sentence_num"]].values])
-
+bicluster_index = BiclusterIndex()
+binds_theme = theme_bit("chemical_gene", "B")
+agonism_theme = theme_bit("chemical_gene", "A+")
+antagonism_theme = theme_bit("chemical_gene", "A-")
+inc_expression_theme = theme_bit("chemical_gene", "E+")
+dec_expression_theme = theme_bit("chemical_gene", "E-")
+aff_expression_theme = theme_bit("chemical_gene", "E")
+inhibits_theme = theme_bit("chemical_gene", "N")
+
+@sentence_level
 def LF_CG_BICLUSTER_BINDS(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in binds_base:
+    if bicluster_mask(c, bicluster_index) & binds_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_CG_BICLUSTER_AGONISM(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in agonism_base:
+    if bicluster_mask(c, bicluster_index) & agonism_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_CG_BICLUSTER_ANTAGONISM(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in antagonism_base:
+    if bicluster_mask(c, bicluster_index) & antagonism_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_CG_BICLUSTER_INC_EXPRESSION(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in inc_expression_base:
+    if bicluster_mask(c, bicluster_index) & inc_expression_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_CG_BICLUSTER_DEC_EXPRESSION(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in dec_expression_base:
+    if bicluster_mask(c, bicluster_index) & dec_expression_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_CG_BICLUSTER_AFF_EXPRESSION(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in aff_expression_base:
+    if bicluster_mask(c, bicluster_index) & aff_expression_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_CG_BICLUSTER_INHIBITS(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in inhibits_base:
+    if bicluster_mask(c, bicluster_index) & inhibits_theme:
         return 1
     return 0
 
+# The theme of every bicluster label function
+bicluster_columns = OrderedDict([
+    ("LF_CG_BICLUSTER_BINDS", binds_theme),
+    ("LF_CG_BICLUSTER_AGONISM", agonism_theme),
+    ("LF_CG_BICLUSTER_ANTAGONISM", antagonism_theme),
+    ("LF_CG_BICLUSTER_INC_EXPRESSION", inc_expression_theme),
+    ("LF_CG_BICLUSTER_DEC_EXPRESSION", dec_expression_theme),
+    ("LF_CG_BICLUSTER_AFF_EXPRESSION", aff_expression_theme),
+    ("LF_CG_BICLUSTER_INHIBITS", inhibits_theme),
+])
+
+
+def label_bicluster_block(pubmed_ids, sentence_nums, lf_names=None):
+    """
+    Run the bicluster label functions on whole arrays of candidates at once
+
+    pubmed_ids - an array of the pubmed ids of the candidates' documents (c.get_parent().document.name)
+    sentence_nums - an array of the candidates' sentence positions in the same order (c.get_parent().position)
+    lf_names - the label functions to run (defaults to every one in bicluster_columns)
+
+    returns a (candidates x label functions) numpy matrix
+    """
+    lf_names = list(bicluster_columns) if lf_names is None else lf_names
+    return bicluster_index.label_block(pubmed_ids, sentence_nums, [bicluster_columns[name] for name in lf_names])
+
 """
 RETRUN LFs to Notebook
 """
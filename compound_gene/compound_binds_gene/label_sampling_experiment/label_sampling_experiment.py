@@ -31,6 +31,7 @@ from sklearn.metrics import (
 )
 from utils.notebook_utils.train_model_helper import get_model_performance, train_model_random_lfs, sample_lfs
 from utils.notebook_utils.dataframe_helper import load_candidate_dataframes
+from utils.notebook_utils.label_matrix_store import open_label_matrix
 
 import plotnine
 import seaborn as sns
@@ -47,8 +48,9 @@ label_destinations = {
     'dev':"../data/label_matricies/dev_sparse_matrix.tsv.xz",
     'test':"../data/label_matricies/test_sparse_matrix.tsv.xz"
 }
+# The tsv files are converted into memory mapped label matrix stores the first time they are opened
 label_matricies = {
-    key:pd.read_csv(label_destinations[key], sep="\t").to_sparse()
+    key:open_label_matrix(label_destinations[key])
     for key in label_destinations
 }
 
@@ -56,17 +58,9 @@ label_matricies = {
 # In[3]:
 
 
-label_matricies['train'] = label_matricies['train'].fillna(-2).to_dense().replace({-1:0, -2:-1})
-label_matricies['dev'] = label_matricies['dev'].fillna(-2).to_dense().replace({-1:0, -2:-1})
-label_matricies['test'] = label_matricies['test'].fillna(-2).to_dense().replace({-1:0, -2:-1})
-
-
-# In[4]:
-
-
-correct_L = label_matricies['train'].drop("candidate_id", axis=1).to_numpy()
-correct_L_dev = label_matricies['dev'].drop("candidate_id", axis=1).to_numpy()
-correct_L_test = label_matricies['test'].drop("candidate_id", axis=1).to_numpy()
+correct_L = label_matricies['train'].to_label_model()
+correct_L_dev = label_matricies['dev'].to_label_model()
+correct_L_test = label_matricies['test'].to_label_model()
 
 
 # In[5]:
@@ -109,7 +103,7 @@ train_grid_results, dev_grid_results, test_grid_results, models = (
 
 (
     pd.DataFrame({key:train_grid_results[key][:,1] for key in train_grid_results})
-    .assign(candidate_id=label_matricies['train'].candidate_id.values)
+    .assign(candidate_id=label_matricies['train'].candidate_ids)
     .to_csv(f"output/CbG/marginals/baseline_sampled.tsv.xz", compression="xz", sep="\t", index=False)
 )
 
@@ -185,7 +179,7 @@ for num_lf in sampled_lfs_dict:
     
     (
         pd.DataFrame({key:train_grid_results[key][:,1] for key in train_grid_results})
-        .assign(candidate_id=label_matricies['train'].candidate_id.values)
+        .assign(candidate_id=label_matricies['train'].candidate_ids)
         .to_csv(f"output/CbG/marginals/{num_lf}_sampled_train.tsv.xz", compression="xz", index=False, sep="\t")
     )
     (
@@ -303,7 +297,7 @@ for num_lf in sampled_lfs_dict:
     
     (
         pd.DataFrame({key:train_grid_results[key][:,1] for key in train_grid_results})
-        .assign(candidate_id=label_matricies['train'].candidate_id.values)
+        .assign(candidate_id=label_matricies['train'].candidate_ids)
         .to_csv(f"output/DaG/marginals/{num_lf}_sampled_train.tsv.xz", compression="xz", index=False, sep="\t")
     )
     (
@@ -421,7 +415,7 @@ for num_lf in sampled_lfs_dict:
     
     (
         pd.DataFrame({key:train_grid_results[key][:,1] for key in train_grid_results})
-        .assign(candidate_id=label_matricies['train'].candidate_id.values)
+        .assign(candidate_id=label_matricies['train'].candidate_ids)
         .to_csv(f"output/CtD/marginals/{num_lf}_sampled_train.tsv.xz", compression="xz", index=False, sep="\t")
     )
     (
@@ -539,7 +533,7 @@ for num_lf in sampled_lfs_dict:
     
     (
         pd.DataFrame({key:train_grid_results[key][:,1] for key in train_grid_results})
-        .assign(candidate_id=label_matricies['train'].candidate_id.values)
+        .assign(candidate_id=label_matricies['train'].candidate_ids)
         .to_csv(f"output/GiG/marginals/{num_lf}_sampled_train.tsv.xz", compression="xz", sep="\t", index=False)
     )
     (
@@ -657,7 +651,7 @@ for num_lf in sampled_lfs_dict:
     
     (
         pd.DataFrame({key:train_grid_results[key][:,1] for key in train_grid_results})
-        .assign(candidate_id=label_matricies['train'].candidate_id.values)
+        .assign(candidate_id=label_matricies['train'].candidate_ids)
         .to_csv(f"output/all/marginals/{num_lf}_sampled_train.tsv.xz", compression="xz", index=False, sep="\t")
     )
     (
@@ -0,0 +1,705 @@
+from collections import OrderedDict, defaultdict
+import io
+import multiprocessing as mp
+import os
+import pickle
+import queue
+import time
+
+from snorkel.models import Document, Sentence, Span
+from snorkel.parser import StanfordCoreNLPServer
+from sqlalchemy import create_engine, PickleType
+
+
+def _array_literal(values):
+    """Convert a python list into a postgres array literal
+
+    Keyword arguments:
+    values - the list to convert
+    """
+    items = []
+    for value in values:
+        if value is None:
+            items.append('NULL')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            items.append(str(value))
+        else:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+            items.append('"{}"'.format(value))
+    return '{' + ','.join(items) + '}'
+
+
+def _csv_field(value):
+    """Write a value as a postgres csv field
+    An unquoted empty field is NULL, while every string is quoted,
+    so empty strings survive the trip.
+
+    Keyword arguments:
+    value - the value returned by _copy_value
+    """
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _copy_value(value, pickled=False):
+    """Convert a python value into a field postgres COPY understands
+
+    Keyword arguments:
+    value - the value to convert
+    pickled - a boolean that signifies the column is a sqlalchemy PickleType
+    """
+    if value is None:
+        return None
+    if pickled:
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    if isinstance(value, bytes):
+        return '\\x' + value.hex()
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (list, tuple)):
+        return _array_literal(value)
+    return value
+
+
+class BulkCopyWriter(object):
+    """Buffers database rows and writes them with postgres COPY
+    Rows are grouped by table and flushed in foreign key order,
+    so parent rows always land before the rows that point to them.
+    Primary keys are handed out from the table sequences ahead of time,
+    which lets child rows reference parents that haven't been written yet.
+    """
+
+    def __init__(self, connection, flush_size=20000, id_block_size=1000, auto_flush=True):
+        """Initialize the BulkCopyWriter class
+
+        Keyword arguments:
+        connection - a raw dbapi (psycopg2) connection
+        flush_size - the number of buffered rows that triggers a flush
+        id_block_size - the number of ids to grab from a sequence at once
+        auto_flush - flush as soon as flush_size rows are buffered
+            (set to False and call is_full to only flush between documents)
+        """
+        self.connection = connection
+        self.flush_size = flush_size
+        self.auto_flush = auto_flush
+        self.id_block_size = id_block_size
+        self.buffers = OrderedDict()
+        self.num_rows = 0
+        self.id_blocks = defaultdict(list)
+
+    def allocate_ids(self, model, num_ids):
+        """Reserve primary keys from the sequence of a model's base table
+
+        Keyword arguments:
+        model - the sqlalchemy model class
+        num_ids - the number of ids to reserve
+
+        Returns:
+        A list of reserved ids
+        """
+        table = model.__mapper__.base_mapper.local_table
+        cursor = self.connection.cursor()
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            (table.name, num_ids)
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return ids
+
+    def next_id(self, model):
+        """Grab the next reserved primary key for a model
+
+        Keyword arguments:
+        model - the sqlalchemy model class
+        """
+        table = model.__mapper__.base_mapper.local_table
+        block = self.id_blocks[table.name]
+        if not block:
+            block.extend(reversed(self.allocate_ids(model, self.id_block_size)))
+        return block.pop()
+
+    def add(self, model, values):
+        """Buffer a row for each table a model is mapped to
+
+        Keyword arguments:
+        model - the sqlalchemy model class
+        values - a dictionary of column keys to values (must contain the id)
+        """
+        mapper = model.__mapper__
+        for table in mapper.tables:
+            if table.name not in self.buffers:
+                self.buffers[table.name] = (table, [])
+
+            row = []
+            for column in table.columns:
+                if mapper.polymorphic_on is not None and column is mapper.polymorphic_on:
+                    value = mapper.polymorphic_identity
+                else:
+                    value = values.get(column.key)
+                row.append(_copy_value(value, pickled=isinstance(column.type, PickleType)))
+
+            self.buffers[table.name][1].append(row)
+            self.num_rows += 1
+
+        if self.auto_flush and self.is_full():
+            self.flush()
+
+    def is_full(self):
+        """Check if enough rows have been buffered to flush"""
+        return self.num_rows >= self.flush_size
+
+    def flush(self):
+        """Write every buffered row to the database and commit"""
+        if self.num_rows == 0:
+            return
+
+        tables = sorted(
+            self.buffers.values(),
+            key=lambda entry: entry[0].metadata.sorted_tables.index(entry[0])
+        )
+
+        cursor = self.connection.cursor()
+        for table, rows in tables:
+            if not rows:
+                continue
+
+            data = io.StringIO()
+            for row in rows:
+                data.write(','.join(_csv_field(value) for value in row))
+                data.write('\n')
+            data.seek(0)
+
+            cursor.copy_expert(
+                "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+                    table.name, ", ".join('"{}"'.format(column.name) for column in table.columns)
+                ),
+                data
+            )
+            del rows[:]
+
+        cursor.close()
+        self.connection.commit()
+        self.num_rows = 0
+
+    def close(self):
+        """Flush the remaining rows and close the connection"""
+        self.flush()
+        self.connection.close()
+
+
+class _IteratorQueue(object):
+    """Queue like wrapper around an iterator
+    Lets a worker function run in the current process,
+    which is needed when the caller is already a daemon process.
+    """
+
+    def __init__(self, items):
+        self.items = iter(items)
+
+    def get(self):
+        return next(self.items, None)
+
+
+def _run_bulk_workers(target, items, parallelism, args):
+    """Fan work out to processes that each own a BulkCopyWriter
+
+    With a parallelism of 1 the work is done in the current process.
+
+    Keyword arguments:
+    target - the worker function
+    items - the items to be processed
+    parallelism - the number of processes to use
+    args - extra arguments for the worker function
+    """
+    if parallelism <= 1:
+        target(_IteratorQueue(items), *args)
+        return
+
+    in_queue = mp.Queue(maxsize=parallelism * 100)
+    workers = [
+        mp.Process(target=target, args=(in_queue,) + args, daemon=True)
+        for worker in range(parallelism)
+    ]
+    for worker in workers:
+        worker.start()
+
+    def put(item):
+        # Don't block forever if a worker died and the queue stopped draining
+        while True:
+            try:
+                in_queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                if any(worker.exitcode not in (None, 0) for worker in workers):
+                    for worker in workers:
+                        worker.terminate()
+                    raise RuntimeError("A bulk worker failed")
+
+    for item in items:
+        put(item)
+
+    # One stop signal per worker
+    for worker in workers:
+        put(None)
+
+    for worker in workers:
+        worker.join()
+
+    failed = [worker.exitcode for worker in workers if worker.exitcode != 0]
+    if failed:
+        raise RuntimeError("{} bulk workers failed with exit codes {}".format(len(failed), failed))
+
+
+def _bulk_parse_worker(in_queue, connection_string, parser, fn, flush_size, counters=None):
+    """Parse documents and write them with COPY
+
+    Rows are only flushed between documents, so every committed
+    document comes with all of its sentences.
+
+    Keyword arguments:
+    in_queue - the queue that holds (Document, text) pairs
+    connection_string - the database url
+    parser - the snorkel parser object
+    fn - the function that is applied to each sentence (i.e. the tagger)
+    flush_size - the number of buffered rows that triggers a flush
+    counters - the StageCounter objects of an IngestionPipeline (optional)
+    """
+    writer = BulkCopyWriter(
+        create_engine(connection_string).raw_connection(),
+        flush_size=flush_size, auto_flush=False
+    )
+    req_handler = parser.connect()
+    pending, pending_chars = 0, 0
+
+    def flush():
+        start = time.time()
+        writer.flush()
+        if counters is not None:
+            counters['write'].add(items=pending, chars=pending_chars, busy=time.time() - start)
+            # the pipeline's queue tracks which documents made it into the database
+            in_queue.committed()
+
+    while True:
+        item = in_queue.get()
+        if item is None:
+            break
+
+        start = time.time()
+        document, text = item
+        document_id = writer.next_id(Document)
+        writer.add(Document, {
+            'id': document_id, 'stable_id': document.stable_id,
+            'name': document.name, 'meta': document.meta
+        })
+
+        for parts in req_handler.parse(document, text):
+            parts = fn(parts) if fn is not None else parts
+            values = dict(parts)
+            values['id'] = writer.next_id(Sentence)
+            values['document_id'] = document_id
+            writer.add(Sentence, values)
+
+        if counters is not None:
+            counters['parse'].add(items=1, chars=len(text), busy=time.time() - start)
+        pending, pending_chars = pending + 1, pending_chars + len(text)
+
+        if writer.is_full():
+            flush()
+            pending, pending_chars = 0, 0
+
+    flush()
+    writer.connection.close()
+
+
+class BulkCorpusParser(object):
+    """Drop in replacement for snorkel's CorpusParser
+    Instead of adding each Document and Sentence to a sqlalchemy session,
+    every worker buffers the rows and writes them with COPY.
+    """
+
+    def __init__(self, parser=None, fn=None, connection_string=None, flush_size=20000):
+        """Initialize the BulkCorpusParser class
+
+        Keyword arguments:
+        parser - the snorkel parser object (defaults to the CoreNLP server)
+        fn - the function that is applied to each sentence (i.e. the tagger)
+        connection_string - the database url (defaults to the SNORKELDB environment variable)
+        flush_size - the number of buffered rows that triggers a flush
+        """
+        self.parser = parser or StanfordCoreNLPServer()
+        self.fn = fn
+        self.connection_string = connection_string or os.environ['SNORKELDB']
+        self.flush_size = flush_size
+
+    def apply(self, xs, parallelism=1, clear=False):
+        """Parse documents into the database
+
+        Keyword arguments:
+        xs - an iterable of (Document, text) pairs
+        parallelism - the number of processes to use
+        clear - kept for compatability with CorpusParser (must be False)
+        """
+        if clear:
+            raise NotImplementedError("BulkCorpusParser only appends to the database.")
+
+        _run_bulk_workers(
+            _bulk_parse_worker, xs, parallelism,
+            (self.connection_string, self.parser, self.fn, self.flush_size)
+        )
+
+    def worker(self, in_queue, counters=None):
+        """Consume documents from an IngestionPipeline queue
+
+        Keyword arguments:
+        in_queue - the queue that holds (Document, text) pairs
+        counters - the StageCounter objects of the pipeline
+        """
+        _bulk_parse_worker(
+            in_queue, self.connection_string, self.parser,
+            self.fn, self.flush_size, counters
+        )
+
+
+def find_entity_spans(words, char_offsets, entity_types, entity_cids, wanted_types, entity_sep='~@~'):
+    """Group tagged tokens into entity spans
+
+    Mirrors the first pass of snorkel's PretaggedCandidateExtractorUDF:
+    consecutive tokens with the same entity type and cid form one span.
+
+    Keyword arguments:
+    words - the words of the sentence
+    char_offsets - the character offset of each word
+    entity_types - the entity type tag of each word
+    entity_cids - the entity cid tag of each word
+    wanted_types - the entity types to keep
+    entity_sep - the separator used for tokens with multiple tags
+
+    Returns:
+    A dictionary of entity type to a list of (char_start, char_end, cid) tuples
+    """
+    entity_idxs = dict((et, OrderedDict()) for et in set(wanted_types))
+    for i in range(len(words)):
+        if entity_types[i] is not None:
+            ets = entity_types[i].split(entity_sep)
+            cids = entity_cids[i].split(entity_sep)
+            for et, cid in zip(ets, cids):
+                if et in entity_idxs:
+                    entity_idxs[et].setdefault(cid, []).append(i)
+
+    entity_spans = defaultdict(list)
+    for et, cid_idxs in entity_idxs.items():
+        for cid, idxs in cid_idxs.items():
+            idxs = list(idxs)
+            while len(idxs) > 0:
+                i = idxs.pop(0)
+                char_start = char_offsets[i]
+                char_end = char_start + len(words[i]) - 1
+                while len(idxs) > 0 and idxs[0] == i + 1:
+                    i = idxs.pop(0)
+                    char_end = char_offsets[i] + len(words[i]) - 1
+                entity_spans[et].append((char_start, char_end, cid))
+
+    return entity_spans
+
+
+def candidate_pairs(entity_spans, entity_types, self_relations=False, nested_relations=False, symmetric_relations=False):
+    """Pair up entity spans the same way snorkel's PretaggedCandidateExtractorUDF does
+
+    Keyword arguments:
+    entity_spans - the output of find_entity_spans
+    entity_types - the two entity types of the relation
+    self_relations - allow a span to be paired with itself
+    nested_relations - allow a span to be paired with a span it contains
+    symmetric_relations - keep both orderings of a pair
+
+    Yields:
+    Pairs of (char_start, char_end, cid) tuples
+    """
+    for ai, a in enumerate(entity_spans[entity_types[0]]):
+        for bi, b in enumerate(entity_spans[entity_types[1]]):
+            a_range, b_range = a[:2], b[:2]
+            if not self_relations and a_range == b_range:
+                continue
+            elif not nested_relations and (
+                (a[0] >= b[0] and a[1] <= b[1]) or (b[0] >= a[0] and b[1] <= a[1])
+            ):
+                continue
+            elif not symmetric_relations and ai > bi:
+                continue
+            yield a, b
+
+
+def sentence_record(sentence):
+    """Pull out the fields candidate extraction needs from a Sentence object
+
+    Keyword arguments:
+    sentence - the snorkel Sentence object
+    """
+    return (
+        sentence.id, sentence.stable_id, sentence.words, sentence.char_offsets,
+        sentence.entity_types, sentence.entity_cids
+    )
+
+
+def load_existing_spans(connection, sentence_ids):
+    """Grab the spans that are already stored for a batch of sentences
+
+    Keyword arguments:
+    connection - a raw dbapi (psycopg2) connection
+    sentence_ids - the sentence ids of the batch
+
+    Returns:
+    A dictionary of (sentence_id, char_start, char_end) to span id
+    """
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT id, sentence_id, char_start, char_end FROM span WHERE sentence_id = ANY(%s)",
+        (list(sentence_ids),)
+    )
+    spans = {(row[1], row[2], row[3]): row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return spans
+
+
+def load_existing_candidates(connection, candidate_class, span_ids):
+    """Grab the candidates that already exist for a set of spans
+
+    Keyword arguments:
+    connection - a raw dbapi (psycopg2) connection
+    candidate_class - the candidate subclass
+    span_ids - the ids of the spans that belong to the batch
+
+    Returns:
+    A set of span id tuples, one for each existing candidate
+    """
+    if not span_ids:
+        return set()
+
+    columns = [arg + '_id' for arg in candidate_class.__argnames__]
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT {} FROM {} WHERE {} = ANY(%s)".format(
+            ", ".join(columns), candidate_class.__tablename__, columns[0]
+        ),
+        (list(span_ids),)
+    )
+    candidates = set(tuple(row) for row in cursor.fetchall())
+    cursor.close()
+    return candidates
+
+
+def span_stable_id(sentence_stable_id, char_start, char_end):
+    """Build the stable id snorkel gives a span (see snorkel.models.context.construct_stable_id)
+    Span offsets are relative to the sentence, while stable ids use offsets into the document.
+
+    Keyword arguments:
+    sentence_stable_id - the stable id of the sentence (i.e. 123::sentence:250:310)
+    char_start - the first character of the span in the sentence
+    char_end - the last character of the span in the sentence
+    """
+    document_name, sentence_offsets = sentence_stable_id.split('::')
+    sentence_start = int(sentence_offsets.split(':')[1])
+    return "{}::span:{}:{}".format(document_name, sentence_start + char_start, sentence_start + char_end)
+
+
+class SpanWriter(object):
+    """Hands out span ids for a batch of sentences
+    Spans that are already in the database are reused,
+    and new spans are buffered into the BulkCopyWriter.
+    """
+
+    def __init__(self, writer, sentence_ids):
+        """Initialize the SpanWriter class
+
+        Keyword arguments:
+        writer - the BulkCopyWriter object
+        sentence_ids - the sentence ids of the batch
+        """
+        self.writer = writer
+        self.spans = load_existing_spans(writer.connection, sentence_ids)
+
+    def get_id(self, sentence_id, sentence_stable_id, char_start, char_end):
+        """Get the id of a span, writing it if it doesn't exist yet
+
+        Keyword arguments:
+        sentence_id - the id of the sentence the span belongs to
+        sentence_stable_id - the stable id of the sentence the span belongs to
+        char_start - the first character of the span
+        char_end - the last character of the span
+        """
+        key = (sentence_id, char_start, char_end)
+        if key not in self.spans:
+            span_id = self.writer.next_id(Span)
+            self.writer.add(Span, {
+                'id': span_id, 'sentence_id': sentence_id,
+                'char_start': char_start, 'char_end': char_end,
+                'stable_id': span_stable_id(sentence_stable_id, char_start, char_end)
+            })
+            self.spans[key] = span_id
+        return self.spans[key]
+
+
+def _bulk_candidate_worker(in_queue, connection_string, relations, entity_sep, flush_size):
+    """Extract candidates from batches of sentences and write them with COPY
+
+    Each sentence is read once: the spans of every entity type the relations
+    need are found and stored together, then every relation pairs them up.
+
+    Keyword arguments:
+    in_queue - the queue that holds (split, list of sentence records) batches
+    connection_string - the database url
+    relations - a list of (candidate class, entity types, options) tuples
+    entity_sep - the separator used for tokens with multiple tags
+    flush_size - the number of buffered rows that triggers a flush
+    """
+    writer = BulkCopyWriter(create_engine(connection_string).raw_connection(), flush_size=flush_size)
+    all_entity_types = set(et for candidate_class, entity_types, options in relations for et in entity_types)
+
+    while True:
+        item = in_queue.get()
+        if item is None:
+            break
+
+        split, records = item
+        span_writer = SpanWriter(writer, [record[0] for record in records])
+        existing = {
+            candidate_class: load_existing_candidates(
+                writer.connection, candidate_class, set(span_writer.spans.values())
+            )
+            for candidate_class, entity_types, options in relations
+        }
+
+        for sentence_id, stable_id, words, char_offsets, tags, cids in records:
+            entity_spans = find_entity_spans(words, char_offsets, tags, cids, all_entity_types, entity_sep)
+
+            # Every entity span is stored, even the ones that don't end up in a candidate
+            for spans in entity_spans.values():
+                for char_start, char_end, cid in spans:
+                    span_writer.get_id(sentence_id, stable_id, char_start, char_end)
+
+            for candidate_class, entity_types, options in relations:
+                for a, b in candidate_pairs(entity_spans, entity_types, **options):
+                    span_ids = (
+                        span_writer.spans[(sentence_id, a[0], a[1])],
+                        span_writer.spans[(sentence_id, b[0], b[1])]
+                    )
+                    if span_ids in existing[candidate_class]:
+                        continue
+                    existing[candidate_class].add(span_ids)
+
+                    values = {'id': writer.next_id(candidate_class), 'split': split}
+                    for arg, span_id, span in zip(candidate_class.__argnames__, span_ids, (a, b)):
+                        values[arg + '_id'] = span_id
+                        values[arg + '_cid'] = span[2]
+                    writer.add(candidate_class, values)
+
+    writer.close()
+
+
+def batch_records(sentences, split, batch_size):
+    """Group sentences into (split, records) batches for the bulk workers
+
+    Keyword arguments:
+    sentences - an iterable of Sentence objects or sentence records
+    split - the split the candidates will be assigned to
+    batch_size - the number of sentences per batch
+    """
+    batch = []
+    for sentence in sentences:
+        batch.append(sentence if isinstance(sentence, tuple) else sentence_record(sentence))
+        if len(batch) >= batch_size:
+            yield split, batch
+            batch = []
+    if batch:
+        yield split, batch
+
+
+class MultiRelationCandidateExtractor(object):
+    """Extracts the candidates of several relations in one pass
+    Replaces running a PretaggedCandidateExtractor per relation over the same sentences.
+    Each sentence's entity tags are scanned once, and the spans and candidates
+    of every relation are written together with COPY.
+    Spans and candidates that already exist are reused instead of duplicated.
+    """
+
+    def __init__(self, relations, entity_sep='~@~', connection_string=None, flush_size=20000, batch_size=1000):
+        """Initialize the MultiRelationCandidateExtractor class
+
+        Keyword arguments:
+        relations - a list of (candidate class, entity types) or (candidate class, entity types, options) tuples,
+            options is a dictionary that can hold self_relations, nested_relations and symmetric_relations
+        entity_sep - the separator used for tokens with multiple tags
+        connection_string - the database url (defaults to the SNORKELDB environment variable)
+        flush_size - the number of buffered rows that triggers a flush
+        batch_size - the number of sentences sent to a worker at once
+        """
+        self.relations = []
+        for relation in relations:
+            candidate_class, entity_types = relation[0], relation[1]
+            options = {
+                'self_relations': False,
+                'nested_relations': False,
+                'symmetric_relations': False
+            }
+            options.update(relation[2] if len(relation) > 2 else {})
+            self.relations.append((candidate_class, entity_types, options))
+
+        self.entity_sep = entity_sep
+        self.connection_string = connection_string or os.environ['SNORKELDB']
+        self.flush_size = flush_size
+        self.batch_size = batch_size
+
+    def apply(self, xs, split=0, parallelism=1, clear=False):
+        """Extract candidates from sentences into the database
+
+        Keyword arguments:
+        xs - an iterable of Sentence objects or sentence records
+        split - the split the candidates will be assigned to
+        parallelism - the number of processes to use, each one handles its own batches of sentences
+        clear - kept for compatability with PretaggedCandidateExtractor (must be False)
+        """
+        if clear:
+            raise NotImplementedError("{} only appends to the database.".format(type(self).__name__))
+
+        _run_bulk_workers(
+            _bulk_candidate_worker, batch_records(xs, split, self.batch_size), parallelism,
+            (self.connection_string, self.relations, self.entity_sep, self.flush_size)
+        )
+
+
+class BulkCandidateExtractor(MultiRelationCandidateExtractor):
+    """Drop in replacement for snorkel's PretaggedCandidateExtractor
+    Produces the same spans and candidates, but writes them with COPY.
+    """
+
+    def __init__(
+        self, candidate_class, entity_types, self_relations=False, nested_relations=False,
+        symmetric_relations=False, entity_sep='~@~', connection_string=None,
+        flush_size=20000, batch_size=1000
+    ):
+        """Initialize the BulkCandidateExtractor class
+
+        Keyword arguments:
+        candidate_class - the candidate subclass
+        entity_types - the two entity types of the relation
+        self_relations - allow a span to be paired with itself
+        nested_relations - allow a span to be paired with a span it contains
+        symmetric_relations - keep both orderings of a pair
+        entity_sep - the separator used for tokens with multiple tags
+        connection_string - the database url (defaults to the SNORKELDB environment variable)
+        flush_size - the number of buffered rows that triggers a flush
+        batch_size - the number of sentences sent to a worker at once
+        """
+        options = {
+            'self_relations': self_relations,
+            'nested_relations': nested_relations,
+            'symmetric_relations': symmetric_relations
+        }
+        MultiRelationCandidateExtractor.__init__(
+            self, [(candidate_class, entity_types, options)], entity_sep=entity_sep,
+            connection_string=connection_string, flush_size=flush_size, batch_size=batch_size
+        )
@@ -1,128 +1,573 @@
-from snorkel.parser import DocPreprocessor
-
-def offsets_to_token(left, right, offset_array, lemmas, punc=set(punctuation)):
-    """Calculate the offset from tag to token
-    Ripped off from the snorkel custom tagger.
-    Designed to get the offset where a given token is found so it can receive a custom entity tag.
-    (i.e. Gene or Chemical)
-    Keyword arguments
-    left - the start of the tag
-    right - the end of the tag
-    offset_array - array of offsets given by stanford corenlp
-    lemmas - array of lemmas given by stanford corenlp
-    punc - a list of punctuation characters
-    """
-    token_start, token_end = None, None
-    for i, c in enumerate(offset_array):
-        if left >= c:
-            token_start = i
-        if c > right and token_end is None:
-            token_end = i
+import hashlib
+import itertools
+import multiprocessing as mp
+import os
+import sys
+import time
+
+import numpy as np
+from snorkel.models import Document, Sentence
+from sqlalchemy import create_engine, func, text
+from sqlalchemy.orm import sessionmaker
+import tqdm
+
+from bulk_insertion import MultiRelationCandidateExtractor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'modules'))
+from utils.ingestion_pipeline import IngestionPipeline, parse_worker
+# The tagging and xml reading code is shared with the other notebooks
+from utils.bigdata_utils import (
+    offsets_to_token, offsets_to_tokens, TagIndex, build_tag_store, Tagger,
+    find_document_shards, ShardReader, XMLMultiDocPreprocessor
+)
+
+
+class IngestionCheckpoint(object):
+    """Keeps track of the ingestion progress
+    Each chunk that has been committed to the database gets a row in the checkpoint table.
+    If a run crashes the next run uses this table to figure out where to start.
+    """
+    def __init__(self, session, stage='parse', table='ingestion_checkpoint'):
+        """Initialize the IngestionCheckpoint class
+        Keyword arguments:
+        session - the sqlalchemy session
+        stage - the name of the pipeline stage being tracked
+        table - the name of the checkpoint table
+        """
+        self.session = session
+        self.stage = stage
+        self.table = table
+        self.session.execute(
+            "CREATE TABLE IF NOT EXISTS {} ("
+            "id serial PRIMARY KEY, "
+            "stage text NOT NULL, "
+            "chunk integer NOT NULL, "
+            "last_document_id integer NOT NULL, "
+            "last_pubmed_id text, "
+            "num_documents integer NOT NULL, "
+            "docs_per_sec double precision, "
+            "resume_offset bigint, "
+            "created_at timestamp DEFAULT now())".format(self.table)
+        )
+        # checkpoint tables from before resume offsets were kept
+        self.session.execute("ALTER TABLE {} ADD COLUMN IF NOT EXISTS resume_offset bigint".format(self.table))
+        self.session.commit()
+
+    def last(self):
+        """Grab the most recent checkpoint of this stage
+        Returns:
+        A dictionary of the checkpoint row or None if nothing has been committed
+        """
+        row = self.session.execute(
+            text(
+                "SELECT chunk, last_document_id, last_pubmed_id, resume_offset FROM {} "
+                "WHERE stage = :stage ORDER BY chunk DESC LIMIT 1".format(self.table)
+            ),
+            {'stage': self.stage}
+        ).fetchone()
+        if row is None:
+            return None
+        return {'chunk': row[0], 'last_document_id': row[1], 'last_pubmed_id': row[2], 'resume_offset': row[3]}
+
+    def record(self, chunk, last_document_id, last_pubmed_id, num_documents, docs_per_sec, resume_offset=None):
+        """Write a checkpoint for a committed chunk
+        Keyword arguments:
+        chunk - the number of the chunk
+        last_document_id - the largest document primary key after the chunk was committed
+        last_pubmed_id - the pubmed id of the last document before which every document read is committed
+        num_documents - the number of documents in the chunk
+        docs_per_sec - the parsing throughput of the chunk
+        resume_offset - the byte position in the xml file a restarted run reads from
+        """
+        self.session.execute(
+            text(
+                "INSERT INTO {} (stage, chunk, last_document_id, last_pubmed_id, num_documents, docs_per_sec, resume_offset) "
+                "VALUES (:stage, :chunk, :last_document_id, :last_pubmed_id, :num_documents, :docs_per_sec, :resume_offset)"
+                .format(self.table)
+            ),
+            {
+                'stage': self.stage, 'chunk': chunk, 'last_document_id': last_document_id,
+                'last_pubmed_id': last_pubmed_id, 'num_documents': num_documents,
+                'docs_per_sec': docs_per_sec, 'resume_offset': resume_offset
+            }
+        )
+        self.session.commit()
+
+    def clear(self):
+        """Remove every checkpoint of this stage"""
+        self.session.execute(text("DELETE FROM {} WHERE stage = :stage".format(self.table)), {'stage': self.stage})
+        self.session.commit()
+
+
+def resume_ingestion(session, xml_parser, checkpoint):
+    """Get the xml parser ready to resume a previous run
+    The xml parser seeks straight to the shard of the first document
+    that wasn't committed at the last checkpoint, so nothing before it is read again.
+    Keyword arguments:
+    session - the sqlalchemy session
+    xml_parser - the XMLMultiDocPreprocessor object
+    checkpoint - the IngestionCheckpoint object
+    Returns:
+    The number of the next checkpoint to record
+    """
+    last = checkpoint.last()
+    xml_parser.start_offset = 0
+    if last is not None and last['resume_offset'] is not None:
+        xml_parser.start_offset = last['resume_offset']
+        print("Resuming from byte {} after pubmed id {}".format(last['resume_offset'], last['last_pubmed_id']))
+    return 0 if last is None else last['chunk'] + 1
+
+
+def skip_stored_documents(session, documents, window, batch_size=500):
+    """Drop the documents past the resume offset that are already in the database
+    These are the documents of a partly committed shard and the ones a crashed run
+    committed after its last checkpoint. Only the documents that were in flight when
+    the run crashed are missing in that stretch, so once more than window documents
+    in a row aren't stored, the rest of the file is new and isn't checked anymore.
+    Keyword arguments:
+    session - the sqlalchemy session
+    documents - an iterable of (Document, text, position) tuples (i.e. xml_parser.generate_with_offsets())
+    window - more than the documents a run can have in flight (queued or uncommitted)
+    batch_size - the number of documents to look up at once
+    Yields:
+    The (Document, text, position) tuples that still need to be parsed
+    """
+    documents = iter(documents)
+    missing_run = 0
+    skipped = 0
+
+    while missing_run <= window:
+        batch = list(itertools.islice(documents, batch_size))
+        if not batch:
             break
-    token_end = len(offset_array) - 1 if token_end is None else token_end
-    token_end = token_end - 1 if lemmas[token_end - 1] in punc else token_end
-    return range(token_start, token_end)
-    
-class Tagger(object):
-    """Custom Tagger Class
-    This is a custom class that is designed to tag each relevant word
-    in a given sentence.
-    i.e if it sees GAD then this tagger will give GAD a Gene tag.
+
+        names = [document.name for document, doc_text, position in batch]
+        stored = set(name for name, in session.query(Document.name).filter(Document.name.in_(names)))
+        for item in batch:
+            if item[0].name in stored:
+                missing_run = 0
+                skipped += 1
+                continue
+            missing_run += 1
+            yield item
+
+    print("Skipped {} documents that were already parsed".format(skipped))
+    for item in documents:
+        yield item
+
+
+def checkpoint_reporter(session, checkpoint, chunk):
+    """Build the on_report function that writes pipeline progress to the checkpoint table
+    Keyword arguments:
+    session - the sqlalchemy session
+    checkpoint - the IngestionCheckpoint object
+    chunk - the number of the first checkpoint to record
+    Returns:
+    A function that takes an IngestionPipeline
+    """
+    progress = {'chunk': chunk, 'parsed': 0, 'time': time.time()}
+
+    def record(pipeline):
+        parsed = pipeline.counters['parse'].snapshot()['items']
+        now = time.time()
+        checkpoint.record(
+            progress['chunk'], session.query(func.max(Document.id)).scalar() or 0,
+            pipeline.last_committed,
+            parsed - progress['parsed'], (parsed - progress['parsed']) / max(now - progress['time'], 1e-6),
+            pipeline.resume_position()
+        )
+        progress.update(chunk=progress['chunk'] + 1, parsed=parsed, time=now)
+
+    return record
+
+
+def ingest_documents(
+    session, corpus_parser, xml_parser, checkpoint, num_workers=5,
+    max_documents=1000, memory_limit=512 * 1024 ** 2, commit_size=1000, report_interval=60,
+    resume_window=None
+):
+    """Stream every document through the parser and pick up where the last run stopped
+    The xml parser fills a bounded queue while the parse workers drain it,
+    so reading and parsing overlap instead of taking turns.
+    Each progress report is also written to the checkpoint table.
+    Keyword arguments:
+    session - the sqlalchemy session
+    corpus_parser - the CorpusParser or BulkCorpusParser object
+    xml_parser - the XMLMultiDocPreprocessor object
+    checkpoint - the IngestionCheckpoint object
+    num_workers - the number of parse processes
+    max_documents - the most documents that can wait in the queue
+    memory_limit - the most characters of document text that can wait in the queue
+    commit_size - the number of documents a CorpusParser worker parses between commits
+    report_interval - the seconds between progress reports
+    resume_window - more than the documents the crashed run could have had in flight
+        (defaults to twice the queue plus what every worker can hold between commits)
+    Returns:
+    A dictionary of the final counter values of each pipeline stage
     """
+    chunk = resume_ingestion(session, xml_parser, checkpoint)
+    documents = xml_parser.generate_with_offsets()
+    if chunk > 0:
+        if resume_window is None:
+            # a bulk worker commits every flush_size rows, which is at most that many documents
+            per_worker = getattr(corpus_parser, 'flush_size', commit_size)
+            resume_window = 2 * (max_documents + num_workers * per_worker)
+        documents = skip_stored_documents(session, documents, resume_window)
 
-    def __init__(self, filter_df):
-        """ Initialize the tagger class
+    pipeline = IngestionPipeline(
+        parse_worker(corpus_parser, commit_size), num_workers=num_workers,
+        max_documents=max_documents, memory_limit=memory_limit,
+        report_interval=report_interval, on_report=checkpoint_reporter(session, checkpoint, chunk)
+    )
+    return pipeline.run(documents)
+
+
+def document_fingerprint(text, tag_index=None, pubmed_id=None):
+    """Hash the text of an abstract together with its tags
+    Keyword arguments:
+    text - the text of the abstract
+    tag_index - the TagIndex that holds the tags (optional)
+    pubmed_id - the pubmed id of the abstract
+    Returns:
+    A signed 64 bit integer that changes whenever the text or the tags change
+    """
+    digest = hashlib.md5(text.encode('utf-8'))
+    if tag_index is not None:
+        for tag in tag_index.lookup(pubmed_id, 0, np.iinfo(np.int32).max):
+            digest.update("{}:{}:{}:{};".format(
+                tag_index.starts[tag], tag_index.ends[tag],
+                tag_index.types[tag_index.type_codes[tag]], tag_index.cids[tag_index.cid_codes[tag]]
+            ).encode('utf-8'))
+    return int.from_bytes(digest.digest()[:8], 'big', signed=True)
+
+
+class DocumentFingerprints(object):
+    """Keeps the fingerprint of every abstract in the database
+    An incremental run compares these against the incoming release
+    to find the abstracts that have changed.
+    """
+    def __init__(self, session, table='document_fingerprint'):
+        """Initialize the DocumentFingerprints class
         Keyword arguments:
-        self -- the class object
-        filter_df -- a pandas group object for quick indexing
+        session - the sqlalchemy session
+        table - the name of the fingerprint table
         """
-        self.annt_df = filter_df
+        self.session = session
+        self.table = table
+        self.session.execute(text(
+            "CREATE TABLE IF NOT EXISTS {} ("
+            "name bigint PRIMARY KEY, "
+            "fingerprint bigint NOT NULL)".format(self.table)
+        ))
+        self.session.commit()
+        self.names = np.empty(0, dtype=np.int64)
+        self.fingerprints = np.empty(0, dtype=np.int64)
+
+    def load(self):
+        """Read every stored fingerprint into sorted arrays"""
+        rows = self.session.execute(text("SELECT name, fingerprint FROM {} ORDER BY name".format(self.table)))
+        table = np.array(rows.fetchall(), dtype=np.int64).reshape(-1, 2)
+        self.names, self.fingerprints = table[:, 0], table[:, 1]
 
-    def tag(self, parts):
-        """Tag each Sentence
+    def get(self, name):
+        """Grab the fingerprint of an abstract
         Keyword arguments:
-        self -- the class object
-        parts -- standford's corenlp object which consists of nlp properties
+        name - the pubmed id of the abstract
         Returns:
-        An updated parts object containing specified custom tags.
+        The fingerprint or None if the abstract has none
         """
+        pos = np.searchsorted(self.names, int(name))
+        if pos < len(self.names) and self.names[pos] == int(name):
+            return int(self.fingerprints[pos])
+        return None
 
-        pubmed_id, _, _, sent_start, sent_end = parts['stable_id'].split(':')
-        sent_start, sent_end = int(sent_start), int(sent_end)
-
-        # For each tag in the given document
-        # assign it to the correct word and move on
-        # if int(pubmed_id) not in self.annt_df['pubmed_id']:
-        #    return parts
-        try:
-            for index, tag in self.annt_df.get_group(int(pubmed_id)).iterrows():
-                if not (sent_start <= int(tag['offset']) <= sent_end):
-                    continue
-
-                offsets = [offset + sent_start for offset in parts['char_offsets']]
-                toks = offsets_to_token(int(tag['offset']), int(tag['end']), offsets, parts['lemmas'])
-                for tok in toks:
-                    parts['entity_types'][tok] = tag['type']
-                    parts['entity_cids'][tok] = tag['identifier']
-
-            return parts
-
-        except KeyError as e:
-            return parts
-        
-class XMLMultiDocPreprocessor(DocPreprocessor):
-    """Hijacked this class to make it memory efficient
-        Fixes the main issue where crashes if GB files are introduced
-        et.iterparse for the win in memory efficiency
-    """
-    def __init__(self, path, doc='.//document', text='./text/text()', id='./id/text()', tag_filter=None):
-        """Initialize the XMLMultiDocPreprocessor Class
-        Keyword Arguments:
-        path - the absolute path of the xml file
-        doc - the xpath notation for document obejcts
-        test - the xpath for grabbing all the text objects
-        id - the xpath for grabbing all the id tags
-        """
-        DocPreprocessor.__init__(self, path)
-        self.doc = doc
-        self.text = text
-        self.id = id
-        self.tag_filter = tag_filter
-
-    def parse_file(self, f, file_name):
-        """This method overrides the original method
+    def record(self, rows):
+        """Write fingerprints, replacing the old value of an abstract
         Keyword arguments:
-        f - the file object to be parsed by lxml
-        file_name - the name of the file used as metadata
-        Yields:
-        A document object in sqlalchemy format and the corresponding text
-        that will be parsed by CoreNLP
+        rows - a list of (pubmed id, fingerprint) pairs
         """
+        if not rows:
+            return
+        self.session.execute(
+            text(
+                "INSERT INTO {} (name, fingerprint) VALUES (:name, :fingerprint) "
+                "ON CONFLICT (name) DO UPDATE SET fingerprint = excluded.fingerprint".format(self.table)
+            ),
+            [{'name': name, 'fingerprint': fingerprint} for name, fingerprint in rows]
+        )
+        self.session.commit()
 
-        for event, doc in et.iterparse(f, tag='document'):
-            doc_id = str(doc.xpath(self.id)[0])
 
-            if int(doc_id) not in self.tag_filter:
-                doc.clear()
-                continue
+def remove_document(session, name):
+    """Delete an abstract with its sentences, spans and candidates
+    The cascades come from the orm, so the candidate classes
+    have to be defined before this is called.
+    Keyword arguments:
+    session - the sqlalchemy session
+    name - the pubmed id of the abstract
+    """
+    for document in session.query(Document).filter(Document.name == str(name)):
+        session.delete(document)
+    session.commit()
 
-            text = '\n'.join(filter(lambda t: t is not None, doc.xpath(self.text)))
 
-            # guarentees that resources are freed after they have been used
-            doc.clear()
-            meta = {'file_name': str(file_name)}
-            stable_id = self.get_stable_id(doc_id)
-            if not(text):
+def delta_documents(session, documents, fingerprints, tag_index=None, stats=None, batch_size=10000):
+    """Filter a release down to the abstracts that are new or have changed
+    Changed abstracts are removed from the database before they are handed on,
+    so they can be parsed again under the same name.
+    Abstracts that were loaded before fingerprints were kept have nothing to
+    compare against, so their current fingerprint becomes the baseline.
+    Keyword arguments:
+    session - the sqlalchemy session
+    documents - an iterable of (Document, text) pairs (i.e. xml_parser.generate())
+    fingerprints - the DocumentFingerprints object
+    tag_index - the TagIndex of the release (optional)
+    stats - a dictionary that counts new, changed, unchanged and baseline abstracts
+    batch_size - the number of fingerprints to write at once
+    Yields:
+    The (Document, text) pairs that need to be parsed
+    """
+    stats = stats if stats is not None else {}
+    for key in ['new', 'changed', 'unchanged', 'baseline']:
+        stats.setdefault(key, 0)
+
+    stored = np.sort(np.fromiter(
+        (int(name) for name, in session.query(Document.name).yield_per(100000)), dtype=np.int64
+    ))
+    fingerprints.load()
+    pending = []
+
+    for document, doc_text in documents:
+        pubmed_id = int(document.name)
+        fingerprint = document_fingerprint(doc_text, tag_index, pubmed_id)
+        pos = np.searchsorted(stored, pubmed_id)
+
+        if pos < len(stored) and stored[pos] == pubmed_id:
+            previous = fingerprints.get(pubmed_id)
+            if previous == fingerprint:
+                stats['unchanged'] += 1
+                continue
+            if previous is None:
+                stats['baseline'] += 1
+                pending.append((pubmed_id, fingerprint))
                 continue
+            remove_document(session, pubmed_id)
+            stats['changed'] += 1
+        else:
+            stats['new'] += 1
 
-            yield Document(name=doc_id, stable_id=stable_id, meta=meta), text
+        # A document that never makes it into the database
+        # counts as new on the next run, whatever its fingerprint says
+        pending.append((pubmed_id, fingerprint))
+        if len(pending) >= batch_size:
+            fingerprints.record(pending)
+            pending = []
+
+        yield document, doc_text
+
+    fingerprints.record(pending)
+
+
+def ingest_delta(
+    session, corpus_parser, xml_parser, checkpoint, tag_index=None, num_workers=5,
+    max_documents=1000, memory_limit=512 * 1024 ** 2, commit_size=1000, report_interval=60
+):
+    """Parse only the abstracts of a new release that are new or have changed
+    Keyword arguments:
+    session - the sqlalchemy session
+    corpus_parser - the CorpusParser or BulkCorpusParser object
+    xml_parser - the XMLMultiDocPreprocessor object of the new release
+    checkpoint - the IngestionCheckpoint object
+    tag_index - the TagIndex of the new release, so tag changes are picked up
+    num_workers - the number of parse processes
+    max_documents - the most documents that can wait in the queue
+    memory_limit - the most characters of document text that can wait in the queue
+    commit_size - the number of documents a CorpusParser worker parses between commits
+    report_interval - the seconds between progress reports
+    Returns:
+    The largest document id before the run. Every abstract parsed by this run has
+    a larger id, which is what split_and_extract needs to only touch the new sentences.
+    """
+    last = checkpoint.last()
+    after_document_id = session.query(func.max(Document.id)).scalar() or -1
+
+    # Every abstract has to be read to see if it changed
+    xml_parser.skip_ids = set()
+    xml_parser.start_offset = 0
+    stats = {}
+    pipeline = IngestionPipeline(
+        parse_worker(corpus_parser, commit_size), num_workers=num_workers,
+        max_documents=max_documents, memory_limit=memory_limit, report_interval=report_interval,
+        on_report=checkpoint_reporter(session, checkpoint, 0 if last is None else last['chunk'] + 1)
+    )
+    pipeline.run(delta_documents(session, xml_parser.generate(), DocumentFingerprints(session), tag_index, stats))
+
+    print("New: {new}, Changed: {changed}, Unchanged: {unchanged}, Baseline: {baseline}".format(**stats))
+    return after_document_id
+
+
+def assign_split(stable_id, probabilities=(0.7, 0.2, 0.1)):
+    """Assign a sentence to a split based on a hash of its stable id
+    The same sentence always lands in the same split, no matter
+    which order the sentences are processed in.
+    Keyword arguments:
+    stable_id - the stable id of the sentence
+    probabilities - the fraction of sentences for train, dev and test
+    Returns:
+    0 for train, 1 for dev and 2 for test
+    """
+    digest = hashlib.md5(stable_id.encode('utf-8')).digest()
+    value = int.from_bytes(digest[:8], 'big') / float(1 << 64)
+    cutoff = 0
+    for split, probability in enumerate(probabilities):
+        cutoff += probability
+        if value < cutoff:
+            return split
+    return len(probabilities) - 1
+
+
+def document_id_ranges(session, range_size=1000, after_document_id=-1):
+    """Walk the document table in primary key order (keyset pagination)
+    Each page starts right after the last key of the previous page,
+    so grabbing a page costs the same at the end of the table as at the start.
+    Keyword arguments:
+    session - the sqlalchemy session
+    range_size - the number of documents in each range
+    after_document_id - only walk the documents with a larger id
+    Yields:
+    (lower, upper) document id ranges, lower is exclusive and upper is inclusive
+    """
+    lower = after_document_id
+    while True:
+        upper = session.execute(
+            text("SELECT id FROM document WHERE id > :lower ORDER BY id OFFSET :offset LIMIT 1"),
+            {'lower': lower, 'offset': int(range_size) - 1}
+        ).scalar()
+
+        if upper is None:
+            upper = session.execute(
+                text("SELECT max(id) FROM document WHERE id > :lower"), {'lower': lower}
+            ).scalar()
+            if upper is not None:
+                yield lower, upper
+            return
+
+        yield lower, upper
+        lower = upper
+
+
+def split_document_range(session, id_range, extractors, probabilities=(0.7, 0.2, 0.1), parallelism=1):
+    """Split the sentences of a document range and extract their candidates
+    Keyword arguments:
+    session - the sqlalchemy session
+    id_range - a (lower, upper) document id range
+    extractors - the candidate extractors to run on each split
+    probabilities - the fraction of sentences for train, dev and test
+    parallelism - the number of processes each extractor uses
+    Returns:
+    The number of sentences that went into each split
+    """
+    lower, upper = id_range
+
+    # The bulk extractors only need a handful of columns
+    as_records = all(isinstance(extractor, MultiRelationCandidateExtractor) for extractor in extractors)
+    if as_records:
+        query = session.query(
+            Sentence.id, Sentence.stable_id, Sentence.words, Sentence.char_offsets,
+            Sentence.entity_types, Sentence.entity_cids
+        )
+    else:
+        query = session.query(Sentence)
+    query = query.filter(Sentence.document_id > lower, Sentence.document_id <= upper)
+
+    split_sens = [[] for probability in probabilities]
+    for sentence in query.yield_per(10000):
+        if as_records:
+            sentence = tuple(sentence)
+            stable_id = sentence[1]
+        else:
+            stable_id = sentence.stable_id
+        split_sens[assign_split(stable_id, probabilities)].append(sentence)
+
+    for extractor in extractors:
+        for split, sens in enumerate(split_sens):
+            if sens:
+                extractor.apply(sens, split=split, parallelism=parallelism, clear=False)
+
+    return [len(sens) for sens in split_sens]
+
+
+_split_worker_state = {}
+
+
+def _init_split_worker(connection_string, extractors, probabilities):
+    """Give each split worker its own database session
+    Keyword arguments:
+    connection_string - the database url
+    extractors - the candidate extractors to run on each split
+    probabilities - the fraction of sentences for train, dev and test
+    """
+    _split_worker_state['session'] = sessionmaker(bind=create_engine(connection_string))()
+    _split_worker_state['extractors'] = extractors
+    _split_worker_state['probabilities'] = probabilities
+
+
+def _split_worker(id_range):
+    """Split a document range inside a worker process
+    Keyword arguments:
+    id_range - a (lower, upper) document id range
+    """
+    counts = split_document_range(
+        _split_worker_state['session'], id_range,
+        _split_worker_state['extractors'], _split_worker_state['probabilities']
+    )
+    _split_worker_state['session'].close()
+    return counts
+
+
+def split_and_extract(
+    session, extractors, range_size=2e5, num_workers=1,
+    probabilities=(0.7, 0.2, 0.1), parallelism=5, connection_string=None, after_document_id=-1
+):
+    """Stream every sentence into train, dev and test and extract candidates
+    Documents are walked in primary key ranges and each sentence is assigned
+    to a split via assign_split, so no global random array is needed.
+    With more than one worker the ranges are processed in parallel, each worker
+    using its own connection. Snorkel's PretaggedCandidateExtractor relies on
+    the notebook's session, so use a single worker with it.
+    Keyword arguments:
+    session - the sqlalchemy session
+    extractors - the candidate extractors to run on each split
+    range_size - the number of documents in each range
+    num_workers - the number of processes that handle document ranges
+    probabilities - the fraction of sentences for train, dev and test
+    parallelism - the number of processes each extractor uses when there is one worker
+    connection_string - the database url (defaults to the SNORKELDB environment variable)
+    after_document_id - only handle documents with a larger id (see ingest_delta)
+    Returns:
+    The number of sentences that went into each split
+    """
+    totals = np.zeros(len(probabilities), dtype=np.int64)
+    id_ranges = document_id_ranges(session, range_size, after_document_id)
+
+    if num_workers <= 1:
+        for id_range in tqdm.tqdm(id_ranges):
+            totals += split_document_range(session, id_range, extractors, probabilities, parallelism)
+        return totals.tolist()
+
+    pool = mp.Pool(
+        num_workers, initializer=_init_split_worker,
+        initargs=(connection_string or os.environ['SNORKELDB'], extractors, probabilities)
+    )
+    try:
+        for counts in tqdm.tqdm(pool.imap_unordered(_split_worker, id_ranges)):
+            totals += counts
+    finally:
+        pool.close()
+        pool.join()
+
+    return totals.tolist()
 
-    def _can_read(self, fpath):
-        """ Straight forward function
-        Keyword Arguments:
-        fpath - the absolute path of the file.
-        """
-        return fpath.endswith('.xml')
 
 def insert_cand_to_db(extractor, sentences):
     for split, sens in enumerate(sentences):
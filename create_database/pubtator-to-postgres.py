@@ -55,6 +55,7 @@ from sqlalchemy import func
 from string import punctuation
 import lxml.etree as et
 from database_insertion import *
+from bulk_insertion import BulkCorpusParser, MultiRelationCandidateExtractor
 
 
 # # Parse the Pubmed Abstracts
@@ -64,13 +65,15 @@ from database_insertion import *
 # In[ ]:
 
 
-filter_df = pd.read_table('https://github.com/greenelab/pubtator/raw/631e86002e11c41cfcfb0043e60b84ab321bdae3/data/pubtator-hetnet-tags.tsv.xz')
+# Convert the tags into a columnar store once,
+# afterwards the store is memory mapped instead of loaded into pandas
+tag_file = 'https://github.com/greenelab/pubtator/raw/631e86002e11c41cfcfb0043e60b84ab321bdae3/data/pubtator-hetnet-tags.tsv.xz'
+tag_store = 'pubtator-hetnet-tags'
 
+if not os.path.exists(tag_store):
+    build_tag_store(tag_file, tag_store)
 
-# In[ ]:
-
-
-grouped = filter_df.groupby('pubmed_id')
+tag_index = TagIndex.load(tag_store)
 
 
 # In[ ]:
@@ -84,36 +87,41 @@ xml_parser = XMLMultiDocPreprocessor(
     path= working_path,
     doc='.//document',
     text='.//passage/text/text()',
-    id='.//id/text()', tag_filter=set(filter_df['pubmed_id']))
+    id='.//id/text()', tag_filter=tag_index,
+    num_workers=4)
 
 
 # In[ ]:
 
 
-dg_tagger = Tagger(grouped)
+dg_tagger = Tagger(tag_index)
 
 
 # In[ ]:
 
 
-corpus_parser = CorpusParser(fn=dg_tagger.tag)
-document_chunk = []
+# The bulk backend writes documents, sentences and candidates with postgres COPY
+# instead of one orm insert per row. Set to False to use snorkel's classes.
+use_bulk_copy = True
 
-for document in tqdm.tqdm(xml_parser.generate()):
-    
-    document_chunk.append(document)
+if use_bulk_copy:
+    corpus_parser = BulkCorpusParser(fn=dg_tagger.tag)
+else:
+    corpus_parser = CorpusParser(fn=dg_tagger.tag)
 
-    # chunk the data because snorkel cannot 
-    # scale properly
-    if len(document_chunk) >= 5e4:
-        corpus_parser.apply(document_chunk, parallelism=5, clear=False)
-        document_chunk = []
-    
-# If generator exhausts and there are still
-# document to parse
-if len(document_chunk) > 0:
-    corpus_parser.apply(data, parallelism=5, clear=False)
-    document_chunk = []
+# Set to True when loading a new pubtator release into an existing database.
+# The release is then parsed further down, once the candidate classes exist.
+incremental = False
+
+# The xml parser streams documents into a bounded queue that the parse workers drain.
+# Workers only commit whole documents, so a crashed run
+# can be restarted by re-running this cell
+parse_checkpoint = IngestionCheckpoint(session, stage='parse')
+if not incremental:
+    ingest_documents(
+        session, corpus_parser, xml_parser, parse_checkpoint, num_workers=5,
+        max_documents=1000, memory_limit=512 * 1024 ** 2
+    )
 
 
 # # Get each candidate relation
@@ -131,77 +139,53 @@ chunk_size = 2e5
 
 #This specifies the type of candidates to extract
 DiseaseGene = candidate_subclass('DiseaseGene', ['Disease', 'Gene'])
-dge = PretaggedCandidateExtractor(DiseaseGene, ['Disease', 'Gene'])
-
 GeneGene = candidate_subclass('GeneGene', ['Gene1', 'Gene2'])
-gge = PretaggedCandidateExtractor(GeneGene, ['Gene', 'Gene'])
-
 CompoundGene = candidate_subclass('CompoundGene', ['Compound', 'Gene'])
-cge = PretaggedCandidateExtractor(CompoundGene, ['Compound', 'Gene'])
-
 CompoundDisease = candidate_subclass('CompoundDisease', ['Compound','Disease'])
-cde = PretaggedCandidateExtractor(CompoundDisease, ['Compound', 'Disease'])
-
-
-# In[ ]:
 
+relations = [
+    (DiseaseGene, ['Disease', 'Gene']),
+    (GeneGene, ['Gene', 'Gene']),
+    (CompoundGene, ['Compound', 'Gene']),
+    (CompoundDisease, ['Compound', 'Disease'])
+]
 
-# set the seed for reproduction
-np.random.seed(100)
-total_sentences = session.execute("select count(*) from sentence").fetchone()[0]
+if use_bulk_copy:
+    # Reads each sentence once and extracts all four relations together
+    extractors = [MultiRelationCandidateExtractor(relations)]
+else:
+    extractors = [
+        PretaggedCandidateExtractor(candidate_class, entity_types)
+        for candidate_class, entity_types in relations
+    ]
 
 
 # In[ ]:
 
 
-category_list = np.random.choice([0,1,2], total_sentences, p=[0.7,0.2,0.1])
+# An incremental run only parses the abstracts that are new or have changed
+# since the last release (by comparing a hash of their text and tags).
+# Changed abstracts lose their old sentences and candidates first.
+after_document_id = -1
+if incremental:
+    after_document_id = ingest_delta(
+        session, corpus_parser, xml_parser, parse_checkpoint, tag_index=tag_index,
+        num_workers=5, max_documents=1000, memory_limit=512 * 1024 ** 2
+    )
 
 
 # In[ ]:
 
 
-# Divide the sentences into train, dev and test sets
-   
-#Grab the sentences!!!
-train_sens = set()
-dev_sens = set()
-test_sens = set()
-
-offset = 0
-category_index = 0
-sql_query = session.query(Document).limit(chunk_size)
-
-#divde and insert into the database
-while True:
-    documents = list(sql_query.offset(offset).all())
-    
-    if not documents:
-        break
-        
-    for doc in tqdm.tqdm(documents): 
-        for s in doc.sentences:
-            
-            # Stratify the data into train, dev, test 
-            category = category_list[category_index]
-            category_index = category_index + 1
-            
-            if category == 0:
-                train_sens.add(s)
-            elif category == 1:
-                dev_sens.add(s)
-            else:
-                test_sens.add(s)
-
-    # insert all the edge types
-    for edges in [dge, gge, cge, cde]:
-        insert_cand_to_db(edges, [train_sens, dev_sens, test_sens])
-        
-    offset = offset + chunk_size
-
-    #Reset for each chunk
-    train_sens = set()
-    dev_sens = set()
-    test_sens = set()
+# Sentences are assigned to train, dev and test via a hash of their stable id,
+# so the split is reproducible and documents can be handled in parallel ranges.
+# After an incremental run only the documents it added are handled.
+split_counts = split_and_extract(
+    session, extractors,
+    range_size=chunk_size, num_workers=5 if use_bulk_copy else 1,
+    after_document_id=after_document_id
+)
+print("Train: {}, Dev: {}, Test: {}".format(*split_counts))
 
 
 # In[ ]:
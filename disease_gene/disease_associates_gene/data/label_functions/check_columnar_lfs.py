@@ -0,0 +1,157 @@
+"""
+Check that the columnar label functions in disease_gene_lfs.py give the same labels as the per candidate ones
+
+The candidates are built in memory from a fixture vocabulary, so no database is needed, and the
+resources the label functions load (knowledge base, bicluster results, gene and disease names) are
+swapped for small fixture tables. Run it from this folder after changing a label function or its
+columnar version:
+
+    python check_columnar_lfs.py
+"""
+import os
+import random
+import re
+import tempfile
+
+# the fixture resources must never end up in the shared resource and mention caches
+os.environ['LF_RESOURCE_CACHE'] = tempfile.mkdtemp()
+
+import numpy as np
+import pandas as pd
+from snorkel.models import Document, Sentence, Span, candidate_subclass
+
+import disease_gene_lfs as dg
+from utils.lf_utils.bicluster_index import BICLUSTER_THEMES, SENTENCE_BITS
+from utils.lf_utils.columnar import CandidateColumns, compare_to_candidates
+from utils.lf_utils.gene_name_index import GeneNameIndex
+from utils.lf_utils.kb_index import KnowledgeBaseIndex
+from utils.lf_utils.lf_resources import LFResource
+from utils.lf_utils.substring_index import SubstringIndex
+
+DiseaseGene = candidate_subclass('DiseaseGene', ['Disease', 'Gene'])
+
+genes = {"1": ["BRCA1", "RNF53", "kinase"], "2": ["TP53", "p53", "protein"]}
+diseases = {"DOID:1612": ["breast", "cancer"], "DOID:3905": ["lung", "carcinoma"], "DOID:1826": ["ALS", "epilepsy"]}
+filler = (
+    "the a gene disease associated with not no , but ; however we used : CONCLUSION: concluded ( ) "
+    "patient patients increased decreased expression mutation in of cells diagnosis title significantly correlated"
+).split()
+keyword_sets = [
+    dg.biomarker_indicators, dg.cellular_activity, dg.direct_association, dg.upregulates, dg.downregulates,
+    dg.disease_sample_indicators, dg.diagnosis_indicators, dg.no_direct_association, dg.weak_association,
+    dg.method_indication, dg.title_indication, dg.genetic_abnormalities, dg.context_change_keywords,
+]
+# plain words out of the keyword patterns, so the keyword label functions fire now and then
+vocabulary = filler + [
+    word for keywords in keyword_sets for keyword in sorted(keywords)[:8]
+    for word in re.sub(r"[\\()?\[\]|+*]", "", keyword).split()
+]
+pos_tags = ["NN"] * 12 + ["VB", "VBG", "VBZ", "JJ", "DT"]
+
+
+def use_fixture_resources():
+    """
+    Swap the resources of disease_gene_lfs for fixture tables
+    """
+    dg.knowledge_base = KnowledgeBaseIndex([
+        ("1", "DOID:1612", "DISEASES"), ("1", "DOID:1612", "DisGeNET"), ("2", "DOID:1612", "DOAF"),
+        ("2", "DOID:3905", "GWAS Catalog"), ("1", "DOID:3905", "strego_up"), ("2", "DOID:1826", "strego_down"),
+    ])
+    dg.gene_names = GeneNameIndex(pd.DataFrame({
+        "GeneID": [1, 2], "Symbol": ["BRCA1", "TP53"], "Synonyms": ["RNF53|BRCC1", "p53|LFS1"],
+        "description": ["BRCA1 DNA repair associated", "tumor protein p53"],
+    }))
+    dg.disease_names = SubstringIndex(["breast cancer", "lung carcinoma", "epilepsy"], list(diseases))
+    dg.stop_word_list = ["the", "a", "of", "with", "in"]
+
+    theme_count = sum(len(themes) for themes in BICLUSTER_THEMES.values())
+    keys = sorted({int(pubmed_id) << SENTENCE_BITS | position for pubmed_id in range(1000, 1004) for position in range(4)})
+    table = np.array([keys, [random.randrange(1 << theme_count) for key in keys]], dtype=np.int64)
+    dg.bicluster_index.table = LFResource("bicluster_index_fixture", lambda: table, sources=["fixture"])
+
+
+def make_sentence(document, position):
+    """
+    Build a sentence with a few gene and disease mentions
+
+    document - the document object the sentence belongs to
+    position - the position of the sentence in the document
+
+    returns a sentence object and the (start, end, cid) word ranges of its gene and disease mentions
+    """
+    words = [random.choice(vocabulary) for _ in range(random.choice([random.randint(4, 10), random.randint(4, 60)]))]
+    entity_types, entity_cids = ["O"] * len(words), ["O"] * len(words)
+    mentions = {"Gene": [], "Disease": []}
+    for entity_type, names in [("Gene", genes), ("Disease", diseases)]:
+        for _ in range(random.randint(1, 2)):
+            cid = random.choice(list(names))
+            start = random.randrange(len(words) - 1)
+            end = start + random.randint(0, 1)
+            words[start:end + 1] = random.sample(names[cid], end - start + 1)
+            entity_types[start:end + 1] = [entity_type] * (end - start + 1)
+            entity_cids[start:end + 1] = [cid] * (end - start + 1)
+            mentions[entity_type].append((start, end, cid))
+
+    char_offsets, offset = [], 0
+    for word in words:
+        char_offsets.append(offset)
+        offset += len(word) + 1
+    # the sentence caches and the export tell sentences apart by id, so the fixtures need one too
+    sentence = Sentence(
+        id=int(document.name) * 100 + position, document=document, position=position, text=" ".join(words), words=words,
+        char_offsets=char_offsets, abs_char_offsets=char_offsets, lemmas=[word.lower() for word in words],
+        pos_tags=[random.choice(pos_tags) for word in words], ner_tags=["O"] * len(words),
+        dep_parents=[0] * len(words), dep_labels=[""] * len(words),
+        entity_types=entity_types, entity_cids=entity_cids,
+        stable_id="{}::sentence:{}".format(document.name, position)
+    )
+    return sentence, mentions
+
+
+def make_span(sentence, start, end):
+    return Span(
+        sentence=sentence, char_start=sentence.char_offsets[start],
+        char_end=sentence.char_offsets[end] + len(sentence.words[end]) - 1
+    )
+
+
+def make_candidates(num_documents=4, sentences_per_document=15):
+    """
+    Build disease gene candidates for every pair of mentions that don't overlap
+    """
+    candidates = []
+    for pubmed_id in range(1000, 1000 + num_documents):
+        document = Document(name=str(pubmed_id), stable_id="{}::document:0:0".format(pubmed_id))
+        for position in range(sentences_per_document):
+            sentence, mentions = make_sentence(document, position)
+            for disease_start, disease_end, disease_cid in mentions["Disease"]:
+                for gene_start, gene_end, gene_cid in mentions["Gene"]:
+                    if sentence.entity_types[disease_start] != "Disease" or sentence.entity_types[gene_start] != "Gene":
+                        continue
+                    if disease_start <= gene_end and gene_start <= disease_end:
+                        continue
+                    candidates.append(DiseaseGene(
+                        id=len(candidates) + 1,
+                        Disease=make_span(sentence, disease_start, disease_end), Disease_cid=disease_cid,
+                        Gene=make_span(sentence, gene_start, gene_end), Gene_cid=gene_cid,
+                    ))
+    return candidates
+
+
+if __name__ == "__main__":
+    random.seed(100)
+    use_fixture_resources()
+    candidates = make_candidates()
+    columns = CandidateColumns.from_candidates(candidates)
+
+    mismatches = 0
+    for relation, lfs in dg.DG_LFS.items():
+        report = compare_to_candidates(columns, lfs, candidates)
+        print("{}: {} of {} label functions ported, {} mismatches over {} candidates".format(
+            relation, len(report), len(lfs), report.mismatches.sum(), len(candidates)
+        ))
+        if report.mismatches.sum() > 0:
+            print(report[report.mismatches > 0].to_string(index=False))
+        mismatches += report.mismatches.sum()
+
+    assert mismatches == 0, "The columnar label functions disagree with the per candidate ones"
@@ -1,29 +1,44 @@
-from snorkel.lf_helpers import (
+from collections import OrderedDict
+import numpy as np
+import random
+import re
+import pathlib
+import sys
+import pandas as pd
+import nltk
+from nltk.stem import WordNetLemmatizer
+from nltk.tokenize import word_tokenize
+from nltk.corpus import stopwords
+
+# The label functions share one cached context per candidate (see utils/lf_utils)
+sys.path.append(str(pathlib.Path(__file__).joinpath('../../../../../modules').resolve()))
+from utils.lf_utils.candidate_context import (
+    bicluster_mask,
     get_left_tokens,
     get_right_tokens,
     get_between_tokens,
     get_tagged_text,
     get_text_between,
     is_inverted,
+    found_keywords,
     rule_regex_search_tagged_text,
     rule_regex_search_btw_AB,
     rule_regex_search_btw_BA,
     rule_regex_search_before_A,
     rule_regex_search_before_B,
 )
-from collections import OrderedDict
-import numpy as np
-import random
-import re
-import pathlib
-import pandas as pd
-import nltk
-from nltk.stem import WordNetLemmatizer
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
+from utils.lf_utils.bicluster_index import BiclusterIndex, theme_bit
+from utils.lf_utils.columnar import columnar, keyword_found
+from utils.lf_utils.keyword_scanner import KeywordScanner, KeywordSet
+from utils.lf_utils.gene_name_index import GeneNameIndex
+from utils.lf_utils.kb_index import KnowledgeBaseIndex
+from utils.lf_utils.lf_resources import LFResource
+from utils.lf_utils.mention_cache import MentionCache, resolve_disease_mention
+from utils.lf_utils.sentence_features import sentence_feature, sentence_level
+from utils.lf_utils.substring_index import SubstringIndex
 
 random.seed(100)
-stop_word_list = stopwords.words('english')
+stop_word_list = LFResource("nltk_stopwords_english", lambda: stopwords.words('english'), sources=["nltk stopwords english"])
 """
 Debugging to understand how LFs work
 """
@@ -68,33 +83,69 @@ def ltp(tokens):
 """
 DISTANT SUPERVISION
 """
-path = pathlib.Path(__file__).joinpath('../../../datafile/results/disease_associates_gene.csv.xz').resolve()
-pair_df = pd.read_csv(path, dtype={"sources": str})
-knowledge_base = set()
-for row in pair_df.itertuples():
-    if not row.sources or pd.isnull(row.sources):
-        continue
-    for source in row.sources.split('|'):
-        key = str(row.entrez_gene_id), row.doid_id, source
-        knowledge_base.add(key)
-        
-path = pathlib.Path(__file__).joinpath('../../../../disease_downregulates_gene/disease_downregulates_gene.tsv.xz').resolve()
-pair_df = pd.read_table(path, dtype={"sources": str})
-for row in pair_df.itertuples():
-    if not row.sources or pd.isnull(row.sources):
-        continue
-    for source in row.sources.split('|'):
-        key = str(row.entrez_gene_id), row.doid_id, source+'_down'
-        knowledge_base.add(key)        
-
-path = pathlib.Path(__file__).joinpath('../../../../disease_upregulates_gene/disease_upregulates_gene.tsv.xz').resolve()
-pair_df = pd.read_table(path, dtype={"sources": str})
-for row in pair_df.itertuples():
-    if not row.sources or pd.isnull(row.sources):
-        continue
-    for source in row.sources.split('|'):
-        key = str(row.entrez_gene_id), row.doid_id, source+'_up'
-        knowledge_base.add(key)
+kb_paths = [
+    pathlib.Path(__file__).joinpath('../../../datafile/results/disease_associates_gene.csv.xz').resolve(),
+    pathlib.Path(__file__).joinpath('../../../../disease_downregulates_gene/disease_downregulates_gene.tsv.xz').resolve(),
+    pathlib.Path(__file__).joinpath('../../../../disease_upregulates_gene/disease_upregulates_gene.tsv.xz').resolve(),
+]
+
+def load_knowledge_base():
+    triples = []
+    pair_df = pd.read_csv(kb_paths[0], dtype={"sources": str})
+    for row in pair_df.itertuples():
+        if not row.sources or pd.isnull(row.sources):
+            continue
+        for source in row.sources.split('|'):
+            key = str(row.entrez_gene_id), row.doid_id, source
+            triples.append(key)
+
+    pair_df = pd.read_table(kb_paths[1], dtype={"sources": str})
+    for row in pair_df.itertuples():
+        if not row.sources or pd.isnull(row.sources):
+            continue
+        for source in row.sources.split('|'):
+            key = str(row.entrez_gene_id), row.doid_id, source+'_down'
+            triples.append(key)        
+
+    pair_df = pd.read_table(kb_paths[2], dtype={"sources": str})
+    for row in pair_df.itertuples():
+        if not row.sources or pd.isnull(row.sources):
+            continue
+        for source in row.sources.split('|'):
+            key = str(row.entrez_gene_id), row.doid_id, source+'_up'
+            triples.append(key)
+    return KnowledgeBaseIndex(triples)
+
+knowledge_base = LFResource("disease_gene_knowledge_base", load_knowledge_base, sources=kb_paths, version=3, store=KnowledgeBaseIndex)
+
+DaG_sources = ["DISEASES", "DOAF", "DisGeNET", "GWAS Catalog"]
+
+# (sources, label if found, label if not found) of every distant supervision label function
+hetnet_columns = OrderedDict([
+    ("LF_HETNET_DISEASES", (["DISEASES"], 1, 0)),
+    ("LF_HETNET_DOAF", (["DOAF"], 1, 0)),
+    ("LF_HETNET_DisGeNET", (["DisGeNET"], 1, 0)),
+    ("LF_HETNET_GWAS", (["GWAS Catalog"], 1, 0)),
+    ("LF_HETNET_STARGEO_UP", (["strego_up"], 1, 0)),
+    ("LF_HETNET_STARGEO_DOWN", (["strego_down"], 1, 0)),
+    ("LF_HETNET_DaG_ABSENT", (DaG_sources, 0, -1)),
+    ("LF_HETNET_DuG_ABSENT", (["strego_up"], 0, -1)),
+    ("LF_HETNET_DdG_ABSENT", (["strego_down"], 0, -1)),
+])
+
+
+def label_hetnet_block(gene_cids, disease_cids, lf_names=None):
+    """
+    Run the distant supervision label functions on whole arrays of candidates at once
+
+    gene_cids - an array of the candidates' Gene_cid values
+    disease_cids - an array of the candidates' Disease_cid values in the same order
+    lf_names - the label functions to run (defaults to every one in hetnet_columns)
+
+    returns a (candidates x label functions) numpy matrix
+    """
+    lf_names = list(hetnet_columns) if lf_names is None else lf_names
+    return knowledge_base.label_block(gene_cids, disease_cids, [hetnet_columns[name] for name in lf_names])
 
 def LF_HETNET_DISEASES(c):
     """
@@ -135,12 +186,7 @@ def LF_HETNET_DaG_ABSENT(c):
     This label function fires -1 if the given Disease Gene pair does not appear 
     in the databases above.
     """
-    return 0 if any([
-        LF_HETNET_DISEASES(c),
-        LF_HETNET_DOAF(c),
-        LF_HETNET_DisGeNET(c),
-        LF_HETNET_GWAS(c)
-    ]) else -1
+    return 0 if knowledge_base.has_any(c.Gene_cid, c.Disease_cid, DaG_sources) else -1
 
 def LF_HETNET_DuG_ABSENT(c):
     """
@@ -165,7 +211,18 @@ columns = [
     "type_of_gene", "Symbol_from_nomenclature_authority", "Full_name_from_nomenclature_authority",
     "Nomenclature_status", "Other_designations", "Modification_date"
 ]
-gene_desc = pd.read_table("https://github.com/dhimmel/entrez-gene/blob/a7362748a34211e5df6f2d185bb3246279760546/download/Homo_sapiens.gene_info.gz?raw=true", sep="\t", names=columns, compression="gzip", skiprows=1)
+gene_info_url = "https://github.com/dhimmel/entrez-gene/blob/a7362748a34211e5df6f2d185bb3246279760546/download/Homo_sapiens.gene_info.gz?raw=true"
+
+def load_gene_desc():
+    return pd.read_table(gene_info_url, sep="\t", names=columns, compression="gzip", skiprows=1)
+
+# Shared with the other label function modules, the index is built once from the same table
+gene_names = LFResource("gene_name_index", lambda: GeneNameIndex(load_gene_desc()), sources=[gene_info_url])
+gene_mentions = MentionCache(
+    "gene_mentions",
+    lambda key: gene_names.matches(key[0], re.sub("\)", "", key[1].lower())),
+    sources=[gene_info_url]
+)
 
 
 def LF_DG_CHECK_GENE_TAG(c):
@@ -175,23 +232,37 @@ def LF_DG_CHECK_GENE_TAG(c):
     c- the candidate object to be passed in.
     """
     sen = c[1].get_parent()
-    gene_name = re.sub("\)", "", c[1].get_span().lower())
     gene_id = sen.entity_cids[c[1].get_word_start()]
-    gene_entry_df = gene_desc.query("GeneID == @gene_id")
+    return 0 if gene_mentions.get((str(gene_id), c[1].get_span())) else -1
 
-    if gene_entry_df.empty:
-        return -1
 
-    for token in gene_name.split(" "):
-        if gene_entry_df["Symbol"].values[0].lower() == token or token in gene_entry_df["Synonyms"].values[0].lower():
-            return 0
-        elif token in gene_entry_df["description"].values[0].lower():
-            return 0
-    return -1
+def label_gene_tag_block(gene_ids, gene_spans):
+    """
+    Run LF_DG_CHECK_GENE_TAG on whole arrays of candidates at once
+
+    gene_ids - an array of the GeneIDs the gene mentions were tagged with (sen.entity_cids)
+    gene_spans - an array of the gene mention texts in the same order (c[1].get_span())
+
+    returns a numpy array of labels
+    """
+    mention_texts = [re.sub("\)", "", mention.lower()) for mention in gene_spans]
+    return np.where(gene_names.matches_block(gene_ids, mention_texts), 0, -1)
 
 
 #disease_desc = pd.read_table("https://raw.githubusercontent.com/dhimmel/disease-ontology/052ffcc960f5897a0575f5feff904ca84b7d2c1d/data/xrefs-prop-slim.tsv")
-disease_normalization_df = pd.read_table("https://raw.githubusercontent.com/dhimmel/disease-ontology/052ffcc960f5897a0575f5feff904ca84b7d2c1d/data/slim-terms-prop.tsv")
+disease_ontology_url = "https://raw.githubusercontent.com/dhimmel/disease-ontology/052ffcc960f5897a0575f5feff904ca84b7d2c1d/data/slim-terms-prop.tsv"
+
+def load_disease_names():
+    disease_normalization_df = pd.read_table(disease_ontology_url)
+    return SubstringIndex(disease_normalization_df["subsumed_name"], disease_normalization_df["slim_id"])
+
+disease_names = LFResource("disease_ontology_name_index", load_disease_names, sources=[disease_ontology_url])
+# Shared with the other label function modules, every disease span is resolved once
+disease_mentions = MentionCache(
+    "disease_mentions",
+    lambda span_text: resolve_disease_mention(span_text, set(stop_word_list), disease_names),
+    sources=[disease_ontology_url, "nltk stopwords english"]
+)
 wordnet_lemmatizer = WordNetLemmatizer()
 
 def LF_DG_CHECK_DISEASE_TAG(c):
@@ -201,41 +272,37 @@ def LF_DG_CHECK_DISEASE_TAG(c):
     c- the candidate object to be passed in.
     """
     sen = c[0].get_parent()
-    disease_name = re.sub("\) ?", "", c[0].get_span())
-    disease_name = re.sub(r"(\w)-(\w)", r"\g<1> \g<2>", disease_name)
-    disease_name = " ".join([word for word in word_tokenize(disease_name) if word not in set(stop_word_list)])
+    disease_name, slim_id = disease_mentions.get(c[0].get_span())
 
     # If abbreviation skip since no means of easy resolution
     if len(disease_name) <=5 and disease_name.isupper():
         return 0
 
     disease_id = sen.entity_cids[c[0].get_word_start()]
-    result = disease_normalization_df[
-        disease_normalization_df["subsumed_name"].str.contains(disease_name.lower(), regex=False)
-    ]
-    # If no match then return -1
-    if result.empty:
-
-        # check the reverse direction e.g. carcinoma lung -> lung carcinoma
-        disease_name_tokens = word_tokenize(disease_name)
-        if len(disease_name_tokens) == 2:
-            result = disease_normalization_df[
-                disease_normalization_df["subsumed_name"].str.contains(" ".join(disease_name_tokens[-1::0-1]).lower(), regex=False)
-            ]
-            
-            # if reversing doesn't work then output -t
-            if not result.empty:
-                slim_id = result['slim_id'].values[0]
-                if slim_id == disease_id:
-                    return 0
-        return -1
+    # If it can be normalized (as is or reversed) return 0 else -1
+    if slim_id == disease_id:
+        return 0
     else:
-        # If it can be normalized return 0 else -1
-        slim_id = result['slim_id'].values[0]
-        if slim_id == disease_id:
-            return 0
+        return -1
+
+
+def label_disease_tag_block(disease_ids, disease_spans):
+    """
+    Run LF_DG_CHECK_DISEASE_TAG on whole arrays of candidates at once
+
+    disease_ids - an array of the ids the disease mentions were tagged with (sen.entity_cids)
+    disease_spans - an array of the disease mention texts in the same order (c[0].get_span())
+
+    returns a numpy array of labels
+    """
+    labels = []
+    for disease_id, mention in zip(disease_ids, disease_spans):
+        disease_name, slim_id = disease_mentions.get(mention)
+        if len(disease_name) <= 5 and disease_name.isupper():
+            labels.append(0)
         else:
-            return -1
+            labels.append(0 if slim_id == disease_id else -1)
+    return np.array(labels)
 
 """
 SENTENCE PATTERN MATCHING
@@ -371,6 +438,38 @@ context_change_keywords = {
     "; however,",
 }
 
+"""
+Every keyword set is compiled once into a scanner for the text it gets searched in.
+Scans are cached on the candidate context, so the label functions below share them.
+"""
+window_keywords = KeywordScanner([
+    KeywordSet("negation", ["not", "no"], before=r'\b', after=r'\b'),
+    KeywordSet("direct_association", direct_association, before=r'(?<!not )(?<!no )'),
+    KeywordSet("weak_association", weak_association),
+    KeywordSet("no_direct_association", no_direct_association),
+    KeywordSet("cellular_activity", cellular_activity),
+    KeywordSet("disease_sample", disease_sample_indicators),
+    KeywordSet("genetic_abnormalities", genetic_abnormalities),
+    KeywordSet("context_change", context_change_keywords),
+])
+biomarker_keywords = KeywordScanner([KeywordSet("biomarker", biomarker_indicators)])
+method_keywords = KeywordScanner([KeywordSet("method", method_indication)])
+tagged_text_keywords = KeywordScanner([
+    KeywordSet("title_start", title_indication, before=r'^(\[|\[ )?'),
+    KeywordSet("title_end", title_indication, after=r'$'),
+    KeywordSet("cellular_activity", cellular_activity),
+    KeywordSet("upregulates_btw_AB", upregulates, before=r'{{A}}.*', after=r'.*{{B}}'),
+    KeywordSet("upregulates_btw_BA", upregulates, before=r'{{B}}.*', after=r'.*{{A}}'),
+    KeywordSet("upregulates_after", upregulates, before=r'{{(A|B)}}.*{{(A|B)}}.*', flags=0),
+    KeywordSet("downregulates_btw_AB", downregulates, before=r'{{A}}.*', after=r'.*{{B}}'),
+    KeywordSet("downregulates_btw_BA", downregulates, before=r'{{B}}.*', after=r'.*{{A}}'),
+    KeywordSet("downregulates_after", downregulates, before=r'{{(A|B)}}.*{{(A|B)}}.*', flags=0),
+    KeywordSet("diagnosis_btw_AB", diagnosis_indicators, before=r'{{A}}.*', after=r'.*{{B}}'),
+    KeywordSet("diagnosis_btw_BA", diagnosis_indicators, before=r'{{B}}.*', after=r'.*{{A}}'),
+    KeywordSet("diagnosis_after", diagnosis_indicators, before=r'{{(A|B)}}.*{{(A|B)}}.*', flags=0),
+    KeywordSet("patient_with", ["patient(s)? with"], after=r".{1,200}{{A}}"),
+])
+
 def LF_DG_IS_BIOMARKER(c):
     """
     This label function examines a sentences to determine of a sentence
@@ -379,9 +478,9 @@ def LF_DG_IS_BIOMARKER(c):
     """
     if LF_DG_METHOD_DESC(c) or LF_DG_TITLE(c):
         return 0
-    elif re.search(ltp(biomarker_indicators), " ".join(get_left_tokens(c[1], window=10)), flags=re.I):
+    elif "biomarker" in found_keywords(c, biomarker_keywords, " ".join(get_left_tokens(c[1], window=10))):
         return 1
-    elif re.search(ltp(biomarker_indicators), " ".join(get_right_tokens(c[1], window=10)), flags=re.I):
+    elif "biomarker" in found_keywords(c, biomarker_keywords, " ".join(get_right_tokens(c[1], window=10))):
         return 1
     else:
         return 0
@@ -393,15 +492,15 @@ def LF_DaG_ASSOCIATION(c):
     """
     left_window = " ".join(get_left_tokens(c[0], window=10)) + " ".join(get_left_tokens(c[1], window=10))
     right_window = " ".join(get_right_tokens(c[0], window=10)) + " ".join(get_right_tokens(c[1], window=10))
-    found_negation = not re.search(r'\b(not|no)\b', left_window, flags=re.I)
+    found_negation = "negation" not in found_keywords(c, window_keywords, left_window)
 
     if LF_DG_METHOD_DESC(c) or LF_DG_TITLE(c):
         return 0
-    elif re.search(r'(?<!not )(?<!no )' + ltp(direct_association), get_text_between(c), flags=re.I) and found_negation:
+    elif "direct_association" in found_keywords(c, window_keywords, get_text_between(c)) and found_negation:
         return 1
-    elif re.search(r'(?<!not )(?<!no )' + ltp(direct_association), left_window, flags=re.I) and found_negation:
+    elif "direct_association" in found_keywords(c, window_keywords, left_window) and found_negation:
         return 1
-    elif re.search(r'(?<!not )(?<!no )' + ltp(direct_association), right_window, flags=re.I) and found_negation:
+    elif "direct_association" in found_keywords(c, window_keywords, right_window) and found_negation:
         return 1
     else:
         return 0
@@ -416,11 +515,11 @@ def LF_DaG_WEAK_ASSOCIATION(c):
     
     if LF_DG_METHOD_DESC(c) or LF_DG_TITLE(c):
         return 0
-    elif re.search(ltp(weak_association), get_text_between(c), flags=re.I):
+    elif "weak_association" in found_keywords(c, window_keywords, get_text_between(c)):
         return 1
-    elif re.search(ltp(weak_association), left_window, flags=re.I):
+    elif "weak_association" in found_keywords(c, window_keywords, left_window):
         return 1
-    elif re.search(ltp(weak_association), right_window, flags=re.I):
+    elif "weak_association" in found_keywords(c, window_keywords, right_window):
         return 1
     else:
         return 0
@@ -435,11 +534,11 @@ def LF_DaG_NO_ASSOCIATION(c):
     
     if LF_DG_METHOD_DESC(c) or LF_DG_TITLE(c):
         return 0
-    elif re.search(ltp(no_direct_association), get_text_between(c), flags=re.I):
+    elif "no_direct_association" in found_keywords(c, window_keywords, get_text_between(c)):
         return -1
-    elif re.search(ltp(no_direct_association), left_window, flags=re.I):
+    elif "no_direct_association" in found_keywords(c, window_keywords, left_window):
         return -1
-    elif re.search(ltp(no_direct_association), right_window, flags=re.I):
+    elif "no_direct_association" in found_keywords(c, window_keywords, right_window):
         return -1
     else:
         return 0
@@ -452,11 +551,11 @@ def LF_DaG_CELLULAR_ACTIVITY(c):
     left_window = " ".join(get_left_tokens(c[0], window=10)) + " ".join(get_left_tokens(c[1], window=10))
     right_window = " ".join(get_right_tokens(c[0], window=10)) + " ".join(get_right_tokens(c[1], window=10))
     
-    if re.search(ltp(cellular_activity), get_tagged_text(c), flags=re.I):
+    if "cellular_activity" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)):
         return 1
-    elif re.search(ltp(cellular_activity), left_window, flags=re.I):
+    elif "cellular_activity" in found_keywords(c, window_keywords, left_window):
         return 1
-    elif re.search(ltp(cellular_activity), right_window, flags=re.I):
+    elif "cellular_activity" in found_keywords(c, window_keywords, right_window):
         return 1
     else:
         return 0
@@ -469,22 +568,25 @@ def LF_DaG_DISEASE_SAMPLE(c):
     left_window = " ".join(get_left_tokens(c[0], window=10)) + " ".join(get_left_tokens(c[1], window=10))
     right_window = " ".join(get_right_tokens(c[0], window=10)) + " ".join(get_right_tokens(c[1], window=10))
     
-    if re.search(ltp(disease_sample_indicators), left_window, flags=re.I):
+    if "disease_sample" in found_keywords(c, window_keywords, left_window):
         return 1
-    elif re.search(ltp(disease_sample_indicators), right_window, flags=re.I):
+    elif "disease_sample" in found_keywords(c, window_keywords, right_window):
         return 1
     else:
         return 0
     
+def starts_with_method_desc(sentence):
+    # The first 20 words of a sentence are the same for all of its candidates
+    return "method" in method_keywords.found(" ".join(sentence.words[0:20]))
+
 def LF_DG_METHOD_DESC(c):
     """
     This label function is designed to look for phrases 
     that imply a sentence is description an experimental design
     """
-    sentence_tokens = " ".join(c.get_parent().words[0:20])
-    if re.search(ltp(method_indication), sentence_tokens, flags=re.I):
+    if sentence_feature(c, "method_desc_start", starts_with_method_desc):
         return -1
-    elif re.search(ltp(method_indication), " ".join(get_between_tokens(c)), flags=re.I):
+    elif "method" in found_keywords(c, method_keywords, " ".join(get_between_tokens(c))):
         return -1
     else:
         return 0
@@ -494,9 +596,9 @@ def LF_DG_TITLE(c):
     This label function is designed to look for phrases that inditcates
     a paper title
     """
-    if re.search(r'^(\[|\[ )?'+ltp(title_indication), get_tagged_text(c), flags=re.I):
+    if "title_start" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)):
         return -1
-    elif re.search(ltp(title_indication)+r'$', get_tagged_text(c), flags=re.I):
+    elif "title_end" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)):
         return -1
     elif "(author's transl)" in get_tagged_text(c):
         return -1
@@ -513,11 +615,11 @@ def LF_DuG_UPREGULATES(c):
     if LF_DG_METHOD_DESC(c) or LF_DG_TITLE(c):
         return 0
     else:
-        if rule_regex_search_btw_AB(c, r'.*'+ltp(upregulates)+r'.*', 1):
+        if "upregulates_btw_AB" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)):
             return 1
-        elif rule_regex_search_btw_BA(c, r'.*'+ltp(upregulates)+r'.*', 1):
+        elif "upregulates_btw_BA" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)):
             return 1
-        elif re.search(r'({{A}}|{{B}}).*({{A}}|{{B}}).*' + ltp(upregulates), get_tagged_text(c)):
+        elif "upregulates_after" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)):
             return 1
         else:
             return 0
@@ -530,11 +632,11 @@ def LF_DdG_DOWNREGULATES(c):
     if LF_DG_METHOD_DESC(c) or LF_DG_TITLE(c):
         return 0
     else:
-        if rule_regex_search_btw_AB(c, r'.*'+ltp(downregulates)+r'.*', 1):
+        if "downregulates_btw_AB" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)):
             return 1
-        elif rule_regex_search_btw_BA(c, r'.*'+ltp(downregulates)+r'.*', 1):
+        elif "downregulates_btw_BA" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)):
             return 1
-        elif re.search(r'({{A}}|{{B}}).*({{A}}|{{B}}).*' + ltp(downregulates), get_tagged_text(c)):
+        elif "downregulates_after" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)):
             return 1
         else:
             return 0
@@ -551,11 +653,11 @@ def LF_DG_GENETIC_ABNORMALITIES(c):
     left_window = " ".join(get_left_tokens(c[0], window=10)) + " ".join(get_left_tokens(c[1], window=10))
     right_window = " ".join(get_right_tokens(c[0], window=10)) + " ".join(get_right_tokens(c[1], window=10))
     
-    if re.search(ltp(genetic_abnormalities), get_text_between(c), flags=re.I):
+    if "genetic_abnormalities" in found_keywords(c, window_keywords, get_text_between(c)):
         return 1
-    elif re.search(ltp(genetic_abnormalities), left_window, flags=re.I):
+    elif "genetic_abnormalities" in found_keywords(c, window_keywords, left_window):
         return 1
-    elif re.search(ltp(genetic_abnormalities), right_window, flags=re.I):
+    elif "genetic_abnormalities" in found_keywords(c, window_keywords, right_window):
         return 1
     return 0
     
@@ -564,14 +666,14 @@ def LF_DG_DIAGNOSIS(c):
     This label function is designed to search for words that imply a patient diagnosis
     which will provide evidence for possible disease gene association.
     """
-    return 1 if any([rule_regex_search_btw_AB(c, r'.*'+ltp(diagnosis_indicators) + r".*", 1), rule_regex_search_btw_BA(c, r'.*'+ltp(diagnosis_indicators) + r".*", 1)]) or  \
-        re.search(r'({{A}}|{{B}}).*({{A}}|{{B}}).*' + ltp(diagnosis_indicators), get_tagged_text(c)) else 0
+    found = found_keywords(c, tagged_text_keywords, get_tagged_text(c))
+    return 1 if found.intersection({"diagnosis_btw_AB", "diagnosis_btw_BA", "diagnosis_after"}) else 0
 
 def LF_DG_PATIENT_WITH(c):
     """
     This label function looks for the phrase "  with" disease.
     """
-    return 1 if re.search(r"patient(s)? with.{1,200}{{A}}", get_tagged_text(c), flags=re.I) else 0
+    return 1 if "patient_with" in found_keywords(c, tagged_text_keywords, get_tagged_text(c)) else 0
 
 def LF_DG_CONCLUSION_TITLE(c):
     """"
@@ -693,6 +795,7 @@ def LF_DG_ALLOWED_DISTANCE(c):
         LF_DG_DISTANCE_SHORT(c)
         ]) else 1
 
+@sentence_level
 def LF_DG_NO_VERB(c):
     """
     This label function is designed to fire if a given
@@ -703,6 +806,7 @@ def LF_DG_NO_VERB(c):
         return -1
     return 0
 
+@sentence_level
 def LF_DG_MULTIPLE_ENTITIES(c):
     #Keep track of previous entity
     previous_entity = 'o'
@@ -725,136 +829,371 @@ def LF_DG_MULTIPLE_ENTITIES(c):
 
 
 def LF_DG_CONTEXT_SWITCH(c):
-    if re.search(ltp(context_change_keywords), get_text_between(c), flags=re.I):
+    if "context_change" in found_keywords(c, window_keywords, get_text_between(c)):
         return -1
     return 0
 
 """
 Bi-Clustering LFs
 """
-path = pathlib.Path(__file__).joinpath("../../../../../dependency_cluster/disease_gene_bicluster_results.tsv.xz").resolve()
-bicluster_dep_df = pd.read_table(path)
-causal_mutations_base = set([tuple(x) for x in bicluster_dep_df.query("U>0")[["pubmed_id", "sentence_num"]].values])
-mutations_base = set([tuple(x) for x in bicluster_dep_df.query("Ud>0")[["pubmed_id", "sentence_num"]].values])
-drug_targets_base = set([tuple(x) for x in bicluster_dep_df.query("D>0")[["pubmed_id", "sentence_num"]].values])
-pathogenesis_base = set([tuple(x) for x in bicluster_dep_df.query("J>0")[["pubmed_id", "sentence_num"]].values])
-therapeutic_base = set([tuple(x) for x in bicluster_dep_df.query("Te>0")[["pubmed_id", "sentence_num"]].values])
-polymorphisms_base = set([tuple(x) for x in bicluster_dep_df.query("Y>0")[["pubmed_id", "sentence_num"]].values])
-progression_base = set([tuple(x) for x in bicluster_dep_df.query("G>0")[["pubmed_id", "sentence_num"]].values])
-biomarkers_base = set([tuple(x) for x in bicluster_dep_df.query("Md>0")[["pubmed_id", "sentence_num"]].values])
-overexpression_base = set([tuple(x) for x in bicluster_dep_df.query("X>0")[["pubmed_id", "sentence_num"]].values])
-regulation_base = set([tuple(x) for x in bicluster_dep_df.query("L>0")[["pubmed_id", "sentence_num"]].values])
-
+bicluster_index = BiclusterIndex()
+causal_mutations_theme = theme_bit("disease_gene", "U")
+mutations_theme = theme_bit("disease_gene", "Ud")
+drug_targets_theme = theme_bit("disease_gene", "D")
+pathogenesis_theme = theme_bit("disease_gene", "J")
+therapeutic_theme = theme_bit("disease_gene", "Te")
+polymorphisms_theme = theme_bit("disease_gene", "Y")
+progression_theme = theme_bit("disease_gene", "G")
+biomarkers_theme = theme_bit("disease_gene", "Md")
+overexpression_theme = theme_bit("disease_gene", "X")
+regulation_theme = theme_bit("disease_gene", "L")
+
+@sentence_level
 def LF_DG_BICLUSTER_CASUAL_MUTATIONS(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in causal_mutations_base:
+    if bicluster_mask(c, bicluster_index) & causal_mutations_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_DG_BICLUSTER_MUTATIONS(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in mutations_base:
+    if bicluster_mask(c, bicluster_index) & mutations_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_DG_BICLUSTER_DRUG_TARGETS(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in drug_targets_base:
+    if bicluster_mask(c, bicluster_index) & drug_targets_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_DG_BICLUSTER_PATHOGENESIS(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in pathogenesis_base:
+    if bicluster_mask(c, bicluster_index) & pathogenesis_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_DG_BICLUSTER_THERAPEUTIC(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in therapeutic_base:
+    if bicluster_mask(c, bicluster_index) & therapeutic_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_DG_BICLUSTER_POLYMORPHISMS(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in polymorphisms_base:
+    if bicluster_mask(c, bicluster_index) & polymorphisms_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_DG_BICLUSTER_PROGRESSION(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in progression_base:
+    if bicluster_mask(c, bicluster_index) & progression_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_DG_BICLUSTER_BIOMARKERS(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in biomarkers_base:
+    if bicluster_mask(c, bicluster_index) & biomarkers_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_DG_BICLUSTER_OVEREXPRESSION(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in overexpression_base:
+    if bicluster_mask(c, bicluster_index) & overexpression_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_DG_BICLUSTER_REGULATION(c):
     """
     This label function uses the bicluster data located in the 
     A global network of biomedical relationships
     """
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in regulation_base:
+    if bicluster_mask(c, bicluster_index) & regulation_theme:
         return 1
     return 0
 
+# The theme of every bicluster label function
+bicluster_columns = OrderedDict([
+    ("LF_DG_BICLUSTER_CASUAL_MUTATIONS", causal_mutations_theme),
+    ("LF_DG_BICLUSTER_MUTATIONS", mutations_theme),
+    ("LF_DG_BICLUSTER_DRUG_TARGETS", drug_targets_theme),
+    ("LF_DG_BICLUSTER_PATHOGENESIS", pathogenesis_theme),
+    ("LF_DG_BICLUSTER_THERAPEUTIC", therapeutic_theme),
+    ("LF_DG_BICLUSTER_POLYMORPHISMS", polymorphisms_theme),
+    ("LF_DG_BICLUSTER_PROGRESSION", progression_theme),
+    ("LF_DG_BICLUSTER_BIOMARKERS", biomarkers_theme),
+    ("LF_DG_BICLUSTER_OVEREXPRESSION", overexpression_theme),
+    ("LF_DG_BICLUSTER_REGULATION", regulation_theme),
+])
+
+
+def label_bicluster_block(pubmed_ids, sentence_nums, lf_names=None):
+    """
+    Run the bicluster label functions on whole arrays of candidates at once
+
+    pubmed_ids - an array of the pubmed ids of the candidates' documents (c.get_parent().document.name)
+    sentence_nums - an array of the candidates' sentence positions in the same order (c.get_parent().position)
+    lf_names - the label functions to run (defaults to every one in bicluster_columns)
+
+    returns a (candidates x label functions) numpy matrix
+    """
+    lf_names = list(bicluster_columns) if lf_names is None else lf_names
+    return bicluster_index.label_block(pubmed_ids, sentence_nums, [bicluster_columns[name] for name in lf_names])
+
+"""
+COLUMNAR LFs
+Each one labels every exported candidate at once (see utils/lf_utils/columnar.py)
+and gives the same labels as the label function it is registered for.
+"""
+
+# ":" in get_between_tokens(c) is a colon token in the space separated tokens
+between_token_keywords = KeywordScanner([KeywordSet("colon", [":"], before=r'(^| )', after=r'( |$)')])
+
+def has_verb_tag(pos_tag):
+    return "VB" in pos_tag and pos_tag != "VBG"
+
+def is_entity_tag(entity_type):
+    return entity_type.lower() != 'o'
+
+def window_found(columns, scanner, name):
+    # the keyword shows up in the text between the mentions or the windows around them
+    return (
+        columns.found(scanner, name, "text_between") |
+        columns.found(scanner, name, "left_window0", "left_window1") |
+        columns.found(scanner, name, "right_window0", "right_window1")
+    )
+
+def method_or_title(columns):
+    return (columns.label(LF_DG_METHOD_DESC.columnar) != 0) | (columns.label(LF_DG_TITLE.columnar) != 0)
+
+for lf_name in hetnet_columns:
+    columnar(globals()[lf_name])(
+        lambda columns, lf_name=lf_name: label_hetnet_block(columns["Gene_cid"], columns["Disease_cid"], [lf_name])[:, 0]
+    )
+
+for lf_name in bicluster_columns:
+    columnar(globals()[lf_name])(
+        lambda columns, lf_name=lf_name: label_bicluster_block(
+            columns.per_candidate(columns.sentences["pubmed_id"].values),
+            columns.per_candidate(columns.sentences["position"].values),
+            [lf_name]
+        )[:, 0]
+    )
+
+@columnar(LF_DG_CHECK_GENE_TAG)
+def column_DG_CHECK_GENE_TAG(columns):
+    return label_gene_tag_block(columns["span1_cid"], columns["span1_text"])
+
+@columnar(LF_DG_CHECK_DISEASE_TAG)
+def column_DG_CHECK_DISEASE_TAG(columns):
+    return label_disease_tag_block(columns["span0_cid"], columns["span0_text"])
+
+@columnar(LF_DG_METHOD_DESC)
+def column_DG_METHOD_DESC(columns):
+    method_start = columns.per_candidate(keyword_found(method_keywords, "method", columns.sentence_prefix(20)))
+    return np.where(method_start | columns.found(method_keywords, "method", "between_tokens"), -1, 0)
+
+@columnar(LF_DG_TITLE)
+def column_DG_TITLE(columns):
+    title = (
+        columns.found(tagged_text_keywords, "title_start", "tagged_text") |
+        columns.found(tagged_text_keywords, "title_end", "tagged_text") |
+        columns.contains("(author's transl)", "tagged_text") |
+        columns.found(between_token_keywords, "colon", "between_tokens")
+    )
+    return np.where(title, -1, 0)
+
+@columnar(LF_DG_IS_BIOMARKER)
+def column_DG_IS_BIOMARKER(columns):
+    biomarker = (
+        columns.found(biomarker_keywords, "biomarker", "left_window1") |
+        columns.found(biomarker_keywords, "biomarker", "right_window1")
+    )
+    return np.where(~method_or_title(columns) & biomarker, 1, 0)
+
+@columnar(LF_DaG_ASSOCIATION)
+def column_DaG_ASSOCIATION(columns):
+    no_negation = ~columns.found(window_keywords, "negation", "left_window0", "left_window1")
+    association = window_found(columns, window_keywords, "direct_association") & no_negation
+    return np.where(~method_or_title(columns) & association, 1, 0)
+
+@columnar(LF_DaG_WEAK_ASSOCIATION)
+def column_DaG_WEAK_ASSOCIATION(columns):
+    return np.where(~method_or_title(columns) & window_found(columns, window_keywords, "weak_association"), 1, 0)
+
+@columnar(LF_DaG_NO_ASSOCIATION)
+def column_DaG_NO_ASSOCIATION(columns):
+    return np.where(~method_or_title(columns) & window_found(columns, window_keywords, "no_direct_association"), -1, 0)
+
+@columnar(LF_DaG_CELLULAR_ACTIVITY)
+def column_DaG_CELLULAR_ACTIVITY(columns):
+    cellular_activity = (
+        columns.found(tagged_text_keywords, "cellular_activity", "tagged_text") |
+        columns.found(window_keywords, "cellular_activity", "left_window0", "left_window1") |
+        columns.found(window_keywords, "cellular_activity", "right_window0", "right_window1")
+    )
+    return np.where(cellular_activity, 1, 0)
+
+@columnar(LF_DaG_DISEASE_SAMPLE)
+def column_DaG_DISEASE_SAMPLE(columns):
+    disease_sample = (
+        columns.found(window_keywords, "disease_sample", "left_window0", "left_window1") |
+        columns.found(window_keywords, "disease_sample", "right_window0", "right_window1")
+    )
+    return np.where(disease_sample, 1, 0)
+
+@columnar(LF_DuG_UPREGULATES)
+def column_DuG_UPREGULATES(columns):
+    upregulates = (
+        columns.found(tagged_text_keywords, "upregulates_btw_AB", "tagged_text") |
+        columns.found(tagged_text_keywords, "upregulates_btw_BA", "tagged_text") |
+        columns.found(tagged_text_keywords, "upregulates_after", "tagged_text")
+    )
+    return np.where(~method_or_title(columns) & upregulates, 1, 0)
+
+@columnar(LF_DdG_DOWNREGULATES)
+def column_DdG_DOWNREGULATES(columns):
+    downregulates = (
+        columns.found(tagged_text_keywords, "downregulates_btw_AB", "tagged_text") |
+        columns.found(tagged_text_keywords, "downregulates_btw_BA", "tagged_text") |
+        columns.found(tagged_text_keywords, "downregulates_after", "tagged_text")
+    )
+    return np.where(~method_or_title(columns) & downregulates, 1, 0)
+
+@columnar(LF_DdG_METHYLATION)
+def column_DdG_METHYLATION(columns):
+    return np.where(columns.contains("methylation", "tagged_text"), 1, 0)
+
+@columnar(LF_DG_GENETIC_ABNORMALITIES)
+def column_DG_GENETIC_ABNORMALITIES(columns):
+    return np.where(window_found(columns, window_keywords, "genetic_abnormalities"), 1, 0)
+
+@columnar(LF_DG_DIAGNOSIS)
+def column_DG_DIAGNOSIS(columns):
+    diagnosis = (
+        columns.found(tagged_text_keywords, "diagnosis_btw_AB", "tagged_text") |
+        columns.found(tagged_text_keywords, "diagnosis_btw_BA", "tagged_text") |
+        columns.found(tagged_text_keywords, "diagnosis_after", "tagged_text")
+    )
+    return np.where(diagnosis, 1, 0)
+
+@columnar(LF_DG_PATIENT_WITH)
+def column_DG_PATIENT_WITH(columns):
+    return np.where(columns.found(tagged_text_keywords, "patient_with", "tagged_text"), 1, 0)
+
+@columnar(LF_DG_CONCLUSION_TITLE)
+def column_DG_CONCLUSION_TITLE(columns):
+    conclusion = columns.contains("CONCLUSION:", "tagged_text") | columns.contains("concluded", "tagged_text")
+    return np.where(conclusion, 1, 0)
+
+@columnar(LF_DaG_NO_CONCLUSION)
+def column_DaG_NO_CONCLUSION(columns):
+    label = lambda lf: columns.label(lf.columnar).astype(np.int64)
+    positive_num = (
+        label(LF_DaG_ASSOCIATION) + label(LF_DG_IS_BIOMARKER) + label(LF_DG_DIAGNOSIS) +
+        label(LF_DaG_CELLULAR_ACTIVITY) +
+        np.abs(label(LF_DaG_WEAK_ASSOCIATION)) + np.abs(label(LF_DaG_NO_ASSOCIATION))
+    )
+    negative_num = np.abs(
+        label(LF_DG_METHOD_DESC) + label(LF_DG_TITLE) +
+        label(LF_DG_NO_VERB) + label(LF_DG_MULTIPLE_ENTITIES)
+    )
+    return np.where(positive_num - negative_num >= 1, 0, -1)
+
+@columnar(LF_DaG_CONCLUSION)
+def column_DaG_CONCLUSION(columns):
+    no_association = (
+        (columns.label(LF_DaG_NO_ASSOCIATION.columnar) != 0) |
+        (columns.label(LF_DaG_WEAK_ASSOCIATION.columnar) != 0)
+    )
+    conclusion = np.where(columns.label(LF_DaG_NO_CONCLUSION.columnar) == 0, 1, 0)
+    return np.where(no_association, -1, conclusion)
+
+# np.sum(LF_DG_METHOD_DESC(c), LF_DG_TITLE(c)) only counts the method description (the title is the axis)
+@columnar(LF_DuG_NO_CONCLUSION)
+def column_DuG_NO_CONCLUSION(columns):
+    positive_num = columns.label(LF_DuG_UPREGULATES.columnar).astype(np.int64)
+    negative_num = np.abs(columns.label(LF_DG_METHOD_DESC.columnar).astype(np.int64))
+    return np.where(positive_num - negative_num >= 1, 0, -1)
+
+@columnar(LF_DuG_CONCLUSION)
+def column_DuG_CONCLUSION(columns):
+    return np.where(columns.label(LF_DuG_NO_CONCLUSION.columnar) == 0, 1, 0)
+
+@columnar(LF_DdG_NO_CONCLUSION)
+def column_DdG_NO_CONCLUSION(columns):
+    positive_num = columns.label(LF_DdG_DOWNREGULATES.columnar).astype(np.int64)
+    negative_num = np.abs(columns.label(LF_DG_METHOD_DESC.columnar).astype(np.int64))
+    return np.where(positive_num - negative_num >= 1, 0, -1)
+
+@columnar(LF_DdG_CONCLUSION)
+def column_DdG_CONCLUSION(columns):
+    return np.where(columns.label(LF_DdG_NO_CONCLUSION.columnar) == 0, 1, 0)
+
+@columnar(LF_DG_DISTANCE_SHORT)
+def column_DG_DISTANCE_SHORT(columns):
+    return np.where(columns.between_token_count() <= 2, -1, 0)
+
+@columnar(LF_DG_DISTANCE_LONG)
+def column_DG_DISTANCE_LONG(columns):
+    return np.where(columns.between_token_count() > 50, -1, 0)
+
+@columnar(LF_DG_ALLOWED_DISTANCE)
+def column_DG_ALLOWED_DISTANCE(columns):
+    too_far_or_close = (
+        (columns.label(LF_DG_DISTANCE_LONG.columnar) != 0) |
+        (columns.label(LF_DG_DISTANCE_SHORT.columnar) != 0)
+    )
+    return np.where(too_far_or_close, 0, 1)
+
+@columnar(LF_DG_NO_VERB)
+def column_DG_NO_VERB(columns):
+    return columns.per_candidate(np.where(columns.count_tokens("pos_tags", has_verb_tag) == 0, -1, 0))
+
+@columnar(LF_DG_MULTIPLE_ENTITIES)
+def column_DG_MULTIPLE_ENTITIES(columns):
+    return columns.per_candidate(np.where(columns.count_token_runs("entity_types", is_entity_tag) > 2, -1, 0))
+
+@columnar(LF_DG_CONTEXT_SWITCH)
+def column_DG_CONTEXT_SWITCH(columns):
+    return np.where(columns.found(window_keywords, "context_change", "text_between"), -1, 0)
+
 """
 RETRUN LFs to Notebook
 """
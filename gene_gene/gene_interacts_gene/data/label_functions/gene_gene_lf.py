@@ -1,29 +1,40 @@
-from snorkel.lf_helpers import (
+from collections import OrderedDict
+import numpy as np
+import random
+import re
+import pathlib
+import sys
+import pandas as pd
+import nltk
+from nltk.stem import WordNetLemmatizer
+from nltk.tokenize import word_tokenize
+from nltk.corpus import stopwords
+
+# The label functions share one cached context per candidate (see utils/lf_utils)
+sys.path.append(str(pathlib.Path(__file__).joinpath('../../../../../modules').resolve()))
+from utils.lf_utils.candidate_context import (
+    bicluster_mask,
     get_left_tokens,
     get_right_tokens,
     get_between_tokens,
     get_tagged_text,
     get_text_between,
     is_inverted,
+    found_keywords,
     rule_regex_search_tagged_text,
     rule_regex_search_btw_AB,
     rule_regex_search_btw_BA,
     rule_regex_search_before_A,
     rule_regex_search_before_B,
 )
-from collections import OrderedDict
-import numpy as np
-import random
-import re
-import pathlib
-import pandas as pd
-import nltk
-from nltk.stem import WordNetLemmatizer
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
+from utils.lf_utils.bicluster_index import BiclusterIndex, theme_bit
+from utils.lf_utils.keyword_scanner import KeywordScanner, KeywordSet
+from utils.lf_utils.kb_index import KnowledgeBaseIndex
+from utils.lf_utils.lf_resources import LFResource
+from utils.lf_utils.sentence_features import sentence_feature, sentence_level
 
 random.seed(100)
-stop_word_list = stopwords.words('english')
+stop_word_list = LFResource("nltk_stopwords_english", lambda: stopwords.words('english'), sources=["nltk stopwords english"])
 
 # Helper function for label functions
 def ltp(tokens):
@@ -32,85 +43,84 @@ def ltp(tokens):
 """
 DISTANT SUPERVISION
 """
-path = pathlib.Path(__file__).joinpath('../../../datafile/results/gene_interacts_gene.tsv.xz').resolve()
-pair_df = pd.read_table(path, dtype={"sources": str})
-knowledge_base = set()
-for row in pair_df.itertuples():
-    if not row.sources or pd.isnull(row.sources):
-        continue
-    for source in row.sources.split('|'):
-        key = str(row.gene1_id), str(row.gene2_id), source.lower()
-        knowledge_base.add(key)
+kb_paths = [
+    pathlib.Path(__file__).joinpath('../../../datafile/results/gene_interacts_gene.tsv.xz').resolve(),
+]
+
+def load_knowledge_base():
+    triples = []
+    pair_df = pd.read_table(kb_paths[0], dtype={"sources": str})
+    for row in pair_df.itertuples():
+        if not row.sources or pd.isnull(row.sources):
+            continue
+        for source in row.sources.split('|'):
+            key = str(row.gene1_id), str(row.gene2_id), source.lower()
+            triples.append(key)
+    return KnowledgeBaseIndex(triples, symmetric=True)
+
+knowledge_base = LFResource("gene_gene_knowledge_base", load_knowledge_base, sources=kb_paths, version=3, store=KnowledgeBaseIndex)
+
+GiG_sources = [
+    "hi-i-05", "venkatesan-09", "yu-11", "hi-ii-14",
+    "lit-bm-13", "ii-binary", "ii-literature", "hetio-dag"
+]
+
+# (sources, label if found, label if not found) of every distant supervision label function
+hetnet_columns = OrderedDict([
+    ("LF_HETNET_HI_I_05", (["hi-i-05"], 1, 0)),
+    ("LF_HETNET_VENKATESAN_09", (["venkatesan-09"], 1, 0)),
+    ("LF_HETNET_YU_11", (["yu-11"], 1, 0)),
+    ("LF_HETNET_HI_II_14", (["hi-ii-14"], 1, 0)),
+    ("LF_HETNET_LIT_BM_13", (["lit-bm-13"], 1, 0)),
+    ("LF_HETNET_II_BINARY", (["ii-binary"], 1, 0)),
+    ("LF_HETNET_II_LITERATURE", (["ii-literature"], 1, 0)),
+    ("LF_HETNET_HETIO_DAG", (["hetio-dag"], 1, 0)),
+    ("LF_HETNET_GiG_ABSENT", (GiG_sources, 0, -1)),
+])
+
+
+def label_hetnet_block(gene1_cids, gene2_cids, lf_names=None):
+    """
+    Run the distant supervision label functions on whole arrays of candidates at once
+    The knowledge base holds both orders of every pair, so the gene order doesn't matter.
+
+    gene1_cids - an array of the candidates' Gene1_cid values
+    gene2_cids - an array of the candidates' Gene2_cid values in the same order
+    lf_names - the label functions to run (defaults to every one in hetnet_columns)
+
+    returns a (candidates x label functions) numpy matrix
+    """
+    lf_names = list(hetnet_columns) if lf_names is None else lf_names
+    return knowledge_base.label_block(gene1_cids, gene2_cids, [hetnet_columns[name] for name in lf_names])
 
 # Human Interactome Datasets
 def LF_HETNET_HI_I_05(c):
-    return (
-        1 if (c.Gene1_cid, c.Gene2_cid, 'hi-i-05') in knowledge_base or 
-        (c.Gene2_cid, c.Gene1_cid, 'hi-i-05')in knowledge_base 
-        else 0
-    )
+    return 1 if (c.Gene1_cid, c.Gene2_cid, 'hi-i-05') in knowledge_base else 0
 
 def LF_HETNET_VENKATESAN_09(c):
-    return (
-        1 if (c.Gene1_cid, c.Gene2_cid, 'venkatesan-09') in knowledge_base or 
-        (c.Gene2_cid, c.Gene1_cid, 'venkatesan-09') in knowledge_base
-        else 0
-    )
+    return 1 if (c.Gene1_cid, c.Gene2_cid, 'venkatesan-09') in knowledge_base else 0
 
 def LF_HETNET_YU_11(c):
-    return (
-        1 if (c.Gene1_cid, c.Gene2_cid, 'yu-11') in knowledge_base
-        or (c.Gene2_cid, c.Gene1_cid, 'yu-11') in knowledge_base
-        else 0
-    )
+    return 1 if (c.Gene1_cid, c.Gene2_cid, 'yu-11') in knowledge_base else 0
 
 def LF_HETNET_HI_II_14(c):
-    return (
-        1 if (c.Gene1_cid, c.Gene2_cid, 'hi-ii-14') in knowledge_base
-        or (c.Gene2_cid, c.Gene1_cid, 'hi-ii-14') in knowledge_base 
-        else 0
-    )
+    return 1 if (c.Gene1_cid, c.Gene2_cid, 'hi-ii-14') in knowledge_base else 0
 
 def LF_HETNET_LIT_BM_13(c):
-    return (
-        1 if (c.Gene1_cid, c.Gene2_cid, 'lit-bm-13') in knowledge_base 
-        or (c.Gene2_cid, c.Gene1_cid, 'lit-bm-13') in knowledge_base 
-        else 0
-    )
+    return 1 if (c.Gene1_cid, c.Gene2_cid, 'lit-bm-13') in knowledge_base else 0
 
 # Incomplete Interactome
 def LF_HETNET_II_BINARY(c):
-    return (
-        1 if (c.Gene1_cid, c.Gene2_cid, 'ii-binary') in knowledge_base
-        or (c.Gene2_cid, c.Gene1_cid, 'ii-binary') in knowledge_base
-        else 0
-    )
+    return 1 if (c.Gene1_cid, c.Gene2_cid, 'ii-binary') in knowledge_base else 0
 
 def LF_HETNET_II_LITERATURE(c):
-    return (
-        1 if (c.Gene1_cid, c.Gene2_cid, 'ii-literature') in knowledge_base 
-        or (c.Gene2_cid, c.Gene1_cid, 'ii-literature') in knowledge_base 
-        else 0
-    )
+    return 1 if (c.Gene1_cid, c.Gene2_cid, 'ii-literature') in knowledge_base else 0
 # Hetionet
 def LF_HETNET_HETIO_DAG(c):
-    return (
-        1 if (c.Gene1_cid, c.Gene2_cid, 'hetio-dag') in knowledge_base
-        or (c.Gene2_cid, c.Gene1_cid, 'hetio-dag') in knowledge_base
-        else 0
-    )
+    return 1 if (c.Gene1_cid, c.Gene2_cid, 'hetio-dag') in knowledge_base else 0
 
 def LF_HETNET_GiG_ABSENT(c):
-    return 0 if any([
-        LF_HETNET_HI_I_05(c),
-        LF_HETNET_VENKATESAN_09(c),
-        LF_HETNET_YU_11(c),
-        LF_HETNET_HI_II_14(c),
-        LF_HETNET_LIT_BM_13(c),
-        LF_HETNET_II_BINARY(c),
-        LF_HETNET_II_LITERATURE(c),
-        LF_HETNET_HETIO_DAG(c)
-    ]) else -1
+    return 0 if knowledge_base.has_any(c.Gene1_cid, c.Gene2_cid, GiG_sources) else -1
 
 """
 SENTENCE PATTERN MATCHING
@@ -178,15 +188,34 @@ method_indication = {
     "was studied", "coeluted with", "we evaluated"
 }
 
+"""
+Every keyword set is compiled once into a scanner for the text it gets searched in.
+Scans are cached on the candidate context, so the label functions below share them.
+"""
+window_keywords = KeywordScanner([
+    KeywordSet("binding", binding_identifiers),
+    KeywordSet("cell", cell_indications),
+    KeywordSet("compound", compound_indications),
+    KeywordSet("upregulates", upregulates_identifiers),
+    KeywordSet("downregulates", downregulates_identifiers),
+    KeywordSet("regulation", regulation_identifiers),
+    KeywordSet("association", association_identifiers),
+    KeywordSet("bound", bound_identifiers),
+    KeywordSet("gene", gene_identifiers),
+    KeywordSet("diagnosis", diagnosis_indication),
+])
+mention_keywords = KeywordScanner([KeywordSet("gene_adjective", gene_adjective)])
+method_keywords = KeywordScanner([KeywordSet("method", method_indication)])
+
 def LF_GiG_BINDING_IDENTIFICATIONS(c):
     gene1_tokens = list(get_left_tokens(c[0], window=5)) + list(get_right_tokens(c[0], window=5))
     gene2_tokens = list(get_left_tokens(c[0], window=5)) + list(get_right_tokens(c[0], window=5))
 
-    if re.search(ltp(binding_identifiers), " ".join(gene1_tokens), flags=re.I):
+    if "binding" in found_keywords(c, window_keywords, " ".join(gene1_tokens)):
         return 1
-    elif re.search(ltp(binding_identifiers), " ".join(gene2_tokens), flags=re.I):
+    elif "binding" in found_keywords(c, window_keywords, " ".join(gene2_tokens)):
         return 1
-    elif re.search(ltp(binding_identifiers), get_text_between(c), flags=re.I):
+    elif "binding" in found_keywords(c, window_keywords, get_text_between(c)):
         return 1
     else:
         return 0
@@ -195,39 +224,39 @@ def LF_GiG_CELL_IDENTIFICATIONS(c):
     gene1_tokens = list(get_left_tokens(c[0], window=5)) + list(get_right_tokens(c[0], window=5))
     gene2_tokens = list(get_left_tokens(c[0], window=5)) + list(get_right_tokens(c[0], window=5))
 
-    if re.search(ltp(cell_indications), " ".join(gene1_tokens), flags=re.I):
+    if "cell" in found_keywords(c, window_keywords, " ".join(gene1_tokens)):
         return -1
-    elif re.search(ltp(cell_indications), " ".join(gene2_tokens), flags=re.I):
+    elif "cell" in found_keywords(c, window_keywords, " ".join(gene2_tokens)):
         return -1
     else:
         return 0
 
 def LF_GiG_COMPOUND_IDENTIFICATIONS(c):
-    if re.search(ltp(compound_indications), " ".join(get_right_tokens(c[0], window=2)), flags=re.I):
+    if "compound" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[0], window=2))):
         return -1
-    elif re.search(ltp(compound_indications), " ".join(get_right_tokens(c[1], window=2)), flags=re.I):
+    elif "compound" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[1], window=2))):
         return -1
-    elif re.search(ltp(compound_indications), get_text_between(c), flags=re.I):
+    elif "compound" in found_keywords(c, window_keywords, get_text_between(c)):
         return -1
     else:
         return 0
 
 def LF_GiG_UPREGULATES(c):
-    if re.search(ltp(upregulates_identifiers), " ".join(get_right_tokens(c[0], window=2)), flags=re.I):
+    if "upregulates" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[0], window=2))):
         return -1
-    elif re.search(ltp(upregulates_identifiers), " ".join(get_right_tokens(c[1], window=2)), flags=re.I):
+    elif "upregulates" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[1], window=2))):
         return -1
-    elif re.search(ltp(upregulates_identifiers), get_text_between(c), flags=re.I):
+    elif "upregulates" in found_keywords(c, window_keywords, get_text_between(c)):
         return -1
     else:
         return 0
 
 def LF_GiG_DOWNREGULATES(c):
-    if re.search(ltp(downregulates_identifiers), " ".join(get_right_tokens(c[0], window=2)), flags=re.I):
+    if "downregulates" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[0], window=2))):
         return -1
-    elif re.search(ltp(downregulates_identifiers), " ".join(get_right_tokens(c[1], window=2)), flags=re.I):
+    elif "downregulates" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[1], window=2))):
         return -1
-    elif re.search(ltp(downregulates_identifiers), get_text_between(c), flags=re.I):
+    elif "downregulates" in found_keywords(c, window_keywords, get_text_between(c)):
         return -1
     else:
         return 0
@@ -235,17 +264,17 @@ def LF_GiG_DOWNREGULATES(c):
 def LF_GiG_REGULATION(c):
     if LF_GiG_UPREGULATES(c) or LF_GiG_DOWNREGULATES(c):
         return -1
-    elif re.search(ltp(regulation_identifiers), get_text_between(c), flags=re.I):
+    elif "regulation" in found_keywords(c, window_keywords, get_text_between(c)):
         return -1
     else:
         return 0
 
 def LF_GiG_ASSOCIATION(c):
-    if re.search(ltp(association_identifiers), " ".join(get_right_tokens(c[0], window=2)), flags=re.I):
+    if "association" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[0], window=2))):
         return -1
-    elif re.search(ltp(association_identifiers), " ".join(get_right_tokens(c[1], window=2)), flags=re.I):
+    elif "association" in found_keywords(c, window_keywords, " ".join(get_right_tokens(c[1], window=2))):
         return -1
-    elif re.search(ltp(association_identifiers), get_text_between(c), flags=re.I):
+    elif "association" in found_keywords(c, window_keywords, get_text_between(c)):
         return -1
     else:
         return 0
@@ -254,9 +283,9 @@ def LF_GiG_BOUND_IDENTIFIERS(c):
     cand1_text = " ".join(list(get_left_tokens(c[0], window=5)) + list(get_right_tokens(c[0], window=5)))
     cand2_text = " ".join(list(get_left_tokens(c[1], window=5)) + list(get_right_tokens(c[1], window=5)))
 
-    if re.search(ltp(bound_identifiers), cand1_text, flags=re.I):
+    if "bound" in found_keywords(c, window_keywords, cand1_text):
         return 1
-    elif re.search(ltp(bound_identifiers), cand2_text, flags=re.I):
+    elif "bound" in found_keywords(c, window_keywords, cand2_text):
         return 1
     else:
         return 0
@@ -265,31 +294,34 @@ def LF_GiG_GENE_IDENTIFIERS(c):
     cand1_text = " ".join(list(get_left_tokens(c[0], window=5)) + list(get_right_tokens(c[0], window=5)))
     cand2_text = " ".join(list(get_left_tokens(c[1], window=5)) + list(get_right_tokens(c[1], window=5)))
 
-    if re.search(ltp(gene_identifiers), cand1_text, flags=re.I):
+    if "gene" in found_keywords(c, window_keywords, cand1_text):
         return 1
-    elif re.search(ltp(gene_identifiers), cand2_text, flags=re.I):
+    elif "gene" in found_keywords(c, window_keywords, cand2_text):
         return 1
     else:
         return 0
 
 def LF_GiG_GENE_ADJECTIVE(c):
-    if "-" in c[0].get_span() and re.search(ltp(gene_adjective), c[0].get_span(), flags=re.I):
+    if "-" in c[0].get_span() and "gene_adjective" in found_keywords(c, mention_keywords, c[0].get_span()):
         return -1
-    elif "-" in c[1].get_span() and re.search(ltp(gene_adjective), c[1].get_span(), flags=re.I):
+    elif "-" in c[1].get_span() and "gene_adjective" in found_keywords(c, mention_keywords, c[1].get_span()):
         return -1
     return 0
 
 def LF_GiG_DIAGNOSIS_IDENTIFIERS(c):
-    if re.search(ltp(diagnosis_indication), get_text_between(c), flags=re.I):
+    if "diagnosis" in found_keywords(c, window_keywords, get_text_between(c)):
         return -1
     else:
         return 0
 
+def starts_with_method_desc(sentence):
+    # The first 20 words of a sentence are the same for all of its candidates
+    return "method" in method_keywords.found(" ".join(sentence.words[0:20]))
+
 def LF_GiG_METHOD_DESC(c):
-    sentence_tokens = " ".join(c.get_parent().words[0:20])
-    if re.search(ltp(method_indication), sentence_tokens, flags=re.I):
+    if sentence_feature(c, "method_desc_start", starts_with_method_desc):
         return -1
-    elif re.search(ltp(method_indication), " ".join(get_between_tokens(c)), flags=re.I):
+    elif "method" in found_keywords(c, method_keywords, " ".join(get_between_tokens(c))):
         return -1
     else:
         return 0
@@ -361,6 +393,7 @@ def LF_GG_ALLOWED_DISTANCE(c):
         LF_GG_DISTANCE_SHORT(c)
         ]) else 1
 
+@sentence_level
 def LF_GG_NO_VERB(c):
     if len([x for x in  c.get_parent().pos_tags if "VB" in x and x != "VBG"]) == 0:
         return -1
@@ -369,81 +402,98 @@ def LF_GG_NO_VERB(c):
 """
 Bi-Clustering LFs
 """
-path = pathlib.Path(__file__).joinpath("../../../../../dependency_cluster/gene_gene_bicluster_results.tsv.xz").resolve()
-bicluster_dep_df = pd.read_table(path)
-binding_base = set([tuple(x) for x in bicluster_dep_df.query("B>0")[["pubmed_id", "sentence_num"]].values])
-enhances_base = set([tuple(x) for x in bicluster_dep_df.query("W>0")[["pubmed_id", "sentence_num"]].values])
-activates_base = set([tuple(x) for x in bicluster_dep_df[bicluster_dep_df["V+"]>0][["pubmed_id", "sentence_num"]].values])
-increases_expression_base = set([tuple(x) for x in bicluster_dep_df[bicluster_dep_df["E+"]>0][["pubmed_id", "sentence_num"]].values])
-affects_expression_base = set([tuple(x) for x in bicluster_dep_df.query("E>0")[["pubmed_id", "sentence_num"]].values])
-signaling_base = set([tuple(x) for x in bicluster_dep_df.query("I>0")[["pubmed_id", "sentence_num"]].values])
-identical_protein_base = set([tuple(x) for x in bicluster_dep_df.query("H>0")[["pubmed_id", "sentence_num"]].values])
-regulation_base = set([tuple(x) for x in bicluster_dep_df.query("Rg>0")[["pubmed_id", "sentence_num"]].values])
-cell_production_base = set([tuple(x) for x in bicluster_dep_df.query("Q>0")[["pubmed_id", "sentence_num"]].values])
-
+bicluster_index = BiclusterIndex()
+binding_theme = theme_bit("gene_gene", "B")
+enhances_theme = theme_bit("gene_gene", "W")
+activates_theme = theme_bit("gene_gene", "V+")
+increases_expression_theme = theme_bit("gene_gene", "E+")
+affects_expression_theme = theme_bit("gene_gene", "E")
+signaling_theme = theme_bit("gene_gene", "I")
+identical_protein_theme = theme_bit("gene_gene", "H")
+regulation_theme = theme_bit("gene_gene", "Rg")
+cell_production_theme = theme_bit("gene_gene", "Q")
+
+@sentence_level
 def LF_GG_BICLUSTER_BINDING(c):
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in binding_base:
+    if bicluster_mask(c, bicluster_index) & binding_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_GG_BICLUSTER_ENHANCES(c):
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in enhances_base:
+    if bicluster_mask(c, bicluster_index) & enhances_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_GG_BICLUSTER_ACTIVATES(c):
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in activates_base:
+    if bicluster_mask(c, bicluster_index) & activates_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_GG_BICLUSTER_INCREASES_EXPRESSION(c):
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in increases_expression_base:
+    if bicluster_mask(c, bicluster_index) & increases_expression_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_GG_BICLUSTER_AFFECTS_EXPRESSION(c):
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in affects_expression_base:
+    if bicluster_mask(c, bicluster_index) & affects_expression_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_GG_BICLUSTER_SIGNALING(c):
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in signaling_base:
+    if bicluster_mask(c, bicluster_index) & signaling_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_GG_BICLUSTER_IDENTICAL_PROTEIN(c):
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in identical_protein_base:
+    if bicluster_mask(c, bicluster_index) & identical_protein_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_GG_BICLUSTER_REGULATION(c):
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in regulation_base:
+    if bicluster_mask(c, bicluster_index) & regulation_theme:
         return 1
     return 0
 
+@sentence_level
 def LF_GG_BICLUSTER_CELL_PRODUCTION(c):
-    sen_pos = c.get_parent().position
-    pubmed_id = int(c.get_parent().document.name)
-    if (pubmed_id, sen_pos) in cell_production_base:
+    if bicluster_mask(c, bicluster_index) & cell_production_theme:
         return 1
     return 0
 
+# The theme of every bicluster label function
+bicluster_columns = OrderedDict([
+    ("LF_GG_BICLUSTER_BINDING", binding_theme),
+    ("LF_GG_BICLUSTER_ENHANCES", enhances_theme),
+    ("LF_GG_BICLUSTER_ACTIVATES", activates_theme),
+    ("LF_GG_BICLUSTER_INCREASES_EXPRESSION", increases_expression_theme),
+    ("LF_GG_BICLUSTER_AFFECTS_EXPRESSION", affects_expression_theme),
+    ("LF_GG_BICLUSTER_SIGNALING", signaling_theme),
+    ("LF_GG_BICLUSTER_IDENTICAL_PROTEIN", identical_protein_theme),
+    ("LF_GG_BICLUSTER_REGULATION", regulation_theme),
+    ("LF_GG_BICLUSTER_CELL_PRODUCTION", cell_production_theme),
+])
+
+
+def label_bicluster_block(pubmed_ids, sentence_nums, lf_names=None):
+    """
+    Run the bicluster label functions on whole arrays of candidates at once
+
+    pubmed_ids - an array of the pubmed ids of the candidates' documents (c.get_parent().document.name)
+    sentence_nums - an array of the candidates' sentence positions in the same order (c.get_parent().position)
+    lf_names - the label functions to run (defaults to every one in bicluster_columns)
+
+    returns a (candidates x label functions) numpy matrix
+    """
+    lf_names = list(bicluster_columns) if lf_names is None else lf_names
+    return bicluster_index.label_block(pubmed_ids, sentence_nums, [bicluster_columns[name] for name in lf_names])
+
 
 GG_LFS = {
     "GiG":OrderedDict({
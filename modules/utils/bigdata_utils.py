@@ -1,10 +1,14 @@
 from collections import defaultdict
 import csv
+import multiprocessing as mp
 import os
 from itertools import product
+import numpy as np
 import pandas as pd
+import shelve
 from string import punctuation
 import sys
+import traceback
 
 import lxml.etree as et
 from snorkel.parser import DocPreprocessor
@@ -38,6 +42,262 @@ def offsets_to_token(left, right, offset_array, lemmas, punc=set(punctuation)):
     return range(token_start, token_end)
 
 
+def offsets_to_tokens(lefts, rights, offset_array, punc_mask):
+    """Vectorized version of offsets_to_token
+
+    Maps every tag that falls within a sentence onto its token range in one step.
+    Gives the same ranges as calling offsets_to_token on each tag.
+
+    Keyword arguments:
+    lefts - numpy array containing the start of each tag
+    rights - numpy array containing the end of each tag
+    offset_array - sorted numpy array of offsets given by stanford corenlp
+    punc_mask - boolean numpy array that is true when a token's lemma is punctuation
+
+    Returns:
+    Two numpy arrays that hold the first token and the stopping token of each tag
+    """
+    token_start = np.searchsorted(offset_array, lefts, side='right') - 1
+    token_end = np.searchsorted(offset_array, rights, side='right')
+    token_end = np.where(token_end >= len(offset_array), len(offset_array) - 1, token_end)
+    token_end = token_end - punc_mask[token_end - 1]
+    return token_start, token_end
+
+
+class TagIndex(object):
+    """Precomputed per document tag structure
+    Holds every pubtator tag in flat arrays sorted by pubmed id and then by tag start.
+    Each document owns the slice doc_ptr[i]:doc_ptr[i+1], which allows
+    the tags that fall in a sentence to be found via binary search
+    instead of scanning a dataframe group for every sentence.
+    """
+    columns = ['doc_ids', 'doc_ptr', 'starts', 'ends', 'ranks', 'type_codes', 'cid_codes']
+    vocabularies = ['types', 'cids']
+
+    def __init__(self, doc_ids, doc_ptr, starts, ends, ranks, type_codes, types, cid_codes, cids):
+        """Initialize the TagIndex class
+
+        Keyword arguments:
+        doc_ids - sorted array of unique pubmed ids
+        doc_ptr - array of len(doc_ids) + 1 pointers into the tag arrays
+        starts - the start offset of each tag
+        ends - the end offset of each tag
+        ranks - the position of each tag in its document as given by the original tag file
+        type_codes - the dictionary code of each tag's entity type
+        types - the entity types the type codes point to
+        cid_codes - the dictionary code of each tag's identifier
+        cids - the identifiers the cid codes point to
+        """
+        self.doc_ids = doc_ids
+        self.doc_ptr = doc_ptr
+        self.starts = starts
+        self.ends = ends
+        self.ranks = ranks
+        self.type_codes = type_codes
+        self.types = types
+        self.cid_codes = cid_codes
+        self.cids = cids
+
+    @classmethod
+    def from_arrays(cls, pubmed_ids, starts, ends, type_codes, types, cid_codes, cids):
+        """Build the index from tag columns given in tag file order
+
+        Keyword arguments:
+        pubmed_ids - the pubmed id of each tag
+        starts - the start offset of each tag
+        ends - the end offset of each tag
+        type_codes - the dictionary code of each tag's entity type
+        types - the entity types the type codes point to
+        cid_codes - the dictionary code of each tag's identifier
+        cids - the identifiers the cid codes point to
+
+        Returns:
+        A TagIndex object
+        """
+        pubmed_ids = np.asarray(pubmed_ids, dtype=np.int64)
+        starts = np.asarray(starts, dtype=np.int32)
+
+        # position of each tag within its document in file order
+        file_order = np.argsort(pubmed_ids, kind='mergesort')
+        sorted_ids = pubmed_ids[file_order]
+        ranks = np.empty(len(pubmed_ids), dtype=np.int32)
+        ranks[file_order] = np.arange(len(pubmed_ids)) - np.searchsorted(sorted_ids, sorted_ids, side='left')
+
+        # lexsort uses the last key as the primary key and is stable
+        order = np.lexsort((ranks, starts, pubmed_ids))
+        pubmed_ids = pubmed_ids[order]
+        doc_ids, doc_starts = np.unique(pubmed_ids, return_index=True)
+        doc_ptr = np.append(doc_starts, len(pubmed_ids)).astype(np.int64)
+
+        return cls(
+            doc_ids, doc_ptr, starts[order],
+            np.asarray(ends, dtype=np.int32)[order], ranks[order],
+            np.asarray(type_codes, dtype=np.int16)[order], np.asarray(types, dtype=object),
+            np.asarray(cid_codes, dtype=np.int32)[order], np.asarray(cids, dtype=object)
+        )
+
+    @classmethod
+    def from_dataframe(cls, tag_df):
+        """Build the index from the pubtator tag table
+
+        Keyword arguments:
+        tag_df - a dataframe with pubmed_id, offset, end, type and identifier columns
+
+        Returns:
+        A TagIndex object
+        """
+        type_codes, types = pd.factorize(tag_df['type'])
+        cid_codes, cids = pd.factorize(tag_df['identifier'])
+        return cls.from_arrays(
+            tag_df['pubmed_id'].values, tag_df['offset'].values, tag_df['end'].values,
+            type_codes, types, cid_codes, cids
+        )
+
+    @classmethod
+    def from_shelve(cls, shelve_file, fields={'start': 'Offset', 'end': 'End', 'type': 'Type', 'cid': 'ID'}):
+        """Build the index from a shelve of per document tag lists
+
+        Keyword arguments:
+        shelve_file - the name of the shelve (i.e. epilepsy_tags_shelve)
+        fields - maps start, end, type and cid to the keys of each tag dict
+
+        Returns:
+        A TagIndex object
+        """
+        columns = defaultdict(list)
+        type_dict, cid_dict = {}, {}
+
+        annt_dict = shelve.open(shelve_file, flag='r')
+        try:
+            for pubmed_id in annt_dict:
+                for tag in annt_dict[pubmed_id]:
+                    columns['pubmed_ids'].append(int(pubmed_id))
+                    columns['starts'].append(int(tag[fields['start']]))
+                    columns['ends'].append(int(tag[fields['end']]))
+                    columns['type_codes'].append(type_dict.setdefault(str(tag[fields['type']]), len(type_dict)))
+                    columns['cid_codes'].append(cid_dict.setdefault(str(tag[fields['cid']]), len(cid_dict)))
+        finally:
+            annt_dict.close()
+
+        return cls.from_arrays(
+            columns['pubmed_ids'], columns['starts'], columns['ends'],
+            columns['type_codes'], list(type_dict), columns['cid_codes'], list(cid_dict)
+        )
+
+    def save(self, directory):
+        """Write the index as a columnar store of .npy files
+
+        Keyword arguments:
+        directory - the folder that will hold the store
+        """
+        os.makedirs(directory, exist_ok=True)
+        for column in self.columns:
+            np.save(os.path.join(directory, column + '.npy'), getattr(self, column))
+
+        # dictionaries are small so store them as fixed width strings
+        for column in self.vocabularies:
+            np.save(os.path.join(directory, column + '.npy'), np.array(getattr(self, column), dtype=str))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Open a columnar store written by save
+
+        The tag columns are memory mapped, so opening the store is nearly free
+        and worker processes share the same pages.
+
+        Keyword arguments:
+        directory - the folder that holds the store
+        mmap_mode - the numpy memory map mode (None reads everything into memory)
+
+        Returns:
+        A TagIndex object
+        """
+        arrays = {
+            column: np.load(os.path.join(directory, column + '.npy'), mmap_mode=mmap_mode)
+            for column in cls.columns
+        }
+        for column in cls.vocabularies:
+            arrays[column] = np.array(np.load(os.path.join(directory, column + '.npy')).tolist(), dtype=object)
+        return cls(**arrays)
+
+    def __contains__(self, pubmed_id):
+        """Check if a document has any tags
+
+        Keyword arguments:
+        pubmed_id - the pubmed id of the document
+        """
+        pos = np.searchsorted(self.doc_ids, int(pubmed_id))
+        return pos < len(self.doc_ids) and self.doc_ids[pos] == int(pubmed_id)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def lookup(self, pubmed_id, sent_start, sent_end):
+        """Find the tags that start within a sentence
+
+        Keyword arguments:
+        pubmed_id - the pubmed id of the document
+        sent_start - the character offset where the sentence starts
+        sent_end - the character offset where the sentence ends
+
+        Returns:
+        An array of tag positions in the order they appear in the tag file
+        """
+        pos = np.searchsorted(self.doc_ids, int(pubmed_id))
+        if pos >= len(self.doc_ids) or self.doc_ids[pos] != int(pubmed_id):
+            return np.empty(0, dtype=np.int64)
+
+        doc_start, doc_end = self.doc_ptr[pos], self.doc_ptr[pos + 1]
+        doc_starts = self.starts[doc_start:doc_end]
+        lo = np.searchsorted(doc_starts, sent_start, side='left')
+        hi = np.searchsorted(doc_starts, sent_end, side='right')
+
+        # Later tags overwrite earlier ones so keep the original tag order
+        tags = np.arange(doc_start + lo, doc_start + hi)
+        return tags[np.argsort(self.ranks[tags], kind='mergesort')]
+
+
+def build_tag_store(tag_file, directory, chunksize=int(1e6)):
+    """Convert the pubtator tag file into a columnar TagIndex store
+
+    The file is read in chunks and the type and identifier columns are
+    dictionary encoded as they come in, so the full table never has to
+    sit in memory as a dataframe.
+
+    Keyword arguments:
+    tag_file - the path or url of the tag file (i.e. pubtator-hetnet-tags.tsv.xz)
+    directory - the folder that will hold the store
+    chunksize - the number of rows to read at a time
+
+    Returns:
+    A TagIndex object that points to the new store
+    """
+    columns = defaultdict(list)
+    type_dict, cid_dict = {}, {}
+
+    for chunk in pd.read_table(
+        tag_file, usecols=['pubmed_id', 'offset', 'end', 'type', 'identifier'],
+        dtype={'type': str, 'identifier': str}, chunksize=chunksize
+    ):
+        columns['pubmed_ids'].append(chunk['pubmed_id'].values.astype(np.int64))
+        columns['starts'].append(chunk['offset'].values.astype(np.int32))
+        columns['ends'].append(chunk['end'].values.astype(np.int32))
+        columns['type_codes'].append(
+            np.array([type_dict.setdefault(value, len(type_dict)) for value in chunk['type']], dtype=np.int16)
+        )
+        columns['cid_codes'].append(
+            np.array([cid_dict.setdefault(value, len(cid_dict)) for value in chunk['identifier']], dtype=np.int32)
+        )
+
+    tag_index = TagIndex.from_arrays(
+        np.concatenate(columns['pubmed_ids']), np.concatenate(columns['starts']),
+        np.concatenate(columns['ends']), np.concatenate(columns['type_codes']), list(type_dict),
+        np.concatenate(columns['cid_codes']), list(cid_dict)
+    )
+    tag_index.save(directory)
+    return TagIndex.load(directory)
+
+
 class Tagger(object):
     """Custom Tagger Class
     This is a custom class that is designed to tag each relevant word
@@ -45,14 +305,22 @@ class Tagger(object):
     i.e if it sees GAD then this tagger will give GAD a Gene tag.
     """
 
-    def __init__(self, filter_df):
+    def __init__(self, filter_df, punc=set(punctuation)):
         """ Initialize the tagger class
 
         Keyword arguments:
         self -- the class object
-        filter_df -- a pandas group object for quick indexing
+        filter_df -- a TagIndex (i.e. TagIndex.load of a tag store), the tag dataframe
+            or a pandas group object of the dataframe
+        punc -- a list of punctuation characters
         """
-        self.annt_df = filter_df
+        if hasattr(filter_df, 'lookup'):
+            self.tag_index = filter_df
+        elif isinstance(filter_df, pd.core.groupby.DataFrameGroupBy):
+            self.tag_index = TagIndex.from_dataframe(filter_df.obj)
+        else:
+            self.tag_index = TagIndex.from_dataframe(filter_df)
+        self.punc = punc
 
     def tag(self, parts):
         """Tag each Sentence
@@ -68,25 +336,206 @@ class Tagger(object):
         pubmed_id, _, _, sent_start, sent_end = parts['stable_id'].split(':')
         sent_start, sent_end = int(sent_start), int(sent_end)
 
-        # For each tag in the given document
-        # assign it to the correct word and move on
-        # if int(pubmed_id) not in self.annt_df['pubmed_id']:
-        #    return parts
-        try:
-            for index, tag in self.annt_df.get_group(int(pubmed_id)).iterrows():
-                if not (sent_start <= int(tag['offset']) <= sent_end):
+        # Grab every tag that starts in this sentence
+        tags = self.tag_index.lookup(pubmed_id, sent_start, sent_end)
+        if len(tags) == 0:
+            return parts
+
+        offsets = np.asarray(parts['char_offsets']) + sent_start
+        punc_mask = np.array([lemma in self.punc for lemma in parts['lemmas']], dtype=np.int64)
+        token_start, token_end = offsets_to_tokens(
+            self.tag_index.starts[tags], self.tag_index.ends[tags],
+            offsets, punc_mask
+        )
+
+        # assign each tag to the correct words and move on
+        for tag, start, end in zip(tags, token_start, token_end):
+            entity_type = self.tag_index.types[self.tag_index.type_codes[tag]]
+            entity_cid = self.tag_index.cids[self.tag_index.cid_codes[tag]]
+            for tok in range(start, end):
+                parts['entity_types'][tok] = entity_type
+                parts['entity_cids'][tok] = entity_cid
+
+        return parts
+
+
+def _find_tag(f, position, tag, chunk_size=1 << 20):
+    """Find the first occurrence of a tag at or after a byte position
+
+    Keyword arguments:
+    f - a file object opened in binary mode
+    position - the byte position to start searching from
+    tag - the byte string to search for
+    chunk_size - the number of bytes to read at a time
+
+    Returns:
+    The byte position of the tag or None if the tag isn't found
+    """
+    f.seek(position)
+    carry = b''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return None
+        buffer = carry + chunk
+        index = buffer.find(tag)
+        if index != -1:
+            return position - len(carry) + index
+        carry = buffer[-(len(tag) - 1):]
+        position += len(chunk)
+
+
+def _rfind_tag(f, file_size, tag, chunk_size=1 << 20):
+    """Find the last occurrence of a tag in a file
+
+    Keyword arguments:
+    f - a file object opened in binary mode
+    file_size - the size of the file in bytes
+    tag - the byte string to search for
+    chunk_size - the number of bytes to read at a time
+
+    Returns:
+    The byte position of the tag or None if the tag isn't found
+    """
+    end = file_size
+    carry = b''
+    while end > 0:
+        start = max(0, end - chunk_size)
+        f.seek(start)
+        buffer = f.read(end - start) + carry
+        index = buffer.rfind(tag)
+        if index != -1:
+            return start + index
+        carry = buffer[:len(tag) - 1]
+        end = start
+    return None
+
+
+def find_document_shards(path, num_shards, start=0, start_tag=b'<document>', end_tag=b'</document>'):
+    """Split a multi document xml file into byte ranges
+
+    Every range starts on a document tag and the last range stops
+    after the last closing document tag, so each range
+    only contains whole documents.
+
+    Keyword arguments:
+    path - the path of the xml file
+    num_shards - the number of ranges to aim for
+    start - the byte position to split from (i.e. where a previous run stopped)
+    start_tag - the tag that opens a document
+    end_tag - the tag that closes a document
+
+    Returns:
+    A list of (start, end) byte ranges in file order
+    """
+    file_size = os.path.getsize(path)
+    boundaries = []
+
+    with open(path, 'rb') as f:
+        for shard in range(num_shards):
+            position = _find_tag(f, start + (file_size - start) * shard // num_shards, start_tag)
+            if position is None:
+                break
+            if not boundaries or position > boundaries[-1]:
+                boundaries.append(position)
+
+        last_tag = _rfind_tag(f, file_size, end_tag)
+
+    if not boundaries or last_tag is None:
+        return []
+
+    return list(zip(boundaries, boundaries[1:] + [last_tag + len(end_tag)]))
+
+
+class ShardReader(object):
+    """File like object that exposes a byte range of an xml file
+    as its own xml document. The range is wrapped with a
+    dummy root tag so lxml can parse it independently.
+    """
+
+    def __init__(self, path, start, end, root=b'shard'):
+        """Initialize the ShardReader class
+
+        Keyword arguments:
+        path - the path of the xml file
+        start - the byte position where the range starts
+        end - the byte position where the range stops
+        root - the name of the dummy root tag
+        """
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.remaining = end - start
+        self.prefix = b'<' + root + b'>'
+        self.suffix = b'</' + root + b'>'
+
+    def read(self, size=-1):
+        """Read the next block of bytes
+
+        Keyword arguments:
+        size - the max number of bytes to return
+        """
+        if self.prefix:
+            data, self.prefix = self.prefix, b''
+            return data
+
+        if self.remaining > 0:
+            size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+            data = self.file.read(size)
+            self.remaining -= len(data)
+            if data:
+                return data
+            self.remaining = 0
+
+        data, self.suffix = self.suffix, b''
+        if not data:
+            self.file.close()
+        return data
+
+
+def _parse_document_shards(path, shards, id_xpath, text_xpath, tag_filter, skip_ids, out_queue, batch_size):
+    """Parse a list of shards and send the documents back to the main process
+
+    Runs in a worker process. Each shard is sent as a sequence of batches
+    followed by None, so the main process knows when to move onto the next shard.
+    If the worker fails the traceback is sent instead.
+
+    Keyword arguments:
+    path - the path of the xml file
+    shards - the (start, end) byte ranges this worker is responsible for
+    id_xpath - the xpath for grabbing the id of a document
+    text_xpath - the xpath for grabbing the text of a document
+    tag_filter - the set of pubmed ids to keep
+    skip_ids - the set of pubmed ids that have already been parsed
+    out_queue - the bounded queue that connects this worker to the main process
+    batch_size - the number of documents to send at once
+    """
+    try:
+        for start, end in shards:
+            batch = []
+            for event, doc in et.iterparse(ShardReader(path, start, end), tag='document'):
+                doc_id = str(doc.xpath(id_xpath)[0])
+
+                if int(doc_id) not in tag_filter or int(doc_id) in skip_ids:
+                    doc.clear()
                     continue
 
-                offsets = [offset + sent_start for offset in parts['char_offsets']]
-                toks = offsets_to_token(int(tag['offset']), int(tag['end']), offsets, parts['lemmas'])
-                for tok in toks:
-                    parts['entity_types'][tok] = tag['type']
-                    parts['entity_cids'][tok] = tag['identifier']
+                text = '\n'.join(filter(lambda t: t is not None, doc.xpath(text_xpath)))
 
-            return parts
+                # guarentees that resources are freed after they have been used
+                doc.clear()
+                if not(text):
+                    continue
 
-        except KeyError as e:
-            return parts
+                batch.append((doc_id, text))
+                if len(batch) >= batch_size:
+                    out_queue.put(batch)
+                    batch = []
+
+            out_queue.put(batch)
+            out_queue.put(None)
+
+    except Exception:
+        out_queue.put(traceback.format_exc())
 
 
 class XMLMultiDocPreprocessor(DocPreprocessor):
@@ -94,7 +543,11 @@ class XMLMultiDocPreprocessor(DocPreprocessor):
         Fixes the main issue where crashes if GB files are introduced
         et.iterparse for the win in memory efficiency
     """
-    def __init__(self, path, doc='.//document', text='./text/text()', id='./id/text()', tag_filter=None):
+    def __init__(
+        self, path, doc='.//document', text='./text/text()', id='./id/text()', tag_filter=None,
+        skip_ids=None, num_workers=1, shards_per_worker=4, queue_size=8, batch_size=500,
+        start_offset=0, shard_size=64 * 1024 ** 2
+    ):
         """Initialize the XMLMultiDocPreprocessor Class
 
         Keyword Arguments:
@@ -102,42 +555,155 @@ class XMLMultiDocPreprocessor(DocPreprocessor):
         doc - the xpath notation for document obejcts
         test - the xpath for grabbing all the text objects
         id - the xpath for grabbing all the id tags
+        tag_filter - the set of pubmed ids to keep (a TagIndex can be used as well)
+        skip_ids - the set of pubmed ids to skip, because they have already been parsed
+        num_workers - the number of processes that parse the xml file (1 means no sharding)
+        shards_per_worker - the number of byte ranges each worker parses
+        queue_size - the max number of batches a worker can have waiting
+        batch_size - the number of documents a worker sends at once
+        start_offset - the byte position of the first document to read (see resume_ingestion)
+        shard_size - the most bytes in a shard, which is how far back a resumed run has to start
         """
         DocPreprocessor.__init__(self, path)
         self.doc = doc
         self.text = text
         self.id = id
         self.tag_filter = tag_filter
+        self.skip_ids = set() if skip_ids is None else skip_ids
+        self.num_workers = num_workers
+        self.shards_per_worker = shards_per_worker
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.start_offset = start_offset
+        self.shard_size = shard_size
+
+    def generate_with_offsets(self):
+        """Same as generate, but every document comes with the byte position
+        of the shard it was read from. Reading again from that position
+        gets the document back, which is what the ingestion checkpoints store.
+
+        Yields:
+        (Document, text, byte position) tuples
+        """
+        for fp in self._get_files(self.path):
+            if self._can_read(fp):
+                for document in self.iter_documents(fp, os.path.basename(fp)):
+                    yield document
 
     def parse_file(self, f, file_name):
         """This method overrides the original method
 
         Keyword arguments:
-        f - the file object to be parsed by lxml
+        f - the path of the xml file to be parsed by lxml
         file_name - the name of the file used as metadata
 
         Yields:
         A document object in sqlalchemy format and the corresponding text
         that will be parsed by CoreNLP
         """
+        for document, text, position in self.iter_documents(f, file_name):
+            yield document, text
+
+    def find_shards(self, f, min_shards=1):
+        """Split the file into shards of at most shard_size bytes from start_offset on
+
+        Keyword arguments:
+        f - the path of the xml file
+        min_shards - the fewest shards to split the file into
+        """
+        remaining = max(os.path.getsize(f) - self.start_offset, 0)
+        num_shards = max(min_shards, -(-remaining // self.shard_size), 1)
+        return find_document_shards(f, num_shards, start=self.start_offset)
 
-        for event, doc in et.iterparse(f, tag='document'):
-            doc_id = str(doc.xpath(self.id)[0])
+    def iter_documents(self, f, file_name):
+        """Read the documents of the xml file one shard at a time
 
-            if int(doc_id) not in self.tag_filter:
+        Keyword arguments:
+        f - the path of the xml file
+        file_name - the name of the file used as metadata
+
+        Yields:
+        A document object in sqlalchemy format, the corresponding text
+        and the byte position of its shard
+        """
+        if self.num_workers > 1:
+            for document in self.parse_file_sharded(f, file_name):
+                yield document
+            return
+
+        for start, end in self.find_shards(f):
+            for event, doc in et.iterparse(ShardReader(f, start, end), tag='document'):
+                doc_id = str(doc.xpath(self.id)[0])
+
+                if int(doc_id) not in self.tag_filter or int(doc_id) in self.skip_ids:
+                    doc.clear()
+                    continue
+
+                text = '\n'.join(filter(lambda t: t is not None, doc.xpath(self.text)))
+
+                # guarentees that resources are freed after they have been used
                 doc.clear()
-                continue
+                meta = {'file_name': str(file_name)}
+                stable_id = self.get_stable_id(doc_id)
+                if not(text):
+                    continue
+
+                yield Document(name=doc_id, stable_id=stable_id, meta=meta), text, start
+
+    def parse_file_sharded(self, f, file_name):
+        """Parse the xml file with multiple processes
 
-            text = '\n'.join(filter(lambda t: t is not None, doc.xpath(self.text)))
+        The file is split into byte ranges at document boundaries.
+        Shard i is handled by worker i % num_workers, and every worker
+        has its own bounded queue, so documents are yielded in file order
+        and a worker that gets too far ahead waits for the main process.
+
+        Keyword arguments:
+        f - the path of the xml file
+        file_name - the name of the file used as metadata
+
+        Yields:
+        A document object in sqlalchemy format, the corresponding text
+        and the byte position of its shard
+        """
+        shards = self.find_shards(f, self.num_workers * self.shards_per_worker)
+        num_workers = min(self.num_workers, len(shards))
+        queues = [mp.Queue(maxsize=self.queue_size) for worker in range(num_workers)]
+        workers = [
+            mp.Process(
+                target=_parse_document_shards,
+                args=(
+                    f, shards[worker::num_workers], self.id, self.text,
+                    self.tag_filter, self.skip_ids, queues[worker], self.batch_size
+                ),
+                daemon=True
+            )
+            for worker in range(num_workers)
+        ]
+
+        for worker in workers:
+            worker.start()
+
+        try:
+            for shard_index in range(len(shards)):
+                shard_queue = queues[shard_index % num_workers]
+                while True:
+                    batch = shard_queue.get()
+                    if batch is None:
+                        break
 
-            # guarentees that resources are freed after they have been used
-            doc.clear()
-            meta = {'file_name': str(file_name)}
-            stable_id = self.get_stable_id(doc_id)
-            if not(text):
-                continue
+                    if isinstance(batch, str):
+                        raise RuntimeError("Worker failed on shard {}:\n{}".format(shard_index, batch))
 
-            yield Document(name=doc_id, stable_id=stable_id, meta=meta), text
+                    for doc_id, text in batch:
+                        meta = {'file_name': str(file_name)}
+                        stable_id = self.get_stable_id(doc_id)
+                        yield Document(name=doc_id, stable_id=stable_id, meta=meta), text, shards[shard_index][0]
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
 
     def _can_read(self, fpath):
         """ Straight forward function
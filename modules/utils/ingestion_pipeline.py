@@ -0,0 +1,396 @@
+from functools import partial
+import multiprocessing as mp
+import threading
+import time
+import traceback
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class StageCounter(object):
+    """Throughput counter for one stage of the ingestion pipeline
+    The counts live in shared memory, so every worker process
+    adds to the same numbers.
+    """
+
+    def __init__(self, name):
+        """Initialize the StageCounter class
+
+        Keyword arguments:
+        name - the name of the stage (i.e. read, parse or write)
+        """
+        self.name = name
+        self.lock = mp.Lock()
+        self.items = mp.Value('q', 0, lock=False)
+        self.chars = mp.Value('q', 0, lock=False)
+        self.busy = mp.Value('d', 0.0, lock=False)
+        self.blocked = mp.Value('d', 0.0, lock=False)
+
+    def add(self, items=0, chars=0, busy=0.0, blocked=0.0):
+        """Add to the counters
+
+        Keyword arguments:
+        items - the number of documents the stage finished
+        chars - the number of characters in those documents
+        busy - the seconds spent doing the work
+        blocked - the seconds spent waiting on the queue
+        """
+        with self.lock:
+            self.items.value += items
+            self.chars.value += chars
+            self.busy.value += busy
+            self.blocked.value += blocked
+
+    def snapshot(self):
+        """Grab a consistent copy of the counters
+
+        Returns:
+        A dictionary of the counter values
+        """
+        with self.lock:
+            return {
+                'items': self.items.value, 'chars': self.chars.value,
+                'busy': self.busy.value, 'blocked': self.blocked.value
+            }
+
+
+class DocumentQueue(object):
+    """Bounded queue that sits between the xml reader and the parse workers
+    The producer blocks once either the number of queued documents or the
+    size of their text hits its limit, which keeps a fast reader from
+    piling up documents that the parsers can't keep up with.
+    """
+
+    def __init__(self, max_documents=1000, memory_limit=256 * 1024 ** 2):
+        """Initialize the DocumentQueue class
+
+        Keyword arguments:
+        max_documents - the most documents that can wait in the queue
+        memory_limit - the most characters of document text that can wait in the queue
+        """
+        self.queue = mp.Queue(maxsize=max_documents)
+        self.memory_limit = memory_limit
+        self.num_chars = mp.Value('q', 0, lock=False)
+        self.space = mp.Condition()
+
+    def put(self, item, size, seq=None, timeout=1):
+        """Add a document to the queue
+
+        A single document larger than the memory limit is still let through
+        once the queue is empty.
+
+        Keyword arguments:
+        item - the (Document, text) pair or None to stop a worker
+        size - the number of characters the item holds
+        seq - the position of the document in read order (handed back by get_entry)
+        timeout - the seconds to wait for space before raising queue.Full
+        """
+        with self.space:
+            if self.num_chars.value > 0 and self.num_chars.value + size > self.memory_limit:
+                self.space.wait(timeout)
+                if self.num_chars.value > 0 and self.num_chars.value + size > self.memory_limit:
+                    raise queue.Full
+            self.num_chars.value += size
+
+        try:
+            self.queue.put((item, size, seq), timeout=timeout)
+        except queue.Full:
+            self._release(size)
+            raise
+
+    def get(self):
+        """Take the next document from the queue
+
+        Returns:
+        The (Document, text) pair or None once the producer is done
+        """
+        return self.get_entry()[0]
+
+    def get_entry(self):
+        """Take the next document from the queue along with its read order
+
+        Returns:
+        The (Document, text) pair (or None) and its seq
+        """
+        item, size, seq = self.queue.get()
+        self._release(size)
+        return item, seq
+
+    def _release(self, size):
+        with self.space:
+            self.num_chars.value -= size
+            self.space.notify_all()
+
+    def status(self):
+        """Returns the number of queued documents and characters"""
+        with self.space:
+            return self.queue.qsize(), self.num_chars.value
+
+
+class _CountingQueue(object):
+    """Wraps the document queue so a worker's waiting time is counted
+    Every process gets its own copy, which remembers the documents the worker
+    took since its last commit and reports them once the worker commits.
+    """
+
+    def __init__(self, in_queue, counter, commit_queue):
+        self.in_queue = in_queue
+        self.counter = counter
+        self.commit_queue = commit_queue
+        self.pending = []
+
+    def get(self):
+        start = time.time()
+        item, seq = self.in_queue.get_entry()
+        self.counter.add(blocked=time.time() - start)
+        if item is not None:
+            self.pending.append(seq)
+        return item
+
+    def committed(self):
+        """Tell the pipeline that every document taken so far is in the database"""
+        if self.pending:
+            self.commit_queue.put(self.pending)
+            self.pending = []
+
+
+class _ThreadWorker(threading.Thread):
+    """Runs a worker in a thread of the current process
+    Used when a single worker is asked for (i.e. sqlite can't take
+    writes from several processes), so reading and parsing still overlap.
+    Mirrors the exitcode attribute of multiprocessing.Process.
+    """
+
+    def __init__(self, target, args):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.worker_target = target
+        self.worker_args = args
+        self.exitcode = None
+
+    def run(self):
+        try:
+            self.worker_target(*self.worker_args)
+            self.exitcode = 0
+        except Exception:
+            traceback.print_exc()
+            self.exitcode = 1
+
+    def terminate(self):
+        pass
+
+
+def session_parse_worker(in_queue, counters, corpus_parser, commit_size=1000):
+    """Parse documents with snorkel's CorpusParser and commit them through its session
+
+    Keyword arguments:
+    in_queue - the queue that holds (Document, text) pairs
+    counters - the StageCounter objects of the pipeline
+    corpus_parser - the snorkel CorpusParser object
+    commit_size - the number of documents to parse between commits
+    """
+    udf = corpus_parser.udf_class(**corpus_parser.udf_init_kwargs)
+    pending, pending_chars = 0, 0
+
+    while True:
+        item = in_queue.get()
+        if item is None:
+            break
+
+        start = time.time()
+        for sentence in udf.apply(item):
+            udf.session.add(sentence)
+        counters['parse'].add(items=1, chars=len(item[1]), busy=time.time() - start)
+        pending, pending_chars = pending + 1, pending_chars + len(item[1])
+
+        # Only whole documents get committed
+        if pending >= commit_size:
+            start = time.time()
+            udf.session.commit()
+            counters['write'].add(items=pending, chars=pending_chars, busy=time.time() - start)
+            in_queue.committed()
+            pending, pending_chars = 0, 0
+
+    start = time.time()
+    udf.session.commit()
+    counters['write'].add(items=pending, chars=pending_chars, busy=time.time() - start)
+    in_queue.committed()
+
+
+def parse_worker(corpus_parser, commit_size=1000):
+    """Pick the worker function that fits a corpus parser
+
+    Keyword arguments:
+    corpus_parser - snorkel's CorpusParser or an object with a worker(in_queue, counters) method
+        (i.e. BulkCorpusParser), which has to call in_queue.committed() after each commit
+    commit_size - the number of documents to parse between commits (CorpusParser only)
+
+    Returns:
+    A function that takes the document queue and the pipeline counters
+    """
+    if hasattr(corpus_parser, 'worker'):
+        return corpus_parser.worker
+    return partial(session_parse_worker, corpus_parser=corpus_parser, commit_size=commit_size)
+
+
+class IngestionPipeline(object):
+    """Streams documents from the xml reader into the parse workers
+    The reader runs in the current process and fills a bounded DocumentQueue,
+    while the workers drain it continuously. Every stage keeps a StageCounter,
+    so the reports show which stage is holding up the others.
+    Workers report the documents they committed, so the pipeline knows the
+    last document before which everything read has made it into the database.
+    """
+
+    def __init__(
+        self, worker, num_workers=1, max_documents=1000,
+        memory_limit=256 * 1024 ** 2, report_interval=60, on_report=None
+    ):
+        """Initialize the IngestionPipeline class
+
+        Keyword arguments:
+        worker - a function that takes (in_queue, counters) and consumes documents
+            until it gets None (see parse_worker)
+        num_workers - the number of parse processes (1 parses in a thread of this process)
+        max_documents - the most documents that can wait in the queue
+        memory_limit - the most characters of document text that can wait in the queue
+        report_interval - the seconds between progress reports
+        on_report - a function that is called with the pipeline after each report
+        """
+        self.worker = worker
+        self.num_workers = num_workers
+        self.max_documents = max_documents
+        self.memory_limit = memory_limit
+        self.report_interval = report_interval
+        self.on_report = on_report
+        self.counters = {name: StageCounter(name) for name in ['read', 'parse', 'write']}
+        # the name of the last document before which everything read is in the database
+        self.last_committed = None
+        self.committed_position = None
+        self.start_time = None
+        self.last_report = None
+
+    def _collect_commits(self):
+        """Move the committed watermark past every document the workers have committed"""
+        while True:
+            try:
+                self.committed_seqs.update(self.commit_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        while self.next_commit in self.committed_seqs:
+            self.committed_seqs.remove(self.next_commit)
+            self.last_committed, self.committed_position = self.in_flight.pop(self.next_commit)
+            self.next_commit += 1
+
+    def resume_position(self):
+        """Returns the position a restarted reader has to start from to not miss
+        any document that isn't committed yet (None if the reader doesn't give positions)
+        """
+        if self.next_commit in self.in_flight:
+            return self.in_flight[self.next_commit][1]
+        return self.committed_position
+
+    def report(self):
+        """Print the throughput of every stage"""
+        self._collect_commits()
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        stages = []
+        for name in ['read', 'parse', 'write']:
+            stats = self.counters[name].snapshot()
+            stages.append("{}: {} docs {:.1f} docs/sec (busy {:.0f}s, waiting {:.0f}s)".format(
+                name, stats['items'], stats['items'] / elapsed, stats['busy'], stats['blocked']
+            ))
+        queued, queued_chars = self.in_queue.status()
+        stages.append("queue: {} docs {:.1f}M chars".format(queued, queued_chars / 1e6))
+        print(" | ".join(stages))
+
+        self.last_report = time.time()
+        if self.on_report is not None:
+            self.on_report(self)
+
+    def _check_workers(self):
+        failed = [worker.exitcode for worker in self.workers if worker.exitcode not in (None, 0)]
+        if failed:
+            for worker in self.workers:
+                worker.terminate()
+            raise RuntimeError("{} parse workers failed with exit codes {}".format(len(failed), failed))
+
+    def _put(self, item, size, seq=None):
+        # Don't block forever if a worker died and the queue stopped draining
+        while True:
+            if time.time() - self.last_report >= self.report_interval:
+                self.report()
+            try:
+                self.in_queue.put(item, size, seq)
+                return
+            except queue.Full:
+                self._check_workers()
+
+    def run(self, documents):
+        """Parse every document
+
+        Keyword arguments:
+        documents - an iterable of (Document, text) pairs (i.e. xml_parser.generate())
+            or (Document, text, position) tuples, where reading again from position
+            gets the document back (i.e. xml_parser.generate_with_offsets())
+
+        Returns:
+        A dictionary of the final counter values of each stage
+        """
+        self.in_queue = DocumentQueue(self.max_documents, self.memory_limit)
+        self.start_time = self.last_report = time.time()
+        # documents that were read, but aren't known to be committed yet
+        self.commit_queue = mp.Queue()
+        self.in_flight = {}
+        self.committed_seqs = set()
+        self.num_read = 0
+        self.next_commit = 0
+        worker_queue = _CountingQueue(self.in_queue, self.counters['parse'], self.commit_queue)
+
+        if self.num_workers <= 1:
+            self.workers = [_ThreadWorker(self.worker, (worker_queue, self.counters))]
+        else:
+            self.workers = [
+                mp.Process(target=self.worker, args=(worker_queue, self.counters))
+                for worker in range(self.num_workers)
+            ]
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+
+        documents = iter(documents)
+        while True:
+            start = time.time()
+            item = next(documents, None)
+            if item is None:
+                break
+
+            self.counters['read'].add(items=1, chars=len(item[1]), busy=time.time() - start)
+            seq = self.num_read
+            self.num_read += 1
+            self.in_flight[seq] = (item[0].name, item[2] if len(item) > 2 else None)
+
+            start = time.time()
+            self._put(item[:2], len(item[1]), seq)
+            self.counters['read'].add(blocked=time.time() - start)
+
+        # One stop signal per worker
+        for worker in self.workers:
+            self._put(None, 0)
+
+        for worker in self.workers:
+            while worker.exitcode is None:
+                worker.join(timeout=1)
+                # a worker can't exit until the pipeline takes its last commits
+                self._collect_commits()
+                if time.time() - self.last_report >= self.report_interval:
+                    self.report()
+                self._check_workers()
+        self._check_workers()
+
+        self.report()
+        return {name: self.counters[name].snapshot() for name in self.counters}
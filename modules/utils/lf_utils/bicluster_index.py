@@ -0,0 +1,142 @@
+from collections import OrderedDict
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from .lf_resources import LFResource
+
+BICLUSTER_DIR = pathlib.Path(__file__).joinpath('../../../../dependency_cluster').resolve()
+
+# The theme columns of every bicluster results file, each theme gets one bit in this order
+BICLUSTER_THEMES = OrderedDict([
+    ("disease_gene", ["U", "Ud", "D", "J", "Te", "Y", "G", "Md", "X", "L"]),
+    ("chemical_gene", ["B", "A+", "A-", "E+", "E-", "E", "N"]),
+    ("chemical_disease", ["T", "C", "Sa", "Pr", "Pa", "J", "Mp"]),
+    ("gene_gene", ["B", "W", "V+", "E+", "E", "I", "H", "Rg", "Q"]),
+])
+
+# pubmed_id << SENTENCE_BITS | sentence_num is the key of a sentence
+SENTENCE_BITS = 20
+
+
+def bicluster_path(relation):
+    return BICLUSTER_DIR / "{}_bicluster_results.tsv.xz".format(relation)
+
+
+def theme_bit(relation, theme):
+    """
+    Return the bit a bicluster theme has in the index
+
+    relation - the bicluster results file the theme comes from (i.e. disease_gene)
+    theme - the theme column (i.e. U for causal mutations)
+    """
+    bit = 0
+    for theme_relation, themes in BICLUSTER_THEMES.items():
+        if theme_relation == relation:
+            return 1 << (bit + themes.index(theme))
+        bit += len(themes)
+    raise KeyError(relation)
+
+
+def build_bicluster_table():
+    """
+    Read every bicluster results file into one table
+
+    returns a (2 x sentences) int64 array, the first row holds the sorted sentence keys
+        and the second one the bitmask of the themes each sentence has a score above 0 for
+    """
+    sentence_masks = {}
+    for relation, themes in BICLUSTER_THEMES.items():
+        bicluster_dep_df = pd.read_table(bicluster_path(relation))
+        if (bicluster_dep_df["sentence_num"] >= 1 << SENTENCE_BITS).any():
+            raise ValueError("{} has sentence numbers that don't fit the index".format(bicluster_path(relation)))
+
+        keys = (
+            bicluster_dep_df["pubmed_id"].values.astype(np.int64) << SENTENCE_BITS |
+            bicluster_dep_df["sentence_num"].values.astype(np.int64)
+        )
+        for theme in themes:
+            bit = theme_bit(relation, theme)
+            for key in keys[(bicluster_dep_df[theme] > 0).values].tolist():
+                sentence_masks[key] = sentence_masks.get(key, 0) | bit
+
+    table = np.zeros((2, len(sentence_masks)), dtype=np.int64)
+    table[0] = sorted(sentence_masks)
+    table[1] = [sentence_masks[key] for key in table[0].tolist()]
+    return table
+
+
+class BiclusterIndex(object):
+    """
+    This class holds the bicluster themes of every sentence in the dependency_cluster results.
+
+    All four results files go into one table of sorted sentence keys and theme bitmasks.
+    The table is built once, stored as a .npy artifact and memory mapped, so every label function module
+    (and every worker process) shares the same pages. A single lookup answers every bicluster label function.
+    """
+
+    def __init__(self):
+        self.table = LFResource(
+            "bicluster_index", build_bicluster_table,
+            sources=[bicluster_path(relation) for relation in BICLUSTER_THEMES]
+        )
+
+    def mask(self, pubmed_id, sentence_num):
+        """
+        Return the theme bitmask of a sentence (0 if it isn't in any bicluster results file)
+
+        pubmed_id - the pubmed id of the sentence's document
+        sentence_num - the position of the sentence in the document
+        """
+        table = self.table.get()
+        key = int(pubmed_id) << SENTENCE_BITS | int(sentence_num)
+        position = np.searchsorted(table[0], key)
+        if position < table.shape[1] and table[0, position] == key:
+            return int(table[1, position])
+        return 0
+
+    def sentence_mask(self, sentence):
+        """
+        Return the theme bitmask of a snorkel sentence object
+
+        sentence - the sentence (i.e. c.get_parent())
+        """
+        return self.mask(int(sentence.document.name), sentence.position)
+
+    def masks_of(self, pubmed_ids, sentence_nums):
+        """
+        Look up the theme bitmasks of whole arrays of sentences
+
+        pubmed_ids - an array of pubmed ids
+        sentence_nums - an array of sentence positions in the same order
+
+        returns a numpy array of bitmasks
+        """
+        table = self.table.get()
+        keys = np.asarray(pubmed_ids).astype(np.int64) << SENTENCE_BITS | np.asarray(sentence_nums).astype(np.int64)
+        masks = np.zeros(len(keys), dtype=np.int64)
+        if table.shape[1] == 0:
+            return masks
+
+        positions = np.searchsorted(table[0], keys)
+        positions[positions == table.shape[1]] = 0
+        found = table[0][positions] == keys
+        masks[found] = table[1][positions[found]]
+        return masks
+
+    def label_block(self, pubmed_ids, sentence_nums, theme_bits):
+        """
+        Label whole arrays of candidates with the bicluster label functions
+
+        pubmed_ids - an array of the pubmed ids of the candidates' sentences
+        sentence_nums - an array of the sentence positions in the same order
+        theme_bits - a list of theme bits, one per label function (see theme_bit)
+
+        returns a (candidates x label functions) numpy matrix of 1 (sentence has the theme) or 0
+        """
+        masks = self.masks_of(pubmed_ids, sentence_nums)
+        block = np.zeros((len(masks), len(theme_bits)), dtype=np.int8)
+        for index, bit in enumerate(theme_bits):
+            block[:, index] = (masks & bit) != 0
+        return block
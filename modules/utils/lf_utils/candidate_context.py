@@ -0,0 +1,243 @@
+import re
+
+from snorkel import lf_helpers
+
+
+class ContextSpan(object):
+    """
+    This class wraps one span of a candidate context.
+    It behaves like the original span, but remembers which context it belongs to,
+    so the token helpers below can answer from the context's cache.
+    """
+
+    def __init__(self, context, index):
+        self.context = context
+        self.index = index
+        self.span = context.candidate[index]
+
+    def __getattr__(self, name):
+        if name == 'span':
+            raise AttributeError(name)
+        return getattr(self.span, name)
+
+    def __repr__(self):
+        return repr(self.span)
+
+
+class CandidateContext(object):
+    """
+    This class wraps a candidate object and caches the views label functions keep asking for
+    (the parent sentence, the left/right token windows, the tokens and text between the mentions
+    and the tagged text). Each view is computed the first time it is asked for and reused by every
+    label function that runs on the same candidate afterwards.
+
+    Attribute access and indexing fall through to the candidate,
+    so label functions can treat the context just like the candidate itself.
+    """
+
+    def __init__(self, candidate):
+        """
+        candidate - the candidate object to be labeled
+        """
+        self.candidate = candidate
+        self.spans = {}
+        self.cache = {}
+
+    @classmethod
+    def wrap(cls, candidate):
+        """
+        Return the candidate if it already is a context, otherwise wrap it
+
+        candidate - the candidate object or CandidateContext
+        """
+        return candidate if isinstance(candidate, cls) else cls(candidate)
+
+    def __getattr__(self, name):
+        if name == 'candidate':
+            raise AttributeError(name)
+        return getattr(self.candidate, name)
+
+    def __getitem__(self, index):
+        if index not in self.spans:
+            self.spans[index] = ContextSpan(self, index)
+        return self.spans[index]
+
+    def __len__(self):
+        return len(self.candidate)
+
+    def __repr__(self):
+        return repr(self.candidate)
+
+    def _cached(self, key, compute):
+        if key not in self.cache:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+    def get_parent(self):
+        return self._cached('parent', self.candidate.get_parent)
+
+    def left_tokens(self, index, window=3, attrib='words', n_max=1, case_sensitive=False):
+        return self._cached(
+            ('left_tokens', index, window, attrib, n_max, case_sensitive),
+            lambda: list(lf_helpers.get_left_tokens(
+                self.candidate[index], window=window, attrib=attrib,
+                n_max=n_max, case_sensitive=case_sensitive
+            ))
+        )
+
+    def right_tokens(self, index, window=3, attrib='words', n_max=1, case_sensitive=False):
+        return self._cached(
+            ('right_tokens', index, window, attrib, n_max, case_sensitive),
+            lambda: list(lf_helpers.get_right_tokens(
+                self.candidate[index], window=window, attrib=attrib,
+                n_max=n_max, case_sensitive=case_sensitive
+            ))
+        )
+
+    def between_tokens(self, attrib='words', n_max=1, case_sensitive=False):
+        return self._cached(
+            ('between_tokens', attrib, n_max, case_sensitive),
+            lambda: list(lf_helpers.get_between_tokens(
+                self.candidate, attrib=attrib, n_max=n_max, case_sensitive=case_sensitive
+            ))
+        )
+
+    def text_between(self):
+        return self._cached('text_between', lambda: lf_helpers.get_text_between(self.candidate))
+
+    def tagged_text(self):
+        return self._cached('tagged_text', lambda: lf_helpers.get_tagged_text(self.candidate))
+
+    def keyword_hits(self, scanner, text):
+        return self._cached(('keyword_hits', scanner, text), lambda: scanner.scan(text))
+
+    def found_keywords(self, scanner, text):
+        return self._cached(
+            ('found_keywords', scanner, text),
+            lambda: {name for name, start, end in self.keyword_hits(scanner, text)}
+        )
+
+    def bicluster_mask(self, index):
+        return self._cached(('bicluster_mask', index), lambda: index.sentence_mask(self.get_parent()))
+
+
+"""
+Drop in replacements for snorkel's lf_helpers
+When they are handed a CandidateContext (or one of its spans) they answer from its cache,
+anything else is passed straight to snorkel.
+"""
+
+
+def get_left_tokens(c, window=3, attrib='words', n_max=1, case_sensitive=False):
+    if isinstance(c, ContextSpan):
+        return c.context.left_tokens(c.index, window, attrib, n_max, case_sensitive)
+    if isinstance(c, CandidateContext):
+        return c.left_tokens(0, window, attrib, n_max, case_sensitive)
+    return lf_helpers.get_left_tokens(c, window=window, attrib=attrib, n_max=n_max, case_sensitive=case_sensitive)
+
+
+def get_right_tokens(c, window=3, attrib='words', n_max=1, case_sensitive=False):
+    if isinstance(c, ContextSpan):
+        return c.context.right_tokens(c.index, window, attrib, n_max, case_sensitive)
+    if isinstance(c, CandidateContext):
+        return c.right_tokens(len(c) - 1, window, attrib, n_max, case_sensitive)
+    return lf_helpers.get_right_tokens(c, window=window, attrib=attrib, n_max=n_max, case_sensitive=case_sensitive)
+
+
+def get_between_tokens(c, attrib='words', n_max=1, case_sensitive=False):
+    if isinstance(c, CandidateContext):
+        return c.between_tokens(attrib, n_max, case_sensitive)
+    return lf_helpers.get_between_tokens(c, attrib=attrib, n_max=n_max, case_sensitive=case_sensitive)
+
+
+def get_text_between(c):
+    if isinstance(c, CandidateContext):
+        return c.text_between()
+    return lf_helpers.get_text_between(c)
+
+
+def get_tagged_text(c):
+    if isinstance(c, CandidateContext):
+        return c.tagged_text()
+    return lf_helpers.get_tagged_text(c)
+
+
+def is_inverted(c):
+    return lf_helpers.is_inverted(c.candidate if isinstance(c, CandidateContext) else c)
+
+
+def keyword_hits(c, scanner, text):
+    """
+    Scan a piece of candidate text with a KeywordScanner
+    The hits are cached on the CandidateContext, so every label function that asks
+    about the same text shares one scan.
+
+    c - the CandidateContext (or candidate) the text belongs to
+    scanner - the KeywordScanner object
+    text - the string to scan
+
+    returns a list of (name, start, end) tuples
+    """
+    if isinstance(c, (CandidateContext, ContextSpan)):
+        context = c if isinstance(c, CandidateContext) else c.context
+        return context.keyword_hits(scanner, text)
+    return scanner.scan(text)
+
+
+def found_keywords(c, scanner, text):
+    """
+    Same as keyword_hits, but returns the set of pattern names that were found
+    """
+    if isinstance(c, (CandidateContext, ContextSpan)):
+        context = c if isinstance(c, CandidateContext) else c.context
+        return context.found_keywords(scanner, text)
+    return scanner.found(text)
+
+
+def bicluster_mask(c, index):
+    """
+    Look up the bicluster themes of a candidate's sentence
+    The mask is cached on the CandidateContext, so all the bicluster label functions
+    of a candidate share one lookup.
+
+    c - the CandidateContext (or candidate)
+    index - the BiclusterIndex object
+
+    returns the theme bitmask of the sentence
+    """
+    if isinstance(c, CandidateContext):
+        return c.bicluster_mask(index)
+    return index.sentence_mask(c.get_parent())
+
+
+def rule_regex_search_tagged_text(candidate, pattern, sign):
+    return sign if re.search(pattern, get_tagged_text(candidate), flags=re.I) else 0
+
+
+def rule_regex_search_btw_AB(candidate, pattern, sign):
+    return sign if re.search(r'{{A}}' + pattern + r'{{B}}', get_tagged_text(candidate), flags=re.I) else 0
+
+
+def rule_regex_search_btw_BA(candidate, pattern, sign):
+    return sign if re.search(r'{{B}}' + pattern + r'{{A}}', get_tagged_text(candidate), flags=re.I) else 0
+
+
+def rule_regex_search_before_A(candidate, pattern, sign):
+    return sign if re.search(pattern + r'{{A}}.*{{B}}', get_tagged_text(candidate), flags=re.I) else 0
+
+
+def rule_regex_search_before_B(candidate, pattern, sign):
+    return sign if re.search(pattern + r'{{B}}.*{{A}}', get_tagged_text(candidate), flags=re.I) else 0
+
+
+def apply_lfs(candidate, lfs):
+    """
+    Run label functions on a single candidate while sharing one CandidateContext
+
+    candidate - the candidate object to be labeled
+    lfs - a list of label functions
+
+    returns a list of labels in the same order as the label functions
+    """
+    context = CandidateContext.wrap(candidate)
+    return [lf(context) for lf in lfs]
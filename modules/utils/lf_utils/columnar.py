@@ -0,0 +1,393 @@
+from collections import OrderedDict
+import pickle
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from .candidate_context import (
+    CandidateContext,
+    apply_lfs,
+    get_between_tokens,
+    get_left_tokens,
+    get_right_tokens,
+    get_tagged_text,
+    get_text_between,
+)
+
+
+class CandidateColumns(object):
+    """
+    This class holds a set of binary candidates as plain arrays, so label functions can label
+    all of them at once with numpy and pandas string operations instead of one candidate at a time.
+
+    The candidates are exported once. Every sentence is stored as token ids (words, pos tags and entity types
+    share the same layout: one flat id array plus the offset where each sentence starts) and every candidate
+    is one row of a dataframe with its sentence row, span offsets, span cids and the texts label functions
+    search in (tagged text, text between the mentions and the token windows around each mention).
+    The export can be saved and loaded again, so relabeling doesn't need the database.
+    """
+
+    def __init__(self, candidates_df, sentences_df, token_offsets, token_ids, vocabularies, window=10):
+        """
+        candidates_df - one row per candidate (see from_candidates for the columns)
+        sentences_df - one row per sentence (sentence_id, pubmed_id, position)
+        token_offsets - the position in token_ids where each sentence starts (one extra entry at the end)
+        token_ids - a dict of attribute name (words, pos_tags, entity_types) -> flat id array
+        vocabularies - a dict of attribute name -> numpy array of the strings the ids stand for
+        window - the size of the left and right token windows
+        """
+        self.candidates = candidates_df
+        self.sentences = sentences_df
+        self.token_offsets = token_offsets
+        self.token_ids = token_ids
+        self.vocabularies = vocabularies
+        self.window = window
+        self.cache = {}
+
+    @classmethod
+    def from_candidates(cls, candidates, cid_attributes=None, window=10):
+        """
+        Export candidates into columns
+
+        candidates - a list of binary candidate objects
+        cid_attributes - the candidate attributes to keep (defaults to the <argname>_cid attribute
+            of every span, i.e. ["Disease_cid", "Gene_cid"], which the hetnet label functions read)
+        window - the size of the left and right token windows
+
+        returns a CandidateColumns object
+        """
+        attribs = ["words", "pos_tags", "entity_types"]
+        vocabularies = {attrib: {} for attrib in attribs}
+        token_ids = {attrib: [] for attrib in attribs}
+        token_offsets = [0]
+        sentence_rows = {}
+        sentence_records = []
+        records = []
+
+        for candidate in candidates:
+            context = CandidateContext.wrap(candidate)
+            sentence = context.get_parent()
+
+            if sentence.id not in sentence_rows:
+                sentence_rows[sentence.id] = len(sentence_records)
+                sentence_records.append((sentence.id, int(sentence.document.name), sentence.position))
+                for attrib in attribs:
+                    vocabulary = vocabularies[attrib]
+                    token_ids[attrib].extend(vocabulary.setdefault(token, len(vocabulary)) for token in getattr(sentence, attrib))
+                token_offsets.append(len(token_ids["words"]))
+
+            record = {
+                "candidate_id": candidate.id,
+                "sentence_row": sentence_rows[sentence.id],
+                "tagged_text": get_tagged_text(context),
+                "text_between": get_text_between(context),
+                "between_tokens": " ".join(get_between_tokens(context)),
+            }
+            attributes = cid_attributes
+            if attributes is None:
+                attributes = [argname + "_cid" for argname in candidate.__argnames__]
+            for attribute in attributes:
+                record[attribute] = getattr(candidate, attribute)
+            for index in range(len(candidate)):
+                span = context[index]
+                record.update({
+                    "span{}_start".format(index): span.get_word_start(),
+                    "span{}_end".format(index): span.get_word_end(),
+                    "span{}_char_start".format(index): span.char_start,
+                    "span{}_text".format(index): span.get_span(),
+                    "span{}_cid".format(index): sentence.entity_cids[span.get_word_start()],
+                    "left_window{}".format(index): " ".join(get_left_tokens(span, window=window)),
+                    "right_window{}".format(index): " ".join(get_right_tokens(span, window=window)),
+                })
+            records.append(record)
+
+        return cls(
+            pd.DataFrame.from_records(records),
+            pd.DataFrame.from_records(sentence_records, columns=["sentence_id", "pubmed_id", "position"]),
+            np.array(token_offsets, dtype=np.int64),
+            {attrib: np.array(ids, dtype=np.int32) for attrib, ids in token_ids.items()},
+            {attrib: np.array(list(vocabulary), dtype=object) for attrib, vocabulary in vocabularies.items()},
+            window=window
+        )
+
+    def save(self, path):
+        """
+        Write the exported columns to a file
+
+        path - the file to write
+        """
+        with open(path, "wb") as export_file:
+            state = self.__dict__.copy()
+            state["cache"] = {}
+            pickle.dump(state, export_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read columns that were written with save
+
+        path - the file to read
+        """
+        columns = cls.__new__(cls)
+        with open(path, "rb") as export_file:
+            columns.__dict__.update(pickle.load(export_file))
+        return columns
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def __getitem__(self, name):
+        if name not in self.candidates.columns:
+            raise KeyError("The candidates were exported without a {} column (see cid_attributes in from_candidates)".format(name))
+        return self.candidates[name].values
+
+    def cached(self, key, compute):
+        if key not in self.cache:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+    def text(self, *names):
+        """
+        Return a text column (several columns are concatenated, i.e. the left windows of both mentions)
+
+        names - the text columns to use
+
+        returns a pandas series of strings
+        """
+        def concatenate():
+            text = self.candidates[names[0]].astype(str)
+            for name in names[1:]:
+                text = text + self.candidates[name].astype(str)
+            return text
+        return self.cached(("text", names), concatenate)
+
+    def label(self, column_lf):
+        """
+        Return the labels of a columnar label function
+        Every label column is computed once, so label functions that build on each other share the work.
+
+        column_lf - a function that takes a CandidateColumns object and returns one label per candidate
+
+        returns an int8 numpy array
+        """
+        return self.cached(("label", column_lf), lambda: np.asarray(column_lf(self), dtype=np.int8))
+
+    def found(self, scanner, name, *text_names):
+        """
+        Check every candidate for a keyword set of a KeywordScanner
+        Every distinct text is only searched once.
+
+        scanner - the KeywordScanner object
+        name - the name of the keyword set
+        text_names - the text columns to search (see text)
+
+        returns a boolean numpy array, the same as name in found_keywords(c, scanner, text) for each candidate
+        """
+        return self.cached(
+            ("found", scanner, name, text_names),
+            lambda: keyword_found(scanner, name, self.text(*text_names))
+        )
+
+    def contains(self, substring, *text_names):
+        """
+        Check every candidate for a plain substring (substring in text)
+
+        substring - the string to look for
+        text_names - the text columns to search (see text)
+
+        returns a boolean numpy array
+        """
+        return self.cached(
+            ("contains", substring, text_names),
+            lambda: self.text(*text_names).str.contains(substring, regex=False).values.astype(bool)
+        )
+
+    def per_candidate(self, sentence_values):
+        """
+        Spread one value per sentence out to every candidate of the sentence
+
+        sentence_values - a numpy array with one value per sentence
+
+        returns a numpy array with one value per candidate
+        """
+        return np.asarray(sentence_values)[self["sentence_row"]]
+
+    def token_sentences(self):
+        # the sentence row of every token
+        return self.cached(
+            "token_sentences",
+            lambda: np.repeat(np.arange(len(self.sentences)), np.diff(self.token_offsets))
+        )
+
+    def count_tokens(self, attrib, keep):
+        """
+        Count the tokens of every sentence whose value passes a test
+        The test runs once per distinct value instead of once per token.
+
+        attrib - words, pos_tags or entity_types
+        keep - a function that takes a token string and returns True if it should be counted
+
+        returns a numpy array with one count per sentence
+        """
+        def count():
+            kept = np.array([bool(keep(token)) for token in self.vocabularies[attrib]], dtype=bool)
+            mask = kept[self.token_ids[attrib]] if len(kept) else np.zeros(0, dtype=bool)
+            return np.bincount(self.token_sentences()[mask], minlength=len(self.sentences))
+        return self.cached(("count_tokens", attrib, keep), count)
+
+    def count_token_runs(self, attrib, keep):
+        """
+        Count the runs of consecutive tokens of every sentence whose value passes a test
+        (i.e. the number of entity mentions when keep picks the entity types that aren't 'O')
+
+        attrib - words, pos_tags or entity_types
+        keep - a function that takes a token string and returns True if it is part of a run
+
+        returns a numpy array with one count per sentence
+        """
+        def count():
+            kept = np.array([bool(keep(token)) for token in self.vocabularies[attrib]], dtype=bool)
+            mask = kept[self.token_ids[attrib]] if len(kept) else np.zeros(0, dtype=bool)
+            previous = np.zeros_like(mask)
+            previous[1:] = mask[:-1]
+            # a run never carries over from the sentence before
+            starts = self.token_offsets[:-1]
+            previous[starts[starts < len(mask)]] = False
+            run_start = mask & ~previous
+            return np.bincount(self.token_sentences()[run_start], minlength=len(self.sentences))
+        return self.cached(("count_token_runs", attrib, keep), count)
+
+    def sentence_prefix(self, size):
+        """
+        Return the first words of every sentence joined by spaces (" ".join(sentence.words[0:size]))
+
+        size - the number of words to keep
+
+        returns a pandas series of strings with one entry per sentence (see per_candidate)
+        """
+        def prefix():
+            words = self.vocabularies["words"]
+            word_ids = self.token_ids["words"]
+            return pd.Series([
+                " ".join(words[word_ids[start:min(start + size, stop)]])
+                for start, stop in zip(self.token_offsets[:-1].tolist(), self.token_offsets[1:].tolist())
+            ], dtype=object)
+        return self.cached(("sentence_prefix", size), prefix)
+
+    def between_token_count(self):
+        """
+        Return the number of tokens between the two mentions of every candidate (len(get_between_tokens(c)))
+        """
+        def count():
+            first_is_left = self["span0_char_start"] < self["span1_char_start"]
+            distance = np.where(
+                first_is_left,
+                self["span1_start"] - self["span0_end"] - 1,
+                self["span0_start"] - self["span1_end"] - 1
+            )
+            return np.maximum(distance, 0)
+        return self.cached("between_token_count", count)
+
+
+def keyword_found(scanner, name, texts):
+    """
+    Check a whole series of texts for a keyword set of a KeywordScanner
+    Every distinct text is only searched once.
+
+    scanner - the KeywordScanner object
+    name - the name of the keyword set
+    texts - a pandas series of strings
+
+    returns a boolean numpy array, the same as name in scanner.found(text) for each text
+    """
+    codes, uniques = pd.factorize(texts)
+    uniques = pd.Series(np.asarray(uniques, dtype=object), dtype=object)
+    hits = np.zeros(len(uniques), dtype=bool)
+    with warnings.catch_warnings():
+        # the keyword groups are only there for the alternation
+        warnings.simplefilter("ignore", UserWarning)
+        for (pattern, flags), keyword_name in zip(scanner.patterns, scanner.names):
+            if keyword_name == name:
+                hits |= uniques.str.contains(pattern, flags=flags, regex=True).values.astype(bool)
+    return hits[codes]
+
+
+def columnar(lf):
+    """
+    Register the columnar version of a label function
+
+    The columnar version takes a CandidateColumns object and returns the labels of every candidate.
+    It is attached to the label function, so the dictionaries of label functions (i.e. DG_LFS)
+    can be handed to label_columns as they are.
+
+    lf - the per candidate label function
+
+    returns a decorator for the columnar version
+    """
+    def register(column_lf):
+        lf.columnar = column_lf
+        return column_lf
+    return register
+
+
+def columnar_version(lf):
+    return getattr(lf, 'columnar', None)
+
+
+def label_columns(columns, lfs, candidates=None):
+    """
+    Label exported candidates with a dictionary of label functions
+
+    Label functions that have a columnar version label every candidate at once.
+    The others fall back to running on each candidate object, which needs the candidates.
+
+    columns - the CandidateColumns object
+    lfs - an ordered dictionary of label function name -> label function (i.e. DG_LFS["DaG"])
+    candidates - the candidate objects in the same order as the columns (only needed for the fallback)
+
+    returns a (candidates x label functions) dataframe indexed by candidate id
+    """
+    fallback = [name for name, lf in lfs.items() if columnar_version(lf) is None]
+    if fallback and candidates is None:
+        raise ValueError("These label functions have no columnar version: {}".format(", ".join(fallback)))
+
+    label_matrix = np.zeros((len(columns), len(lfs)), dtype=np.int8)
+    for index, lf in enumerate(lfs.values()):
+        if columnar_version(lf) is not None:
+            label_matrix[:, index] = columns.label(columnar_version(lf))
+
+    if fallback:
+        if [candidate.id for candidate in candidates] != columns["candidate_id"].tolist():
+            raise ValueError("The candidates don't line up with the exported columns")
+        fallback_lfs = [lfs[name] for name in fallback]
+        fallback_index = [list(lfs).index(name) for name in fallback]
+        for row, candidate in enumerate(candidates):
+            label_matrix[row, fallback_index] = apply_lfs(candidate, fallback_lfs)
+
+    return pd.DataFrame(label_matrix, index=columns["candidate_id"], columns=list(lfs))
+
+
+def compare_to_candidates(columns, lfs, candidates):
+    """
+    Check that the columnar label functions give the same labels as the per candidate ones
+
+    columns - the CandidateColumns object
+    lfs - an ordered dictionary of label function name -> label function
+    candidates - the candidate objects in the same order as the columns
+
+    returns a dataframe with the number of candidates each ported label function disagrees on
+        and the ids of a few of those candidates (empty lists when the ports are equivalent)
+    """
+    ported = OrderedDict([(name, lf) for name, lf in lfs.items() if columnar_version(lf) is not None])
+    columnar_labels = label_columns(columns, ported).values
+    candidate_labels = np.array([apply_lfs(candidate, list(ported.values())) for candidate in candidates], dtype=np.int8)
+    candidate_labels = candidate_labels.reshape(len(candidates), len(ported))
+
+    mismatches = columnar_labels != candidate_labels
+    candidate_ids = columns["candidate_id"]
+    return pd.DataFrame({
+        "label_function": list(ported),
+        "mismatches": mismatches.sum(axis=0),
+        "candidate_ids": [candidate_ids[mismatches[:, index]][:10].tolist() for index in range(len(ported))],
+    })
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class GeneNameIndex(object):
+    """
+    This class holds the names of every gene in ncbi's gene_info table, keyed by GeneID.
+
+    The symbol, synonyms and description of each gene are lowercased once when the index is built,
+    next to a token set of all of them, so checking a gene mention doesn't need a dataframe query
+    or any string allocation. Mentions are matched the same way the gene tag label functions always did:
+    a token matches if it is the symbol or shows up anywhere in the synonyms or the description.
+
+    Genes are keyed by the string GeneID, which is what the entity cids hold. The old
+    gene_desc.query("GeneID == @gene_id") compared the integer column to that string and never matched,
+    so the gene tag label functions always returned -1. They now actually check the mention,
+    which changes their column of every label matrix built before this index.
+    """
+
+    def __init__(self, gene_info_df):
+        """
+        gene_info_df - the gene_info dataframe (needs the GeneID, Symbol, Synonyms and description columns)
+        """
+        self.genes = {}
+        for gene_id, symbol, synonyms, description in zip(
+            gene_info_df["GeneID"].tolist(), gene_info_df["Symbol"].tolist(),
+            gene_info_df["Synonyms"].tolist(), gene_info_df["description"].tolist()
+        ):
+            gene_id = str(gene_id)
+            # the first row wins, same as the .values[0] of a query
+            if gene_id in self.genes:
+                continue
+
+            symbol, synonyms, description = str(symbol).lower(), str(synonyms).lower(), str(description).lower()
+            tokens = frozenset([symbol] + synonyms.split("|") + description.split(" "))
+            self.genes[gene_id] = (synonyms, description, tokens)
+
+    def __len__(self):
+        return len(self.genes)
+
+    def __contains__(self, gene_id):
+        return str(gene_id) in self.genes
+
+    def matches(self, gene_id, gene_name):
+        """
+        Check if a gene mention fits the names of the gene it was normalized to
+
+        gene_id - the GeneID the mention was tagged with
+        gene_name - the lowercased text of the mention
+
+        returns False for unknown genes, otherwise if any token of the mention matches
+        """
+        entry = self.genes.get(str(gene_id))
+        if entry is None:
+            return False
+
+        synonyms, description, tokens = entry
+        for token in gene_name.split(" "):
+            # every whole token is also a substring, the string search only runs for the rest
+            if token in tokens or token in synonyms or token in description:
+                return True
+        return False
+
+    def matches_block(self, gene_ids, gene_names):
+        """
+        Check whole arrays of gene mentions at once
+        Mentions that repeat (the same gene written the same way) are only checked once.
+
+        gene_ids - an array of the GeneIDs the mentions were tagged with
+        gene_names - an array of the lowercased mention texts in the same order
+
+        returns a boolean numpy array
+        """
+        checked = {}
+        result = np.zeros(len(gene_ids), dtype=bool)
+        for index, key in enumerate(zip(map(str, gene_ids), gene_names)):
+            if key not in checked:
+                checked[key] = self.matches(*key)
+            result[index] = checked[key]
+        return result
@@ -0,0 +1,201 @@
+import os
+
+import numpy as np
+
+
+class KnowledgeBaseIndex(object):
+    """
+    This class holds the distant supervision knowledge base of a label function module.
+
+    Every entity id is encoded as an integer and every source gets one bit,
+    so an entity pair maps to a single bitmask of all the sources it was found in.
+    The pairs are kept as sorted int64 keys next to their bitmasks, which lets
+    whole arrays of candidates be looked up at once (see label_block).
+
+    save writes the arrays as .npy files and load memory maps them,
+    so worker processes share the pages of one copy.
+    """
+    columns = ['entities', 'keys', 'masks']
+
+    def __init__(self, triples, sources=None, symmetric=False):
+        """
+        triples - an iterable of (first entity id, second entity id, source) tuples
+        sources - the sources in bit order (defaults to the order they show up in)
+        symmetric - store every pair in both orders (i.e. gene gene interactions)
+        """
+        triples = [(str(first), str(second), source) for first, second, source in triples]
+        if symmetric:
+            triples += [(second, first, source) for first, second, source in triples]
+
+        self.sources = list(sources) if sources is not None else []
+        for first, second, source in triples:
+            if source not in self.sources:
+                self.sources.append(source)
+        if len(self.sources) > 64:
+            raise ValueError("A knowledge base can only hold 64 sources not {}".format(len(self.sources)))
+        self.source_bits = {source: 1 << bit for bit, source in enumerate(self.sources)}
+        self._source_masks = {}
+
+        self.entities = np.unique(np.array(
+            [first for first, second, source in triples] + [second for first, second, source in triples],
+            dtype=str
+        ))
+
+        pair_masks = {}
+        codes = self.encode([first for first, second, source in triples] + [second for first, second, source in triples])
+        first_codes, second_codes = codes[:len(triples)], codes[len(triples):]
+        for first, second, (_, _, source) in zip(first_codes.tolist(), second_codes.tolist(), triples):
+            key = first << 32 | second
+            pair_masks[key] = pair_masks.get(key, 0) | self.source_bits[source]
+
+        self.keys = np.array(sorted(pair_masks), dtype=np.int64)
+        self.masks = np.array([pair_masks[key] for key in self.keys.tolist()], dtype=np.uint64)
+        self._lookup = None
+        self.directory = None
+
+    def save(self, directory):
+        """
+        Write the index as a folder of .npy files
+
+        directory - the folder that will hold the index
+        """
+        os.makedirs(directory, exist_ok=True)
+        for column in self.columns:
+            np.save(os.path.join(directory, column + '.npy'), getattr(self, column))
+        np.save(os.path.join(directory, 'sources.npy'), np.array(self.sources, dtype=str))
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        Open an index written by save
+
+        directory - the folder that holds the index
+        mmap_mode - the numpy memory map mode (None reads everything into memory)
+
+        returns a KnowledgeBaseIndex object
+        """
+        index = cls.__new__(cls)
+        for column in cls.columns:
+            setattr(index, column, np.load(os.path.join(directory, column + '.npy'), mmap_mode=mmap_mode))
+        index.sources = np.load(os.path.join(directory, 'sources.npy')).tolist()
+        index.source_bits = {source: 1 << bit for bit, source in enumerate(index.sources)}
+        index._source_masks = {}
+        index._lookup = None
+        index.directory = directory if mmap_mode is not None else None
+        return index
+
+    def __getstate__(self):
+        # a memory mapped index is reopened from its folder instead of being copied
+        if self.directory is not None:
+            return {'directory': self.directory}
+        state = self.__dict__.copy()
+        state['_lookup'] = None
+        state['_source_masks'] = {}
+        return state
+
+    def __setstate__(self, state):
+        if 'directory' in state and len(state) == 1:
+            state = self.load(state['directory']).__dict__
+        self.__dict__.update(state)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, triple):
+        # Same membership test as the (first id, second id, source) sets this class replaces
+        first, second, source = triple
+        return self.has(first, second, source)
+
+    def encode(self, ids):
+        """
+        Map entity ids to their integer codes
+
+        ids - an array of entity ids (ids that aren't in the knowledge base get -1)
+
+        returns a numpy array of codes
+        """
+        ids = np.asarray(ids).astype(str)
+        if len(self.entities) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+
+        codes = np.searchsorted(self.entities, ids)
+        codes[codes == len(self.entities)] = 0
+        return np.where(self.entities[codes] == ids, codes, -1).astype(np.int64)
+
+    def mask(self, first, second):
+        """
+        Return the bitmask of every source an entity pair is in
+
+        first - the id string of the first entity (i.e. c.Gene_cid)
+        second - the id string of the second entity (i.e. c.Disease_cid)
+        """
+        if self._lookup is None:
+            self._lookup = (
+                {entity: code for code, entity in enumerate(self.entities.tolist())},
+                dict(zip(self.keys.tolist(), self.masks.tolist()))
+            )
+        codes, pair_masks = self._lookup
+        first, second = codes.get(first), codes.get(second)
+        if first is None or second is None:
+            return 0
+        return pair_masks.get(first << 32 | second, 0)
+
+    def sources_mask(self, sources):
+        """
+        Return the bitmask of a list of sources (sources the knowledge base never saw are ignored)
+
+        sources - a list of source names
+        """
+        key = tuple(sources)
+        if key not in self._source_masks:
+            mask = 0
+            for source in sources:
+                mask |= self.source_bits.get(source, 0)
+            self._source_masks[key] = mask
+        return self._source_masks[key]
+
+    def has(self, first, second, source):
+        return bool(self.mask(first, second) & self.source_bits.get(source, 0))
+
+    def has_any(self, first, second, sources):
+        return bool(self.mask(first, second) & self.sources_mask(sources))
+
+    def masks_of(self, first_ids, second_ids):
+        """
+        Look up the bitmasks of whole arrays of entity pairs
+
+        first_ids - an array of first entity ids
+        second_ids - an array of second entity ids in the same order
+
+        returns a numpy array of bitmasks (0 for pairs that aren't in the knowledge base)
+        """
+        first_codes, second_codes = self.encode(first_ids), self.encode(second_ids)
+        masks = np.zeros(len(first_codes), dtype=np.uint64)
+        if len(self.keys) == 0:
+            return masks
+
+        known = (first_codes >= 0) & (second_codes >= 0)
+        keys = first_codes[known] << 32 | second_codes[known]
+        positions = np.searchsorted(self.keys, keys)
+        positions[positions == len(self.keys)] = 0
+        found = self.keys[positions] == keys
+        masks[np.flatnonzero(known)[found]] = self.masks[positions[found]]
+        return masks
+
+    def label_block(self, first_ids, second_ids, columns):
+        """
+        Label whole arrays of candidates with the distant supervision label functions
+
+        first_ids - an array of first entity ids
+        second_ids - an array of second entity ids in the same order
+        columns - a list of (sources, label if found, label if not found) tuples, one per label function
+            (i.e. (["DISEASES"], 1, 0) or (["DISEASES", "DOAF"], 0, -1) for an absent label function)
+
+        returns a (candidates x columns) numpy matrix of labels
+        """
+        masks = self.masks_of(first_ids, second_ids)
+        block = np.zeros((len(masks), len(columns)), dtype=np.int8)
+        for index, (sources, found, not_found) in enumerate(columns):
+            hits = (masks & np.uint64(self.sources_mask(sources))) != 0
+            block[:, index] = np.where(hits, found, not_found)
+        return block
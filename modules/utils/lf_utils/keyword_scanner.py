@@ -0,0 +1,184 @@
+import re
+
+REGEX_SPECIAL = set('.^$*+?{}[]\\|()')
+ZERO_WIDTH_START = re.compile(r'^(?:\(\?<[!=][^()]*\)|\\b)+')
+
+
+class KeywordSet(object):
+    """
+    This class describes one group of keywords a label function searches for.
+    Searching for a keyword set is the same as re.search(before + ltp(keywords) + after, text, flags).
+    """
+
+    def __init__(self, name, keywords, before='', after='', flags=re.I):
+        """
+        name - the name the hits of this set are reported under
+        keywords - the keyword regexes (i.e. one of the keyword sets of a label function module)
+        before - a regex that has to match right before the keyword (i.e. r'{{A}}.*')
+        after - a regex that has to match right after the keyword (i.e. r'.*{{B}}')
+        flags - re.I or 0 for a case sensitive search
+        """
+        self.name = name
+        self.keywords = list(keywords)
+        self.before = before
+        self.after = after
+        self.flags = flags
+
+    def pattern(self):
+        return self.before + '(' + '|'.join(self.keywords) + ')' + self.after
+
+
+def _has_top_level_bar(pattern):
+    depth, escaped = 0, False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+    return False
+
+
+def _literal_prefix(pattern):
+    """
+    Return the characters every match of a regex has to start with
+    Zero width assertions at the start (lookbehinds and \\b) are skipped
+    and an empty string is returned when the regex doesn't start with a literal.
+    """
+    pattern = ZERO_WIDTH_START.sub('', pattern)
+    literal = []
+    pos = 0
+    while pos < len(pattern):
+        char = pattern[pos]
+        if char == '\\' and pos + 1 < len(pattern) and not pattern[pos + 1].isalnum():
+            literal.append(pattern[pos + 1])
+            pos += 2
+            continue
+        if char == '{' and not re.match(r'\{\d*,?\d*\}', pattern[pos:]):
+            literal.append(char)
+            pos += 1
+            continue
+        if char == '}' and literal:
+            literal.append(char)
+            pos += 1
+            continue
+        if char in REGEX_SPECIAL:
+            # A quantifier makes the character before it optional
+            if char in '?*{':
+                literal = literal[:-1]
+            break
+        literal.append(char)
+        pos += 1
+    return ''.join(literal)
+
+
+class KeywordScanner(object):
+    """
+    This class finds every hit of a group of keyword sets in a single pass over a piece of text.
+
+    Every keyword is indexed by the literal characters its matches have to start with.
+    Keywords that share a literal share one lookup, and a keyword's regex only runs at the
+    positions where its literal shows up in the text. A set with a before regex is indexed
+    by the literal that regex starts with, and keywords without a literal prefix (i.e. ones that
+    start with a group) are searched for with one regex per set.
+
+    Keywords are tried at every position of the text, exactly like re.search does,
+    so anchors, lookbehinds and case sensitivity behave the same as searching the text
+    with each keyword set on its own.
+    """
+
+    def __init__(self, keyword_sets):
+        """
+        keyword_sets - a list of KeywordSet objects
+        """
+        self.names = [keyword_set.name for keyword_set in keyword_sets]
+        self.patterns = [(keyword_set.pattern(), keyword_set.flags) for keyword_set in keyword_sets]
+
+        # (order, name, regex) entries, hits at the same position are reported in this order
+        self.entries = []
+        self.literals = {}
+        self.unindexed = []
+        for keyword_set in keyword_sets:
+            before = ZERO_WIDTH_START.sub('', keyword_set.before)
+            if before:
+                # The keywords all sit behind the same prefix, so the whole set is matched at once
+                self._add(keyword_set, keyword_set.keywords, _literal_prefix(before))
+                continue
+
+            unindexed = []
+            for keyword in keyword_set.keywords:
+                literal = '' if _has_top_level_bar(keyword) else _literal_prefix(keyword)
+                if literal:
+                    self._add(keyword_set, [keyword], literal)
+                else:
+                    unindexed.append(keyword)
+            if unindexed:
+                self._add(keyword_set, unindexed, '')
+
+        self.literals = list(self.literals.items())
+
+    def _add(self, keyword_set, keywords, literal):
+        regex = re.compile(keyword_set.before + '(' + '|'.join(keywords) + ')' + keyword_set.after, keyword_set.flags)
+        entry = (len(self.entries), keyword_set.name, regex)
+        self.entries.append(entry)
+        if not literal:
+            self.unindexed.append(entry)
+            return
+
+        flags = keyword_set.flags & re.I
+        literal = literal.lower() if flags else literal
+        self.literals.setdefault((flags, literal), []).append(entry)
+
+    def _candidates(self, text):
+        sources = {re.I: text.lower(), 0: text}
+        for (flags, literal), entries in self.literals:
+            source = sources[flags]
+            pos = source.find(literal)
+            while pos >= 0:
+                for entry in entries:
+                    yield pos, entry
+                pos = source.find(literal, pos + 1)
+
+    def scan(self, text):
+        """
+        Find every keyword hit in a piece of text
+
+        text - the string to scan (i.e. a token window or the tagged text of a candidate)
+
+        returns a list of (name, start, end) tuples ordered by start position
+        """
+        hits = []
+        # str.isascii() needs python 3.7, the environment pins 3.6
+        if all(ord(char) < 128 for char in text):
+            # lower() only keeps the character positions intact for ascii text
+            for pos, (order, name, regex) in self._candidates(text):
+                match = regex.match(text, pos)
+                if match:
+                    hits.append((pos, order, name, match.end()))
+            unindexed = self.unindexed
+        else:
+            unindexed = self.entries
+
+        for order, name, regex in unindexed:
+            match = regex.search(text)
+            while match:
+                hits.append((match.start(), order, name, match.end()))
+                match = regex.search(text, match.start() + 1) if match.start() < len(text) else None
+
+        hits.sort()
+        return [(name, start, end) for start, order, name, end in hits]
+
+    def found(self, text):
+        """
+        Find the names of the keyword sets that match a piece of text
+
+        text - the string to scan
+
+        returns a set of keyword set names
+        """
+        return {name for name, start, end in self.scan(text)}
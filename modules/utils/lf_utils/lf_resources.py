@@ -0,0 +1,170 @@
+import hashlib
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+CACHE_DIR = os.environ.get(
+    'LF_RESOURCE_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'snorkeling', 'lf_resources')
+)
+
+# values that were already loaded by this process, keyed by artifact path
+_loaded = {}
+
+
+def source_checksum(sources, version=1):
+    """
+    Compute the key a resource's artifact is stored under
+
+    sources - the files (hashed by content) and urls or other strings (used as is) the resource is built from
+    version - bump this when the build function changes
+
+    returns a hex digest
+    """
+    digest = hashlib.md5(str(version).encode('utf-8'))
+    for source in sources:
+        source = str(source)
+        if os.path.isfile(source):
+            with open(source, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        else:
+            digest.update(source.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class _LazyValue(object):
+    """
+    Stands in for a value that is loaded on first use: membership tests, iteration,
+    indexing and attribute access are passed on to the value returned by get()
+    """
+
+    def get(self):
+        raise NotImplementedError
+
+    def __getattr__(self, name):
+        # attributes of the stand in itself are never passed on (i.e. while unpickling)
+        if name.startswith('__') or name in ('name', 'build', 'sources', 'version', 'store', 'value', 'resource', 'key'):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+    def __contains__(self, item):
+        return item in self.get()
+
+    def __iter__(self):
+        return iter(self.get())
+
+    def __len__(self):
+        return len(self.get())
+
+    def __getitem__(self, key):
+        return self.get()[key]
+
+
+class LFResource(_LazyValue):
+    """
+    This class declares a resource label functions need (i.e. a knowledge base or a gene table)
+    without loading it. The resource is built the first time a label function touches it,
+    written to the cache directory keyed by the checksum of its sources, and every later
+    process loads that artifact instead of rebuilding it.
+
+    numpy arrays are stored as .npy files and memory mapped, so worker processes share their pages.
+    Values of a store class (i.e. KnowledgeBaseIndex) are saved as a folder of .npy files
+    and opened with the class's load method, which memory maps them the same way.
+    Everything else is pickled.
+
+    The object stands in for the value itself, so label functions can use it without any changes.
+    """
+
+    def __init__(self, name, build, sources=(), version=1, store=None):
+        """
+        name - the name of the artifact
+        build - a function without arguments that returns the value
+        sources - the files and urls the value is built from
+        version - bump this when the build function changes
+        store - a class with save(directory) and load(directory) methods the value is kept with (optional)
+        """
+        self.name = name
+        self.build = build
+        self.sources = list(sources)
+        self.version = version
+        self.store = store
+        self.value = None
+
+    def artifact_path(self):
+        key = source_checksum(self.sources, self.version)
+        return os.path.join(CACHE_DIR, "{}-{}".format(self.name, key[:16]))
+
+    def get(self):
+        """
+        Return the value, building the artifact first if there is none for the current sources
+        """
+        if self.value is not None:
+            return self.value
+
+        path = self.artifact_path()
+        if path not in _loaded:
+            _loaded[path] = self._load(path)
+        self.value = _loaded[path]
+        return self.value
+
+    def _load(self, path):
+        if self.store is not None and os.path.isdir(path):
+            return self.store.load(path)
+        if os.path.exists(path + '.npy'):
+            return np.load(path + '.npy', mmap_mode='r')
+        if os.path.exists(path + '.pkl'):
+            with open(path + '.pkl', 'rb') as f:
+                return pickle.load(f)
+
+        value = self.build()
+        os.makedirs(CACHE_DIR, exist_ok=True)
+
+        # write to the side and rename so other processes never see a half written artifact
+        temp_name = "{}.{}.tmp".format(path, os.getpid())
+        if self.store is not None:
+            value.save(temp_name)
+            try:
+                os.rename(temp_name, path)
+            except OSError:
+                # another process finished the same folder first
+                shutil.rmtree(temp_name)
+            return self.store.load(path)
+
+        if isinstance(value, np.ndarray) and value.dtype != object:
+            with open(temp_name, 'wb') as f:
+                np.save(f, value)
+            os.replace(temp_name, path + '.npy')
+            return np.load(path + '.npy', mmap_mode='r')
+
+        with open(temp_name, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_name, path + '.pkl')
+        return value
+
+    def item(self, key):
+        """
+        Return a lazy stand in for one entry of the value (i.e. one of several sets built from the same table)
+
+        key - the key of the entry
+        """
+        return LFResourceItem(self, key)
+
+
+class LFResourceItem(_LazyValue):
+    """
+    One entry of a LFResource that holds a dictionary
+    """
+
+    def __init__(self, resource, key):
+        """
+        resource - the LFResource object
+        key - the key of the entry
+        """
+        self.resource = resource
+        self.key = key
+
+    def get(self):
+        return self.resource.get()[self.key]
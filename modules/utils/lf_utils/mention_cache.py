@@ -0,0 +1,161 @@
+from collections import OrderedDict
+import atexit
+import os
+import pickle
+import re
+import sqlite3
+
+from nltk.tokenize import word_tokenize
+
+from .lf_resources import CACHE_DIR, source_checksum
+
+# Every mention cache of this process, so workers can flush them all (see flush_mention_caches)
+mention_caches = []
+
+
+class MentionCache(object):
+    """
+    This class remembers what a mention string normalizes to, so the work is done once per unique mention
+    instead of once per candidate.
+
+    The most recent results sit in a bounded LRU in memory. Every result is also written to a sqlite file
+    in the resource cache directory (keyed by the checksum of the sources, like LFResource artifacts),
+    so later processes and other scripts start out knowing every mention that was already seen.
+    """
+
+    def __init__(self, name, compute, sources=(), version=1, max_size=100000, flush_every=1000):
+        """
+        name - the name of the cache file
+        compute - a function that takes a key and returns the value to cache
+        sources - the files and urls the values depend on
+        version - bump this when the compute function changes
+        max_size - the most results kept in memory
+        flush_every - the number of new results to collect before writing them to disk
+        """
+        self.name = name
+        self.compute = compute
+        self.sources = list(sources)
+        self.version = version
+        self.max_size = max_size
+        self.flush_every = flush_every
+        self.memory = OrderedDict()
+        self.pending = {}
+        self.connection = None
+        self.pid = None
+        mention_caches.append(self)
+
+    def __getstate__(self):
+        # the connection and results stay with the process that made them
+        state = self.__dict__.copy()
+        state.update(memory=OrderedDict(), pending={}, connection=None, pid=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        mention_caches.append(self)
+
+    def path(self):
+        key = source_checksum(self.sources, self.version)
+        return os.path.join(CACHE_DIR, "{}-{}.sqlite".format(self.name, key[:16]))
+
+    def _connect(self):
+        # a forked process gets a connection of its own
+        if self.connection is None or self.pid != os.getpid():
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            self.connection = sqlite3.connect(self.path(), timeout=60)
+            self.connection.execute("create table if not exists mentions (key text primary key, value blob)")
+            self.connection.commit()
+            self.pending = {}
+            self.pid = os.getpid()
+            # pool workers leave through os._exit and never run this, they call flush_mention_caches instead
+            atexit.register(self.flush)
+        return self.connection
+
+    @staticmethod
+    def _db_key(key):
+        return "\x1f".join(key) if isinstance(key, tuple) else key
+
+    def get(self, key):
+        """
+        Return the cached value of a key, computing it if no process has seen the key before
+
+        key - a string or a tuple of strings (i.e. the text of a mention)
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+
+        row = self._connect().execute(
+            "select value from mentions where key = ?", (self._db_key(key),)
+        ).fetchone()
+        if row is not None:
+            value = pickle.loads(row[0])
+        else:
+            value = self.compute(key)
+            self.pending[self._db_key(key)] = value
+            if len(self.pending) >= self.flush_every:
+                self.flush()
+
+        self.memory[key] = value
+        if len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+        return value
+
+    def flush(self):
+        """
+        Write the results that aren't on disk yet
+        """
+        if not self.pending or self.pid != os.getpid():
+            return
+        self.connection.executemany(
+            "insert or replace into mentions (key, value) values (?, ?)",
+            [(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)) for key, value in self.pending.items()]
+        )
+        self.connection.commit()
+        self.pending = {}
+
+
+def flush_mention_caches():
+    """
+    Write the pending results of every mention cache in this process to disk
+    Worker processes have to call this when they finish a piece of work,
+    since multiprocessing workers exit without running atexit hooks.
+    """
+    for cache in mention_caches:
+        cache.flush()
+
+
+def normalize_disease_mention(span_text, stop_words):
+    """
+    Clean up the text of a disease mention the way the disease tag label functions compare it
+
+    span_text - the text of the disease span
+    stop_words - a set of words to drop
+
+    returns the normalized text
+    """
+    disease_name = re.sub("\) ?", "", span_text)
+    disease_name = re.sub(r"(\w)-(\w)", r"\g<1> \g<2>", disease_name)
+    return " ".join([word for word in word_tokenize(disease_name) if word not in stop_words])
+
+
+def resolve_disease_mention(span_text, stop_words, disease_names):
+    """
+    Normalize a disease mention and find the slim term it belongs to
+
+    span_text - the text of the disease span
+    stop_words - a set of words to drop
+    disease_names - the SubstringIndex of the disease ontology slim term names
+
+    returns a (normalized text, slim_id) tuple (slim_id is None if no name contains the mention)
+    """
+    disease_name = normalize_disease_mention(span_text, stop_words)
+    slim_id = disease_names.first(disease_name.lower())
+
+    # check the reverse direction e.g. carcinoma lung -> lung carcinoma
+    if slim_id is None:
+        disease_name_tokens = word_tokenize(disease_name)
+        if len(disease_name_tokens) == 2:
+            slim_id = disease_names.first(" ".join(disease_name_tokens[-1::0-1]).lower())
+
+    return disease_name, slim_id
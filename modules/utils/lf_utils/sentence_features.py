@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from functools import wraps
+import threading
+
+
+class SentenceFeatureCache(object):
+    """
+    This class keeps features that only depend on a sentence (i.e. if it has a verb),
+    keyed by sentence id, so they are computed once no matter how many candidates share the sentence.
+    The least recently used sentences are dropped once the cache is full.
+    """
+
+    def __init__(self, max_sentences=50000):
+        """
+        max_sentences - the most sentences to keep features for
+        """
+        self.max_sentences = max_sentences
+        self.sentences = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, sentence, name, compute):
+        """
+        Return a feature of a sentence, computing it the first time it is asked for
+
+        sentence - the sentence object (i.e. c.get_parent())
+        name - the name of the feature (or the label function it belongs to)
+        compute - a function that takes the sentence and returns the feature
+        """
+        with self.lock:
+            features = self.sentences.get(sentence.id)
+            if features is not None:
+                self.sentences.move_to_end(sentence.id)
+                if name in features:
+                    return features[name]
+
+        value = compute(sentence)
+        with self.lock:
+            features = self.sentences.setdefault(sentence.id, {})
+            features[name] = value
+            if len(self.sentences) > self.max_sentences:
+                self.sentences.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.sentences.clear()
+
+
+sentence_features = SentenceFeatureCache()
+
+
+def sentence_feature(c, name, compute):
+    """
+    Return a feature of a candidate's sentence from the shared sentence cache
+
+    c - the candidate (or CandidateContext)
+    name - the name of the feature
+    compute - a function that takes the sentence and returns the feature
+    """
+    return sentence_features.get(c.get_parent(), name, compute)
+
+
+def sentence_level(lf):
+    """
+    Declare a label function whose label only depends on the candidate's sentence
+
+    The label is computed for the first candidate of a sentence and reused for the others.
+    label_candidates also looks for this mark and broadcasts the label to every candidate
+    of the sentence instead of calling the label function again.
+
+    lf - the label function
+
+    returns the wrapped label function (it keeps the name of the original)
+    """
+    @wraps(lf)
+    def sentence_lf(c):
+        return sentence_feature(c, lf, lambda sentence: lf(c))
+
+    sentence_lf.sentence_level = True
+    return sentence_lf
+
+
+def is_sentence_level(lf):
+    return getattr(lf, 'sentence_level', False)
@@ -0,0 +1,93 @@
+import numpy as np
+
+
+class SubstringIndex(object):
+    """
+    This class answers "which rows of a name column contain this string" without scanning every name.
+
+    Every name is broken into its character n-grams (up to n=3) and each n-gram points to the sorted
+    rows it shows up in. A query only looks at the rows that hold all of its n-grams and then checks
+    those with a plain substring test, so the result is exactly what pandas' str.contains(text, regex=False)
+    returns, in the same row order.
+    """
+
+    def __init__(self, names, ids, gram_size=3):
+        """
+        names - the strings to search (i.e. the subsumed_name column of the disease ontology slim terms)
+        ids - the id of every row, in the same order (i.e. the slim_id column)
+        gram_size - the longest n-gram that is indexed
+        """
+        # missing names never contain anything
+        self.names = [name if isinstance(name, str) else None for name in names]
+        self.ids = list(ids)
+        self.gram_size = gram_size
+
+        postings = {}
+        for row, name in enumerate(self.names):
+            if name is None:
+                continue
+            grams = set()
+            for size in range(1, gram_size + 1):
+                grams.update(name[start:start + size] for start in range(len(name) - size + 1))
+            for gram in grams:
+                postings.setdefault(gram, []).append(row)
+        self.postings = {gram: np.array(rows, dtype=np.int32) for gram, rows in postings.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _grams(self, text):
+        size = min(len(text), self.gram_size)
+        return {text[start:start + size] for start in range(len(text) - size + 1)}
+
+    def _candidates(self, text):
+        # rows that hold every n-gram of the text, these still need the substring test
+        if not text:
+            return np.array([row for row, name in enumerate(self.names) if name is not None], dtype=np.int32)
+
+        candidates = None
+        # the rarest n-grams narrow the rows down the fastest
+        for gram in sorted(self._grams(text), key=lambda gram: len(self.postings.get(gram, ()))):
+            rows = self.postings.get(gram)
+            if rows is None:
+                return np.array([], dtype=np.int32)
+            candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+            if len(candidates) <= 8:
+                break
+        return candidates
+
+    def rows(self, text):
+        """
+        Find the rows whose name contains a string
+
+        text - the string to search for
+
+        returns a sorted numpy array of row positions
+        """
+        candidates = self._candidates(text)
+        # a text that is no longer than an n-gram is an n-gram itself
+        if len(text) <= self.gram_size:
+            return candidates
+        return np.array([row for row in candidates.tolist() if text in self.names[row]], dtype=np.int32)
+
+    def find(self, text):
+        """
+        Find the ids of every row whose name contains a string
+
+        text - the string to search for
+
+        returns a list of ids in row order
+        """
+        return [self.ids[row] for row in self.rows(text).tolist()]
+
+    def first(self, text):
+        """
+        Return the id of the first row whose name contains a string or None if there is none
+        (the same as .values[0] of the rows str.contains picks)
+
+        text - the string to search for
+        """
+        for row in self._candidates(text).tolist():
+            if text in self.names[row]:
+                return self.ids[row]
+        return None
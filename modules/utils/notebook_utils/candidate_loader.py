@@ -0,0 +1,85 @@
+from sqlalchemy.orm import object_session, with_polymorphic
+
+from snorkel.models import Candidate, Document, Sentence, Span
+
+
+def _query_by_id(session, model, ids):
+    return session.query(model).filter(model.id.in_(ids)).all() if ids else []
+
+
+def load_candidates(session, candidate_ids, candidate_class=Candidate, batch_size=10000):
+    """
+    This function loads candidates together with their spans, sentences and documents.
+    Every batch of ids takes four set based queries (candidates, spans, sentences and documents),
+    instead of the handful of lazy loads each candidate triggers once a label function
+    or dataframe helper touches c[0], c.get_parent() or the sentence's document.
+
+    session - the session object
+    candidate_ids - the ids of the candidates to load
+    candidate_class - the candidate class to query (Candidate loads every candidate type)
+    batch_size - the number of candidates loaded per round of queries
+
+    returns a list of candidates in the order of candidate_ids (ids that aren't in the database are skipped)
+    """
+    return [
+        candidate
+        for batch in iter_candidate_batches(session, candidate_ids, candidate_class, batch_size)
+        for candidate in batch
+    ]
+
+
+def iter_candidate_batches(session, candidate_ids, candidate_class=Candidate, batch_size=10000):
+    """
+    Same as load_candidates, but yields one list of candidates per batch,
+    so only one batch of objects has to be held in memory
+
+    session - the session object
+    candidate_ids - the ids of the candidates to load
+    candidate_class - the candidate class to query
+    batch_size - the number of candidates loaded per round of queries
+    """
+    # the subclass columns (i.e. the span ids) come with the candidate rows
+    candidate_query = with_polymorphic(candidate_class, '*')
+    candidate_ids = [int(candidate_id) for candidate_id in candidate_ids]
+
+    for start in range(0, len(candidate_ids), batch_size):
+        batch_ids = candidate_ids[start:start + batch_size]
+        candidates = {
+            candidate.id: candidate
+            for candidate in _query_by_id(session, candidate_query, batch_ids)
+        }
+
+        span_ids = {
+            getattr(candidate, argname + '_id')
+            for candidate in candidates.values()
+            for argname in candidate.__argnames__
+        }
+        spans = _query_by_id(session, Span, list(span_ids))
+        sentences = _query_by_id(session, Sentence, list({span.sentence_id for span in spans}))
+        documents = _query_by_id(session, Document, list({sentence.document_id for sentence in sentences}))
+
+        # The objects above sit in the session's identity map, so following the relationships
+        # doesn't hit the database. Each candidate now holds on to its own spans, sentence and document.
+        for candidate in candidates.values():
+            for span in candidate.get_contexts():
+                span.get_parent().document
+
+        yield [candidates[candidate_id] for candidate_id in batch_ids if candidate_id in candidates]
+
+
+def hydrate_candidates(candidates, batch_size=10000):
+    """
+    Reload candidate objects that were queried without their spans, sentences and documents
+
+    candidates - a list of candidate objects that belong to a session
+
+    returns the same candidates, in the same order, with everything label functions and helpers touch loaded
+    """
+    candidates = list(candidates)
+    # detached candidates can't be reloaded, they are used as they are
+    if not candidates or object_session(candidates[0]) is None:
+        return candidates
+    return load_candidates(
+        object_session(candidates[0]), [candidate.id for candidate in candidates],
+        batch_size=batch_size
+    )
@@ -8,6 +8,8 @@ import numpy as np
 from scipy.sparse import coo_matrix
 import pdb
 
+from .candidate_loader import hydrate_candidates, load_candidates
+
 
 def create_gen_marginal_df(L_data, models, lfs_columns, model_names, candidate_ids):
     """
@@ -88,18 +90,20 @@ def mark_sentence(s, args):
         x.insert(k, v)
     return x
 
-def tag_sentence(x, class_table):
+def tag_sentence(x, class_table, session=None):
     """
     This function tags the mentions of each candidate sentence.
     x - dataframe with candidate sentences
     class_table - the table for each candidate
+    session - the session object (a new snorkel session is opened if none is given)
+
+    returns a list of tagged sentences in the same order as x
     """
-    candidates=(
-        session
-        .query(class_table)
-        .filter(class_table.id.in_(x.candidate_id.astype(int).tolist()))
-        .all()
-    )
+    if session is None:
+        from snorkel import SnorkelSession
+        session = SnorkelSession()
+
+    candidates = load_candidates(session, x.candidate_id.astype(int).tolist(), class_table)
     tagged_sen=[
          " ".join(
              mark_sentence(
@@ -125,6 +129,7 @@ def make_sentence_df(candidates):
 
     return a Dataframe that contains each candidate sentence  and the corresponding candidate entities
     """
+    candidates = hydrate_candidates(candidates)
     rows = list()
     for c in tqdm_notebook(candidates):
         args = [
@@ -236,6 +241,7 @@ def embed_word_to_index(cand, word_dict):
     return [word_dict[word] if word in word_dict else 1 for word in cand]
 
 def generate_embedded_df(candidates, word_dict, max_length=83):
+    candidates = hydrate_candidates(candidates)
     words_to_embed = [
         (
         mark_sentence(
@@ -1,16 +1,23 @@
-import threading
-import queue
-import sys
+from collections import deque
+import multiprocessing as mp
 import pandas as pd
 import numpy as np
 from scipy.stats import norm
 import scipy.sparse as sparse
 from tqdm import tqdm_notebook
 
-from snorkel.models import Candidate
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
 
-candidate_queue = queue.Queue()
-data_queue = queue.Queue()
+from .candidate_loader import iter_candidate_batches, load_candidates
+from .label_matrix_store import LabelMatrix, LabelMatrixWriter
+from ..lf_utils.candidate_context import CandidateContext
+from ..lf_utils.columnar import CandidateColumns, label_columns
+from ..lf_utils.mention_cache import flush_mention_caches
+from ..lf_utils.sentence_features import is_sentence_level
+
+# The database session and label functions of a labeling worker process
+worker_state = {}
 
 def get_columns(session, L_data, lf_hash, lf_name):
     """
@@ -140,132 +147,228 @@ def label_candidates_db(labeler, cids_query, label_functions, apply_existing=Fal
         return labeler.apply(cids_query=cids_query, parallelism=5)
 
 
-def label_candidates(session, candidate_ids, lfs, lf_names, multitask=False, num_threads=4, batch_size=10):
+def label_candidates(session, candidate_ids, lfs, lf_names, multitask=False, num_threads=4, batch_size=10000):
     """
     This function returns a sparse matrix in memory. Helps bypass using a static database to store annotations
-    Only catch is that this structure doesn't contain the names of label functions
-    
-    session - the session object
+    The candidate ids are split into shards and every shard is labeled by a pool of worker processes,
+    so the label functions run in parallel instead of taking turns on one interpreter.
+    Each worker returns the nonzero labels of its shard and the shards are merged into one csr matrix.
+
+    session - the session object (the workers open their own connection to the same database)
     candidate_ids - the ids for candidates to be extracted
     lfs - a list of label functions to label candidates
+    lf_names - the names of the label functions (the columns of the matrix)
     multitask - a boolean to signify that labels will be in multitask format
-    num_threads - the number of threads to execute
-    batch_size - the batch size to prevent a memory overload
+    num_threads - the number of worker processes to label with
+    batch_size - the most candidates in a shard. Each shard costs a round trip to a worker and its own
+        loader queries, and sentence level labels are only shared within a shard, so keep it large
+
+    returns a sparse dataframe with one row per candidate id (in the given order) and a candidate_id column
     """
     if multitask == True:
         raise Exception("Must Fix index error for multitask version")
-    iteration = 0
-    started = False
-    
-    #set up the threads
-    thread_list = [
-    threading.Thread(target=_label_candidates_multithread, args=(lfs, multitask))
-    for t in range(num_threads) 
-    ]
-    
-    candidate_map = {}
-    with tqdm_notebook(total=len(candidate_ids)) as pbar:
-        while iteration < len(candidate_ids):
-            candidate_batch = candidate_ids[iteration:iteration + batch_size]
-            row_indicies = range(iteration, iteration + batch_size, 1)
-
-            #Fire up the threads to label each candidate
-            candidates = session.query(Candidate).filter(Candidate.id.in_(candidate_batch)).all()
-            for row_index, cand_obj in zip(row_indicies, candidates):
-                candidate_queue.put((row_index, cand_obj))
-                candidate_map[row_index] = cand_obj.id
-
-            #Only start the threads once
-            if not(started):
-                for thread in thread_list:
-                    thread.start()
-                started = True
-
-            pbar.update(batch_size)
-            iteration += batch_size
-
-    for thread in thread_list:
-        thread.join()
-
-
-    # Once finished use appropiate 
-    # steps to form the matricies
-    if multitask:
-        multirow  = [[] for i in lfs]
-        multicol = [[] for i in lfs]
-        multidata = [[] for i in lfs]
-        candidate_entries = []
-
-        while not(data_queue.empty()):
-            entry = data_queue.get()
-            multirow[entry[0]].append(entry[1])
-            multicol[entry[0]].append(entry[2])
-            multidata[entry[0]].append(entry[3])
-            if entry[4] not in candidate_entries:
-                candidate_entries.append(entry[4])
-
-        L_data = [
-            pd.SparseDataFrame(
-        sparse.csr_matrix(
+
+    candidate_ids = list(candidate_ids)
+    row, col, data = [], [], []
+    for start, shard_ids, shard_row, shard_col, shard_data in _label_shards(
+        session, candidate_ids, lfs, num_threads, batch_size
+    ):
+        row.append(shard_row + start)
+        col.append(shard_col)
+        data.append(shard_data)
+
+    label_matrix = sparse.csr_matrix(
+        (
+            np.concatenate(data) if data else np.zeros(0, dtype=np.int8),
             (
-                multidata[task_index], (multirow[task_index], multicol[task_index])),
-                shape=(len(candidate_ids), max([len(lf) for lf in lfs]))
-            ))
-        for task_index in range(len(lfs))
-        ]
-        L_data[0]['candidate_id'] = candidate_entries
-        L_data[1]['candidate_id'] = candidate_entries
-        L_data[2]['candidate_id'] = candidate_entries
-        return L_data
-    else:
-        row = []
-        data =[]
-        col = []
+                np.concatenate(row) if row else np.zeros(0, dtype=np.int64),
+                np.concatenate(col) if col else np.zeros(0, dtype=np.int32)
+            )
+        ),
+        shape=(len(candidate_ids), len(lfs))
+    )
+    label_matrix_df = pd.SparseDataFrame(label_matrix, columns=lf_names)
+    label_matrix_df['candidate_id'] = candidate_ids
+    return label_matrix_df
 
-        candidate_entries = (
-            pd.DataFrame(list(candidate_map.items()), columns=["row_index", "candidate_id"])
-            .sort_values("row_index")
-        )
+def label_candidates_columnar(session, candidate_ids, lfs, batch_size=10000):
+    """
+    This function labels candidates like label_candidates, but with the columnar versions of the label functions
+    (see lf_utils/columnar.py). Every batch of candidates is exported into columns once and each ported
+    label function labels the whole batch with array operations. Label functions without a columnar version
+    run on the candidate objects. check_columnar_lfs.py next to the label functions checks the ports give the same labels.
 
-        while not(data_queue.empty()):
-            entry = data_queue.get()
+    session - the session object
+    candidate_ids - the ids for candidates to be extracted
+    lfs - an ordered dictionary of label function name -> label function (i.e. DG_LFS["DaG"])
+    batch_size - the number of candidates exported at once
 
-            row.append(entry[0])
-            col.append(entry[1])
-            data.append(entry[2])
+    returns a sparse dataframe with one row per candidate id (in the given order) and a candidate_id column
+    """
+    candidate_ids = list(candidate_ids)
+    label_blocks = []
+    for candidates in iter_candidate_batches(session, candidate_ids, batch_size=batch_size):
+        if not candidates:
+            continue
+        columns = CandidateColumns.from_candidates(candidates)
+        label_blocks.append(label_columns(columns, lfs, candidates))
+    flush_mention_caches()
+
+    label_matrix = pd.concat(label_blocks) if label_blocks else pd.DataFrame(columns=list(lfs), dtype=np.int8)
+    # ids that aren't in the database get an empty row, the same as label_candidates
+    label_matrix = label_matrix.reindex(candidate_ids, fill_value=0)
+    label_matrix_df = pd.SparseDataFrame(sparse.csr_matrix(label_matrix.values), columns=list(lfs))
+    label_matrix_df['candidate_id'] = candidate_ids
+    return label_matrix_df
+
+def label_candidates_to_disk(session, candidate_ids, lfs, lf_names, directory, num_threads=4, batch_size=10000):
+    """
+    This function labels candidates like label_candidates, but streams the label matrix into
+    an on disk csr store (see label_matrix_store.py) as the shards finish.
+    Only two shards per worker are submitted at a time, so memory stays bounded by those shards
+    and every candidate can be labeled, not only the curated subsets.
 
-        label_matrix = sparse.csr_matrix((data, (row, col)), shape=(len(candidate_ids),len(lfs)))
-        label_matrix_df = pd.SparseDataFrame(label_matrix, columns=lf_names)
-        label_matrix_df['candidate_id'] = candidate_entries['candidate_id'].values.tolist()
-        
-        return label_matrix_df
+    session - the session object (the workers open their own connection to the same database)
+    candidate_ids - the ids for candidates to be extracted
+    lfs - a list of label functions to label candidates
+    lf_names - the names of the label functions (the columns of the matrix)
+    directory - the folder that will hold the store
+    num_threads - the number of worker processes to label with
+    batch_size - the most candidates a worker loads at once
+
+    returns a LabelMatrix with the memory mapped matrix, the candidate ids and the label function names
+    """
+    candidate_ids = list(candidate_ids)
+    with LabelMatrixWriter(directory, lf_names) as writer:
+        for start, shard_ids, shard_row, shard_col, shard_data in _label_shards(
+            session, candidate_ids, lfs, num_threads, batch_size, ordered=True
+        ):
+            writer.append(shard_ids, shard_row, shard_col, shard_data)
+    return LabelMatrix.load(directory)
+
+def _label_shards(session, candidate_ids, lfs, num_threads, batch_size, ordered=False):
+    """
+    This function labels candidate ids in shards with a pool of worker processes.
+
+    session - the session object
+    candidate_ids - a list of candidate ids
+    lfs - a list of label functions
+    num_threads - the number of worker processes
+    batch_size - the most candidates in a shard
+    ordered - yield the shards in row order instead of as they finish
+        (at most two shards per worker are submitted ahead of the one that is yielded next)
+
+    yields the first row and candidate ids of every shard
+        and the row (counted from the first row), column and label arrays of its nonzero labels
+    """
+    # every worker gets a few shards, so a slow shard doesn't hold the others up
+    shard_size = max(1, min(batch_size, int(np.ceil(len(candidate_ids) / (num_threads * 4)))))
+    shards = [
+        (start, candidate_ids[start:start + shard_size])
+        for start in range(0, len(candidate_ids), shard_size)
+    ]
+
+    # Forked workers inherit the label functions, they don't have to be picklable
+    with mp.get_context("fork").Pool(num_threads, initializer=_init_label_worker, initargs=(session.bind.url, lfs)) as pool:
+        with tqdm_notebook(total=len(candidate_ids)) as pbar:
+            if ordered:
+                labeled_shards = _ordered_shards(pool, shards, max_pending=2 * num_threads)
+            else:
+                labeled_shards = pool.imap_unordered(_label_shard, shards)
+            for start, shard_row, shard_col, shard_data in labeled_shards:
+                shard_ids = candidate_ids[start:start + shard_size]
+                yield start, shard_ids, shard_row, shard_col, shard_data
+                pbar.update(len(shard_ids))
+
+def _ordered_shards(pool, shards, max_pending):
+    """
+    This function labels shards in row order with a bounded number of shards submitted.
+    pool.imap would submit every shard up front and hold every finished shard
+    that waits on a slow one, so the labels of the whole matrix could pile up in memory.
 
-def _label_candidates_multithread(lfs, multitask):
+    pool - the worker pool
+    shards - a list of (first row, candidate ids) tuples
+    max_pending - the most shards that are submitted or finished but not yielded yet
+
+    yields the result of _label_shard for every shard in order
+    """
+    shards = iter(shards)
+    pending = deque()
+    for shard in shards:
+        pending.append(pool.apply_async(_label_shard, (shard,)))
+        if len(pending) >= max_pending:
+            break
+
+    while pending:
+        labeled_shard = pending.popleft().get()
+        # keep the workers busy while the caller writes this shard
+        next_shard = next(shards, None)
+        if next_shard is not None:
+            pending.append(pool.apply_async(_label_shard, (next_shard,)))
+        yield labeled_shard
+
+def _init_label_worker(database_url, lfs):
     """
-    This function is called when each thread is created.
+    This function is called once in each worker process of label_candidates.
+    The worker gets its own engine, a connection inherited from the parent can't be shared.
 
+    database_url - the url of the candidate database
     lfs - the label functions to annotate candidates
-    multitask - a boolean that tells the function to label candidates in a multitask format
     """
-    while not(candidate_queue.empty()):
-       
-        candidate = candidate_queue.get()
-        sys.stdout.write("\r{:7d}".format(candidate_queue.qsize()))
-        sys.stdout.flush()
-        
-        if multitask:
-            for task_index, lf_task in enumerate(lfs):
-                for col_index, lf in enumerate(lf_task):
-                    val = lf(candidate[1])
-                    
+    worker_state["session"] = sessionmaker(bind=create_engine(database_url))()
+    worker_state["lfs"] = lfs
+
+def _label_shard(shard):
+    """
+    This function labels one shard of candidates inside a worker process.
+
+    shard - a tuple of the row of the first candidate and the candidate ids of the shard
+
+    returns the first row of the shard and the row (counted from the first row), column and label arrays of its nonzero labels
+    """
+    start, shard_ids = shard
+    session, lfs = worker_state["session"], worker_state["lfs"]
+    rows = {candidate_id: offset for offset, candidate_id in enumerate(shard_ids)}
+
+    row, col, data = [], [], []
+    # Sentence level label functions only run for the first candidate of a sentence
+    sentence_labels = {}
+    # the spans, sentences and documents come along, so the label functions don't query one at a time
+    for candidate in load_candidates(session, shard_ids, batch_size=len(shard_ids)):
+        # Every label function sees the same context,
+        # so the token windows and tagged text are only built once per candidate
+        context = CandidateContext(candidate)
+        row_index = rows[candidate.id]
+
+        sentence_id = context.get_parent().id
+        first_candidate = sentence_id not in sentence_labels
+        labels = sentence_labels.setdefault(sentence_id, [])
+
+        for col_index, lf in enumerate(lfs):
+            if is_sentence_level(lf):
+                if first_candidate:
+                    val = lf(context)
                     if val != 0:
-                        data_queue.put((task_index, candidate[0], col_index, val))
-        else:
-            for col_index, lf in enumerate(lfs):
-                val = lf(candidate[1])
-            
-                if val != 0:
-                    # put row_index, col_index and data onto a synchronized queue
-                    data = (candidate[0], col_index, val)
-                    data_queue.put(data)
-    
+                        labels.append((col_index, val))
+                continue
+
+            val = lf(context)
+            if val != 0:
+                row.append(row_index)
+                col.append(col_index)
+                data.append(val)
+
+        for col_index, val in labels:
+            row.append(row_index)
+            col.append(col_index)
+            data.append(val)
+
+    session.close()
+    # the worker exits without running atexit hooks, so new mentions are written after every shard
+    flush_mention_caches()
+    return (
+        start,
+        np.array(row, dtype=np.int64),
+        np.array(col, dtype=np.int32),
+        np.array(data, dtype=np.int8)
+    )
@@ -0,0 +1,455 @@
+import json
+import lzma
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+
+# What each label value means in the encodings label matrices show up in
+# Only encodings where abstaining is 0 can be stored, the other entries of a csr matrix are implicit zeros
+LABEL_ENCODINGS = {
+    # snorkel's label functions
+    "plusminus": {"abstain": 0, "negative": -1, "positive": 1},
+    # snorkel metal's categorical labels
+    "categorical": {"abstain": 0, "positive": 1, "negative": 2},
+    # the LabelModel of snorkel 0.9 and later
+    "label_model": {"abstain": -1, "negative": 0, "positive": 1},
+}
+
+# The raw arrays of a label matrix store and the type each one is written with
+# indptr and indices are converted to the index type scipy picks for the finished matrix (see index_dtype)
+STORE_ARRAYS = {
+    "indptr": np.int64,
+    "indices": np.int32,
+    "data": np.int8,
+    "candidate_ids": np.int64,
+}
+
+
+def index_dtype(shape, nnz):
+    """
+    Return the index type scipy uses for a csr matrix of this size
+    (int32 unless the shape or the number of labels needs more).
+    Storing indptr and indices in it keeps scipy from copying them when a store is opened.
+
+    shape - the shape of the matrix
+    nnz - the number of nonzero labels
+    """
+    if max(max(shape), nnz) <= np.iinfo(np.int32).max:
+        return np.int32
+    return np.int64
+
+
+def _convert_array_file(path, source_dtype, target_dtype, chunksize=1 << 24):
+    """
+    Rewrite a raw array file in another type, one chunk at a time
+
+    path - the path of the .bin file
+    source_dtype - the type the file is written in
+    target_dtype - the type to convert to
+    chunksize - the number of values to convert at a time
+    """
+    if os.path.getsize(path) == 0:
+        return
+    source = np.memmap(path, dtype=source_dtype, mode='r')
+    with open(path + ".tmp", "wb") as out_file:
+        for start in range(0, len(source), chunksize):
+            source[start:start + chunksize].astype(target_dtype).tofile(out_file)
+    del source
+    os.replace(path + ".tmp", path)
+
+
+class LabelMatrixWriter(object):
+    """
+    This class writes a label matrix to disk one chunk of rows at a time.
+
+    The matrix is stored as the raw csr arrays (indptr, indices and data) next to the candidate id of every row,
+    so memory only has to hold the chunk that is being written, no matter how many candidates get labeled.
+    Chunks have to be appended in row order. The shape, label function names and label encoding
+    are written to meta.json once the writer is closed.
+    """
+
+    def __init__(self, directory, lf_names, label_encoding="plusminus"):
+        """
+        directory - the folder that will hold the store
+        lf_names - the names of the label functions (the columns of the matrix)
+        label_encoding - the encoding of the stored labels (see LABEL_ENCODINGS)
+        """
+        if LABEL_ENCODINGS[label_encoding]["abstain"] != 0:
+            raise ValueError("A label matrix store needs an encoding where abstaining is 0")
+
+        self.directory = directory
+        self.lf_names = list(lf_names)
+        self.label_encoding = label_encoding
+        self.n_rows = 0
+        self.nnz = 0
+
+        os.makedirs(directory, exist_ok=True)
+        # a store without meta.json is unfinished and won't be opened
+        if os.path.exists(os.path.join(directory, "meta.json")):
+            os.remove(os.path.join(directory, "meta.json"))
+        self.files = {
+            name: open(os.path.join(directory, name + ".bin"), "wb")
+            for name in STORE_ARRAYS
+        }
+        np.zeros(1, dtype=STORE_ARRAYS["indptr"]).tofile(self.files["indptr"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, candidate_ids, row, col, data):
+        """
+        Add the next chunk of rows to the matrix
+
+        candidate_ids - the candidate id of every row in the chunk
+        row - the row of every nonzero label, counted from the start of the chunk
+        col - the column of every nonzero label
+        data - the label values
+        """
+        row = np.asarray(row, dtype=np.int64)
+        order = np.lexsort((col, row))
+        row_counts = np.bincount(row, minlength=len(candidate_ids))
+        if len(row_counts) > len(candidate_ids):
+            raise ValueError("The chunk has labels for rows it has no candidate id for")
+
+        np.asarray(col, dtype=STORE_ARRAYS["indices"])[order].tofile(self.files["indices"])
+        np.asarray(data, dtype=STORE_ARRAYS["data"])[order].tofile(self.files["data"])
+        (self.nnz + np.cumsum(row_counts)).astype(STORE_ARRAYS["indptr"]).tofile(self.files["indptr"])
+        np.asarray(candidate_ids, dtype=STORE_ARRAYS["candidate_ids"]).tofile(self.files["candidate_ids"])
+
+        self.n_rows += len(candidate_ids)
+        self.nnz += len(row)
+
+    def close(self):
+        """
+        Finish the store
+        """
+        if self.files is None:
+            return
+        for label_file in self.files.values():
+            label_file.close()
+        self.files = None
+
+        # indptr is written as int64, since the final number of labels isn't known until now
+        dtypes = {name: np.dtype(dtype).name for name, dtype in STORE_ARRAYS.items()}
+        target_dtype = np.dtype(index_dtype((self.n_rows, len(self.lf_names)), self.nnz))
+        for name in ("indptr", "indices"):
+            if target_dtype != np.dtype(STORE_ARRAYS[name]):
+                _convert_array_file(os.path.join(self.directory, name + ".bin"), STORE_ARRAYS[name], target_dtype)
+                dtypes[name] = target_dtype.name
+
+        with open(os.path.join(self.directory, "meta.json"), "w") as meta_file:
+            json.dump({
+                "shape": [self.n_rows, len(self.lf_names)],
+                "nnz": self.nnz,
+                "lf_names": self.lf_names,
+                "label_encoding": self.label_encoding,
+                "dtypes": dtypes,
+            }, meta_file, indent=2)
+
+
+class LabelMatrix(object):
+    """
+    This class is a label matrix opened from a store written by LabelMatrixWriter.
+    The csr arrays and candidate ids are memory mapped, so opening a store is nearly free
+    and training code only pages in the rows it touches.
+    (Stores written before indptr was kept in scipy's index type get their indptr copied into memory.)
+    """
+
+    def __init__(self, matrix, candidate_ids, lf_names, label_encoding="plusminus"):
+        """
+        matrix - the (candidates x label functions) csr matrix
+        candidate_ids - the candidate id of every row
+        lf_names - the name of every column
+        label_encoding - the encoding of the stored labels (see LABEL_ENCODINGS)
+        """
+        self.matrix = matrix
+        self.candidate_ids = candidate_ids
+        self.lf_names = lf_names
+        self.label_encoding = label_encoding
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        Open a label matrix store
+
+        directory - the folder that holds the store
+        mmap_mode - the numpy memory map mode (None reads everything into memory)
+
+        returns a LabelMatrix object
+        """
+        with open(os.path.join(directory, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+
+        arrays = {}
+        for name, dtype in meta["dtypes"].items():
+            path = os.path.join(directory, name + ".bin")
+            if mmap_mode is None or os.path.getsize(path) == 0:
+                arrays[name] = np.fromfile(path, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode=mmap_mode)
+
+        matrix = sparse.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=tuple(meta["shape"])
+        )
+        return cls(matrix, arrays["candidate_ids"], meta["lf_names"], meta.get("label_encoding", "plusminus"))
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def to_dataframe(self):
+        """
+        Return the matrix in the format label_candidates returns
+        (a sparse dataframe with a candidate_id column)
+        """
+        label_matrix_df = pd.SparseDataFrame(self.matrix, columns=self.lf_names)
+        label_matrix_df['candidate_id'] = np.asarray(self.candidate_ids).tolist()
+        return label_matrix_df
+
+    def select(self, columns):
+        """
+        Return a label matrix with only some of the label functions
+
+        columns - label function names, column positions or a slice
+
+        returns a LabelMatrix object (only the nonzero labels of the kept columns are copied)
+        """
+        columns = lf_positions(columns, self.lf_names)
+        return LabelMatrix(
+            select_lfs(self.matrix, columns), self.candidate_ids,
+            [self.lf_names[column] for column in columns], self.label_encoding
+        )
+
+    def recode(self, label_encoding):
+        """
+        Return the label matrix in another sparse encoding (i.e. categorical for snorkel metal)
+
+        label_encoding - an encoding where abstaining is 0 (see LABEL_ENCODINGS)
+
+        returns a LabelMatrix object
+        """
+        return LabelMatrix(
+            remap_sparse_labels(self.matrix, self.label_encoding, label_encoding),
+            self.candidate_ids, self.lf_names, label_encoding
+        )
+
+    def to_label_model(self, columns=None, chunksize=100000):
+        """
+        Return the int8 array LabelModel.fit takes (-1 abstain, 0 negative, 1 positive)
+
+        columns - the label functions to keep (None keeps every one)
+        chunksize - the number of rows to fill at a time
+        """
+        matrix = self.matrix if columns is None else select_lfs(self.matrix, lf_positions(columns, self.lf_names))
+        return dense_labels(matrix, self.label_encoding, "label_model", chunksize=chunksize)
+
+
+def lf_positions(columns, lf_names):
+    """
+    Turn a selection of label functions into column positions
+
+    columns - label function names, column positions or a slice
+    lf_names - the names of every column
+
+    returns a list of column positions
+    """
+    if isinstance(columns, slice):
+        return list(range(len(lf_names)))[columns]
+    if isinstance(columns, str):
+        columns = [columns]
+    return [lf_names.index(column) if isinstance(column, str) else int(column) for column in columns]
+
+
+def label_lookup(source, target):
+    """
+    Build a table that maps the label values of one encoding onto another
+
+    source - the encoding of the labels (see LABEL_ENCODINGS)
+    target - the encoding to convert into
+
+    returns the table (an int8 array) and the offset to add to a label before indexing it
+    """
+    value_map = {
+        LABEL_ENCODINGS[source][meaning]: value
+        for meaning, value in LABEL_ENCODINGS[target].items()
+    }
+    offset = -min(value_map)
+    lookup = np.zeros(max(value_map) + offset + 1, dtype=np.int8)
+    for value, new_value in value_map.items():
+        lookup[value + offset] = new_value
+    return lookup, offset
+
+
+def remap_labels(labels, source="plusminus", target="label_model"):
+    """
+    Convert an array of labels from one encoding into another
+
+    labels - a numpy array in the source encoding
+    source - the encoding of the labels (see LABEL_ENCODINGS)
+    target - the encoding to convert into
+
+    returns an int8 numpy array of the same shape
+    """
+    lookup, offset = label_lookup(source, target)
+    labels = np.asarray(labels)
+    if labels.size and (labels.min() + offset < 0 or labels.max() + offset >= len(lookup)):
+        raise ValueError("The labels have values that aren't part of the {} encoding".format(source))
+    return lookup[labels.astype(np.int64) + offset]
+
+
+def remap_sparse_labels(matrix, source="plusminus", target="categorical"):
+    """
+    Convert a sparse label matrix from one encoding into another without densifying it
+    Only the stored labels are touched, so both encodings have to use 0 for abstaining.
+
+    matrix - the (candidates x label functions) scipy sparse matrix
+    source - the encoding of the labels (see LABEL_ENCODINGS)
+    target - the encoding to convert into
+
+    returns a csr matrix with int8 labels
+    """
+    if LABEL_ENCODINGS[source]["abstain"] != 0 or LABEL_ENCODINGS[target]["abstain"] != 0:
+        raise ValueError("Sparse label matrices need encodings where abstaining is 0, use dense_labels instead")
+
+    matrix = sparse.csr_matrix(matrix)
+    return sparse.csr_matrix(
+        (remap_labels(matrix.data, source, target), matrix.indices, matrix.indptr),
+        shape=matrix.shape
+    )
+
+
+def select_lfs(matrix, columns):
+    """
+    Keep some of the label functions of a sparse label matrix
+
+    matrix - the (candidates x label functions) scipy sparse matrix
+    columns - column positions or a slice
+
+    returns a csr matrix with the selected columns in the given order
+    """
+    return sparse.csr_matrix(matrix)[:, columns]
+
+
+def iter_dense_labels(matrix, source="plusminus", target="label_model", chunksize=100000):
+    """
+    Convert a sparse label matrix into dense int8 arrays one chunk of rows at a time
+
+    matrix - the (candidates x label functions) scipy sparse matrix
+    source - the encoding of the stored labels (abstaining has to be 0)
+    target - the encoding of the dense chunks (see LABEL_ENCODINGS)
+    chunksize - the number of rows per chunk
+
+    yields the first row of the chunk and the int8 array of its labels
+    """
+    if LABEL_ENCODINGS[source]["abstain"] != 0:
+        raise ValueError("The implicit zeros of a sparse label matrix are abstains, so the source encoding needs abstaining as 0")
+
+    matrix = sparse.csr_matrix(matrix)
+    abstain = LABEL_ENCODINGS[target]["abstain"]
+
+    for start in range(0, matrix.shape[0], chunksize):
+        chunk = matrix[start:start + chunksize]
+        labels = np.full(chunk.shape, abstain, dtype=np.int8)
+        row = np.repeat(np.arange(chunk.shape[0]), np.diff(chunk.indptr))
+        labels[row, chunk.indices] = remap_labels(chunk.data, source, target)
+        yield start, labels
+
+
+def dense_labels(matrix, source="plusminus", target="label_model", chunksize=100000):
+    """
+    Convert a sparse label matrix into the dense int8 array label models train on
+    The array is filled chunk by chunk, so besides the output (one byte per label)
+    only the nonzero labels of one chunk are held at a time.
+
+    matrix - the (candidates x label functions) scipy sparse matrix
+    source - the encoding of the stored labels (abstaining has to be 0)
+    target - the encoding of the array (see LABEL_ENCODINGS)
+    chunksize - the number of rows to fill at a time
+
+    returns an int8 numpy array
+    """
+    labels = np.empty(matrix.shape, dtype=np.int8)
+    for start, chunk in iter_dense_labels(matrix, source, target, chunksize=chunksize):
+        labels[start:start + len(chunk)] = chunk
+    return labels
+
+
+def tsv_to_label_matrix(tsv_file, directory, label_encoding="plusminus", chunksize=100000):
+    """
+    Convert a label matrix tsv (i.e. data/label_matricies/train_sparse_matrix.tsv.xz) into a label matrix store
+    The file is read in chunks, so the matrix is never parsed or held in memory as a whole.
+    Empty cells are abstains and the candidate_id column becomes the candidate id vector.
+
+    tsv_file - the path of the tsv file (the compression is inferred from the extension)
+    directory - the folder that will hold the store
+    label_encoding - the encoding of the labels in the file
+    chunksize - the number of rows to convert at a time
+
+    returns a LabelMatrix object that points to the new store
+    """
+    writer = None
+    for chunk in pd.read_csv(tsv_file, sep="\t", chunksize=chunksize):
+        if writer is None:
+            lf_names = [column for column in chunk.columns if column != "candidate_id"]
+            writer = LabelMatrixWriter(directory, lf_names, label_encoding=label_encoding)
+
+        labels = chunk[lf_names].fillna(0).values
+        row, col = np.nonzero(labels)
+        writer.append(chunk["candidate_id"].values, row, col, labels[row, col])
+
+    if writer is None:
+        raise ValueError("{} has no rows".format(tsv_file))
+    writer.close()
+    return LabelMatrix.load(directory)
+
+
+def label_matrix_to_tsv(label_matrix, tsv_file, chunksize=100000):
+    """
+    Write a label matrix in the tsv layout label_candidates results were saved in
+    (one column per label function, empty cells for abstains and a candidate_id column at the end)
+
+    label_matrix - the LabelMatrix object
+    tsv_file - the path of the tsv file (.xz files are compressed)
+    chunksize - the number of rows to write at a time
+    """
+    opener = lzma.open if str(tsv_file).endswith(".xz") else open
+    with opener(tsv_file, "wt") as out_file:
+        for start in range(0, max(len(label_matrix), 1), chunksize):
+            labels = label_matrix.matrix[start:start + chunksize].toarray()
+            chunk_df = pd.DataFrame(
+                np.where(labels != 0, labels, np.nan), columns=label_matrix.lf_names
+            ).astype("Int8")
+            chunk_df["candidate_id"] = np.asarray(label_matrix.candidate_ids[start:start + chunksize])
+            chunk_df.to_csv(out_file, sep="\t", index=False, header=start == 0)
+
+
+def open_label_matrix(path, mmap_mode='r'):
+    """
+    Open a label matrix from a store or from a tsv file
+    A tsv file is converted into a store next to it (train_sparse_matrix.tsv.xz -> train_sparse_matrix.labels)
+    the first time it is opened and whenever the tsv file changes, later calls only map the store.
+
+    path - a store folder or a label matrix tsv file
+    mmap_mode - the numpy memory map mode (None reads everything into memory)
+
+    returns a LabelMatrix object
+    """
+    path = str(path)
+    if os.path.isdir(path):
+        return LabelMatrix.load(path, mmap_mode=mmap_mode)
+
+    directory = path
+    for extension in (".xz", ".gz", ".tsv"):
+        if directory.endswith(extension):
+            directory = directory[:-len(extension)]
+    directory += ".labels"
+
+    meta_file = os.path.join(directory, "meta.json")
+    if not os.path.exists(meta_file) or os.path.getmtime(meta_file) < os.path.getmtime(path):
+        tsv_to_label_matrix(path, directory)
+    return LabelMatrix.load(directory, mmap_mode=mmap_mode)
@@ -78,6 +78,7 @@ from utils.notebook_utils.label_matrix_helper import (
     get_conflict_matrix, 
     label_candidates
 )
+from utils.notebook_utils.label_matrix_store import remap_sparse_labels
 from utils.notebook_utils.train_model_helper import train_generative_model
 from utils.notebook_utils.plot_helper import (
     plot_label_matrix_heatmap, 
@@ -202,9 +203,9 @@ regularization_grid = pd.np.round(pd.np.linspace(0.1, 6, num=25), 3)
 # In[37]:
 
 
-L = convert_labels(label_matricies['train'].toarray(), 'plusminus', 'categorical')
-L_dev = convert_labels(label_matricies['dev'].toarray(), 'plusminus', 'categorical')
-L_test = convert_labels(label_matricies['test'].toarray(), 'plusminus', 'categorical')
+L = remap_sparse_labels(label_matricies['train'], 'plusminus', 'categorical')
+L_dev = remap_sparse_labels(label_matricies['dev'], 'plusminus', 'categorical')
+L_test = remap_sparse_labels(label_matricies['test'], 'plusminus', 'categorical')
 
 validation_data = list(
     zip(
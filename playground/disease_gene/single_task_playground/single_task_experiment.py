@@ -63,7 +63,7 @@ from metal.utils import plusminus_to_categorical
 from gensim.models import FastText
 from gensim.models import KeyedVectors
 
-from utils.notebook_utils.label_matrix_helper import label_candidates, get_auc_significant_stats
+from utils.notebook_utils.label_matrix_helper import label_candidates, label_candidates_columnar, get_auc_significant_stats
 from utils.notebook_utils.dataframe_helper import load_candidate_dataframes
 from utils.notebook_utils.plot_helper import plot_curve, plot_label_matrix_heatmap
 
@@ -174,15 +174,14 @@ if not quick_load:
 
 
 if not quick_load:
+    # The columnar label functions label each batch of candidates at once
+    # (check_columnar_lfs.py in data/label_functions checks they match the per candidate ones)
     label_matricies.update({
-        key:label_candidates(
+        key:label_candidates_columnar(
             session, 
             candidate_dfs[key]['candidate_id'].values.tolist(),
-            lfs, 
-            lf_names,
-            num_threads=10,
-            batch_size=50000,
-            multitask=False
+            DG_LFS["DaG"],
+            batch_size=50000
         )
         for key in candidate_dfs
     })
@@ -2,7 +2,6 @@ from collections import defaultdict
 import csv
 import os
 from itertools import product
-import shelve
 from string import punctuation
 import sys
 
@@ -10,6 +9,10 @@ import lxml.etree as et
 from snorkel.parser import DocPreprocessor
 from snorkel.models import Document
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'modules'))
+from utils.bigdata_utils import TagIndex
+from utils.ingestion_pipeline import IngestionPipeline, parse_worker
+
 
 def offsets_to_token(left, right, offset_array, lemmas, punc=set(punctuation)):
     """Calculate the offset from tag to token
@@ -44,14 +47,18 @@ class Tagger(object):
     i.e if it sees GAD then this tagger will give GAD a Gene tag.
     """
 
-    def __init__(self, file_name):
+    def __init__(self, tag_store):
         """ Initialize the tagger class
 
         Keyword arguments:
         self -- the class object
-        file_name -- the name of the file that contains the document annotations
+        tag_store -- the folder of a TagIndex store (i.e. TagIndex.from_shelve(...).save(tag_store))
+            or an already opened TagIndex
         """
-        self.annt_dict = shelve.open(file_name)
+        if isinstance(tag_store, TagIndex):
+            self.annt_index = tag_store
+        else:
+            self.annt_index = TagIndex.load(tag_store)
 
     def tag(self, parts):
         """Tag each Sentence
@@ -68,17 +75,19 @@ class Tagger(object):
 
         # For each tag in the given document
         # assign it to the correct word and move on
-        if pubmed_id not in self.annt_dict:
+        tags = self.annt_index.lookup(pubmed_id, sent_start, sent_end)
+        if len(tags) == 0:
             return parts
 
-        for tag in self.annt_dict[pubmed_id]:
-            if not (sent_start <= int(tag['Offset']) <= sent_end):
-                continue
-            offsets = [offset + sent_start for offset in parts['char_offsets']]
-            toks = offsets_to_token(int(tag['Offset']), int(tag['End']), offsets, parts['lemmas'])
+        offsets = [offset + sent_start for offset in parts['char_offsets']]
+        for tag in tags:
+            toks = offsets_to_token(
+                int(self.annt_index.starts[tag]), int(self.annt_index.ends[tag]),
+                offsets, parts['lemmas']
+            )
             for tok in toks:
-                parts['entity_types'][tok] = tag['Type']
-                parts['entity_cids'][tok] = tag['ID']
+                parts['entity_types'][tok] = self.annt_index.types[self.annt_index.type_codes[tag]]
+                parts['entity_cids'][tok] = self.annt_index.cids[self.annt_index.cid_codes[tag]]
         return parts
 
 
@@ -15,6 +15,8 @@ import random
 
 from epilepsy_utils import XMLMultiDocPreprocessor
 from epilepsy_utils import Tagger
+from epilepsy_utils import TagIndex
+from epilepsy_utils import IngestionPipeline, parse_worker
 import pandas as pd
 from snorkel import SnorkelSession
 from snorkel.candidates import PretaggedCandidateExtractor
@@ -50,9 +52,19 @@ xml_parser = XMLMultiDocPreprocessor(
 # In[ ]:
 
 working_path = os.environ['WORKINGPATH']
-dg_tagger = Tagger(working_path + "/Database/epilepsy_tags_shelve")
+tag_store = working_path + "/Database/epilepsy_tags_store"
+
+# Convert the shelve into a memory mapped tag store once
+if not os.path.exists(tag_store):
+    TagIndex.from_shelve(working_path + "/Database/epilepsy_tags_shelve").save(tag_store)
+
+dg_tagger = Tagger(tag_store)
 corpus_parser = CorpusParser(fn=dg_tagger.tag)
-get_ipython().magic(u'time corpus_parser.apply(list(xml_parser))')
+
+# Stream the documents instead of loading the whole corpus into a list
+# sqlite only takes one writer so parse in a single worker
+pipeline = IngestionPipeline(parse_worker(corpus_parser), num_workers=1)
+get_ipython().magic(u'time pipeline.run(xml_parser.generate())')
 
 
 # In[ ]: